@@ -0,0 +1,10 @@
+"""
+Benchmarks of KExtor, run from the root of the repository:
+
+    python -m benchmarks.corpus      generate a synthetic corpus
+    python -m benchmarks.stages      time every stage of the pipeline
+    python -m benchmarks.compare     compare results with a baseline
+    python -m benchmarks.automaton   build and match the automaton
+    python -m benchmarks.tokenizers  compare the tokenizers on a corpus
+    python -m benchmarks.executors   compare processes, threads and serial
+"""
@@ -0,0 +1,185 @@
+"""
+Benchmark of the Aho-Corasick automaton: build time and memory
+(the original construction, which added the patterns one by one and
+copied the outputs along the fail links, vs the bulk construction
+with output links), compilation, saving and loading of the flat
+automaton and matching throughput.
+
+    python -m benchmarks.automaton --sizes 10000 100000 1000000
+"""
+
+import argparse
+import gc
+import os
+import random
+import string
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+
+from src.ahoc_automaton import FlatAutomaton, State
+
+
+def generate_patterns(n, seed=0):
+    """
+    generate n distinct two word patterns
+    (like the candidates of the extractor)
+    """
+    rng = random.Random(seed)
+    n_words = max(100, int(n ** 0.5) * 4)
+    words = list({
+        "".join(rng.choice(string.ascii_lowercase)
+                for _ in range(rng.randint(3, 10)))
+        for _ in range(n_words)
+    })
+
+    patterns = set()
+    while len(patterns) < n:
+        patterns.add(f"{rng.choice(words)} {rng.choice(words)}")
+
+    return sorted(patterns), words
+
+
+def generate_text(words, n_words, seed=1):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(words) for _ in range(n_words))
+
+
+def measure(function, memory=False):
+    """
+    returns the result of function, the elapsed time and
+    (if memory is True) the peak of allocated memory in MB
+    """
+    # like timeit, the garbage collector is disabled while measuring
+    gc.collect()
+    gc.disable()
+    if memory:
+        tracemalloc.start()
+
+    start = time.perf_counter()
+    try:
+        result = function()
+    finally:
+        elapsed = time.perf_counter() - start
+        gc.enable()
+
+    peak = None
+    if memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        peak = peak / 2**20
+
+    return result, elapsed, peak
+
+
+def copy_outputs(automaton):
+    """
+    fail connections of the original construction: every state gets
+    a copy of its output and of the output of its fail state
+    """
+    root = automaton
+    automaton.fail = root
+    queue = deque()
+
+    for node in automaton.children.values():
+        queue.append(node)
+        node.fail = root
+
+    while queue:
+        r = queue.popleft()
+
+        for child in r.children.values():
+            queue.append(child)
+            state = r.fail
+
+            while (state.find_next_state(child.symbol) is None
+                   and state.root is False):
+                state = state.fail
+
+            child.fail = state.find_next_state(child.symbol)
+            if child.fail is None:
+                child.fail = root
+
+            child.output = child.output + child.fail.output
+
+
+def incremental(patterns):
+    """
+    the original construction (the baseline of the bulk construction)
+    """
+    automaton = State()
+    for pattern in patterns:
+        automaton.add_pattern(pattern)
+    copy_outputs(automaton)
+    return automaton
+
+
+def run(size, memory, text_words):
+    patterns, words = generate_patterns(size)
+    shuffled = patterns[:]
+    random.Random(2).shuffle(shuffled)
+    text = generate_text(words, text_words)
+
+    results = dict()
+
+    _, results["incremental build [s]"], peak = measure(
+        lambda: incremental(shuffled), memory
+    )
+    results["incremental peak [MB]"] = peak
+
+    automaton, results["bulk build [s]"], peak = measure(
+        lambda: State.create_automaton(shuffled), memory
+    )
+    results["bulk peak [MB]"] = peak
+
+    flat, results["compile [s]"], _ = measure(automaton.compile)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "automaton.npz")
+        _, results["save [s]"], _ = measure(lambda: flat.save(path))
+        results["file size [MB]"] = os.path.getsize(path) / 2**20
+        loaded, results["load [s]"], _ = measure(
+            lambda: FlatAutomaton.load(path)
+        )
+
+    _, results["flat goto [s]"], _ = measure(loaded.build_goto)
+
+    _, elapsed, _ = measure(lambda: automaton.find_match(text, True))
+    results["State match [MB/s]"] = len(text) / elapsed / 2**20
+
+    _, elapsed, _ = measure(lambda: loaded.find_match(text, True))
+    results["Flat match [MB/s]"] = len(text) / elapsed / 2**20
+
+    if automaton.counts != loaded.counts:
+        raise RuntimeError("State and FlatAutomaton counts differ")
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--sizes", metavar="N", nargs="+", type=int,
+        default=[10000, 100000, 1000000],
+        help="Number of patterns (Default: %(default)s)"
+    )
+    parser.add_argument(
+        "--text-words", metavar="N", type=int, default=200000,
+        help="Number of words of the matched text (Default: %(default)s)"
+    )
+    parser.add_argument(
+        "--memory", action="store_true",
+        help="Measure peak memory with tracemalloc (slower)"
+    )
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        print(f"\n{size} patterns")
+        for name, value in run(size, args.memory, args.text_words).items():
+            if value is not None:
+                print(f"  {name:<24}{value:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
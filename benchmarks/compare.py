@@ -0,0 +1,69 @@
+"""
+Compare the results of benchmarks.stages with a baseline: every
+stage which is slower than the baseline by more than the threshold
+is reported as a regression (and the exit status is 1).
+
+    python -m benchmarks.compare baseline.json current.json --threshold 0.1
+"""
+
+import argparse
+import json
+import sys
+
+
+def load_results(path):
+    with open(path, "r", encoding="utf-8") as infile:
+        return json.load(infile)["results"]
+
+
+def compare(baseline, current, threshold):
+    """
+    returns a list of tuples (stage, baseline, current, ratio,
+    regression) for the stages in both results (times in seconds)
+    """
+    rows = list()
+    for stage, before in baseline.items():
+        if stage not in current:
+            continue
+        after = current[stage]
+        ratio = after / before if before > 0 else float("inf")
+        rows.append((stage, before, after, ratio, ratio > 1 + threshold))
+
+    return rows
+
+
+def print_comparison(rows):
+    print(f"{'stage':<28}{'baseline [s]':>14}{'current [s]':>14}"
+          f"{'ratio':>8}")
+    for stage, before, after, ratio, regression in rows:
+        flag = "  REGRESSION" if regression else ""
+        print(f"{stage:<28}{before:>14.4f}{after:>14.4f}{ratio:>8.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "baseline", metavar="BASELINE", help="JSON results of the baseline"
+    )
+    parser.add_argument(
+        "current", metavar="CURRENT", help="JSON results to compare"
+    )
+    parser.add_argument(
+        "--threshold", metavar="X", type=float, default=0.1,
+        help="Relative slowdown reported as regression "
+        "(Default: %(default)s)"
+    )
+    args = parser.parse_args()
+
+    rows = compare(
+        load_results(args.baseline), load_results(args.current),
+        args.threshold
+    )
+    print_comparison(rows)
+
+    if any(regression for *_, regression in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Deterministic synthetic corpus: documents of paragraphs (one per
+line) whose words are drawn from a Zipf distribution over a
+generated vocabulary, mixed with english function words so that
+the tagger finds noun phrases. The same arguments always generate
+the same corpus.
+
+    python -m benchmarks.corpus DIR --documents 100 --zipf 1.1
+"""
+
+import argparse
+import os
+import random
+import string
+
+import numpy as np
+
+
+FUNCTION_WORDS = [
+    "the", "a", "of", "and", "in", "to", "is", "was", "for", "on",
+    "with", "by", "that", "from", "at", "as", "are", "this"
+]
+
+
+def generate_vocabulary(size, seed=0):
+    """
+    generate size distinct lowercase words
+    """
+    rng = random.Random(seed)
+    vocabulary = set()
+    while len(vocabulary) < size:
+        vocabulary.add("".join(
+            rng.choice(string.ascii_lowercase)
+            for _ in range(rng.randint(3, 10))
+        ))
+
+    return sorted(vocabulary)
+
+
+def zipf_probabilities(size, skew):
+    """
+    probability of each rank of a (finite) Zipf distribution
+    """
+    weights = 1 / np.arange(1, size + 1) ** skew
+    return weights / weights.sum()
+
+
+class CorpusGenerator:
+
+    def __init__(
+            self, vocabulary=5000, zipf=1.1, paragraphs=(3, 8),
+            sentences=(1, 4), words=(6, 20), function_words=0.3,
+            seed=0, vocabulary_seed=0, shuffle_seed=None):
+        self.vocabulary = generate_vocabulary(vocabulary, vocabulary_seed)
+        # a different order gives the same words different frequencies
+        # (e.g. for a reference corpus)
+        if shuffle_seed is not None:
+            random.Random(shuffle_seed).shuffle(self.vocabulary)
+        self.probabilities = zipf_probabilities(vocabulary, zipf)
+        self.paragraphs = paragraphs
+        self.sentences = sentences
+        self.words = words
+        self.function_words = function_words
+        self.rng = np.random.default_rng(seed)
+
+    def sentence(self):
+        n_words = self.rng.integers(self.words[0], self.words[1] + 1)
+        ranks = self.rng.choice(
+            len(self.vocabulary), size=n_words, p=self.probabilities
+        )
+        function = self.rng.random(n_words) < self.function_words
+
+        words = [
+            FUNCTION_WORDS[rank % len(FUNCTION_WORDS)] if is_function
+            else self.vocabulary[rank]
+            for rank, is_function in zip(ranks, function)
+        ]
+        words[0] = words[0].capitalize()
+
+        return " ".join(words) + "."
+
+    def paragraph(self):
+        n_sentences = self.rng.integers(
+            self.sentences[0], self.sentences[1] + 1
+        )
+        return " ".join(self.sentence() for _ in range(n_sentences))
+
+    def document(self):
+        n_paragraphs = self.rng.integers(
+            self.paragraphs[0], self.paragraphs[1] + 1
+        )
+        return "\n".join(self.paragraph() for _ in range(n_paragraphs))
+
+    def write(self, directory, n_documents):
+        """
+        write n_documents text files in directory and
+        return their paths
+        """
+        os.makedirs(directory, exist_ok=True)
+        paths = list()
+        for i in range(n_documents):
+            path = os.path.join(directory, f"doc{i:06d}.txt")
+            with open(path, "w", encoding="utf-8") as ofile:
+                ofile.write(self.document() + "\n")
+            paths.append(path)
+
+        return paths
+
+
+def add_generator_arguments(parser):
+    parser.add_argument(
+        "--documents", metavar="N", type=int, default=100,
+        help="Number of documents (Default: %(default)s)"
+    )
+    parser.add_argument(
+        "--vocabulary", metavar="N", type=int, default=5000,
+        help="Number of distinct words (Default: %(default)s)"
+    )
+    parser.add_argument(
+        "--zipf", metavar="S", type=float, default=1.1,
+        help="Skew of the word distribution (Default: %(default)s)"
+    )
+    parser.add_argument(
+        "--paragraphs", metavar="N", type=int, nargs=2, default=[3, 8],
+        help="Min and max paragraphs per document (Default: %(default)s)"
+    )
+    parser.add_argument(
+        "--sentences", metavar="N", type=int, nargs=2, default=[1, 4],
+        help="Min and max sentences per paragraph (Default: %(default)s)"
+    )
+    parser.add_argument(
+        "--seed", metavar="N", type=int, default=0,
+        help="Seed of the generator (Default: %(default)s)"
+    )
+
+
+def generator_from_arguments(args, seed=None, shuffle_seed=None):
+    return CorpusGenerator(
+        vocabulary=args.vocabulary,
+        zipf=args.zipf,
+        paragraphs=tuple(args.paragraphs),
+        sentences=tuple(args.sentences),
+        seed=args.seed if seed is None else seed,
+        shuffle_seed=shuffle_seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "directory", metavar="DIR", help="Output directory"
+    )
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+
+    paths = generator_from_arguments(args).write(
+        args.directory, args.documents
+    )
+    print(f"{len(paths)} documents written in {args.directory}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Comparison of the executors (process, thread and serial) on the same
+synthetic corpus: time of the extraction and of the reference
+counting with each executor (best of --repeat runs). All executors
+must find the same candidates and counts. Threads only run in
+parallel on free-threaded Python builds. The matching speed of the
+automaton of the serial and thread executors (State) is compared
+with the one of the worker processes (a FlatAutomaton loaded from
+a file, its transitions are created during the first match).
+
+    python -m benchmarks.executors --documents 400
+"""
+
+import argparse
+import contextlib
+import io
+import multiprocessing as mp
+import os
+import sys
+import tempfile
+
+from benchmarks.corpus import add_generator_arguments, generator_from_arguments
+from benchmarks.stages import best, read_lines
+from src.ahoc_automaton import FlatAutomaton, State
+from src.executors import EXECUTORS, count_matches
+from src.extractor import Extractor
+
+
+def gil_enabled():
+    """
+    returns False on free-threaded Python builds with the GIL disabled
+    """
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is None or is_gil_enabled()
+
+
+def matching(candidates, lines, repeat):
+    """
+    matching speed (MB/s) of the State and of the FlatAutomaton
+    of the candidates in the given lines
+    """
+    automaton = State.create_automaton(candidates)
+    n_bytes = sum(len(line) for line in lines)
+
+    state_counts, state = best(
+        lambda: automaton.count_matches(lines, True), repeat
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "automaton.npz")
+        automaton.compile().save(path)
+        flat_counts, flat = best(
+            lambda: FlatAutomaton.load(path).count_matches(lines, True),
+            repeat
+        )
+
+    return {
+        "State [MB/s]": n_bytes / state / 2**20,
+        "FlatAutomaton [MB/s]": n_bytes / flat / 2**20,
+        "same counts": state_counts == flat_counts,
+    }
+
+
+def run(args, directory):
+    domain = generator_from_arguments(args).write(
+        os.path.join(directory, "domain"), args.documents
+    )
+    reference = read_lines(
+        generator_from_arguments(
+            args, seed=args.seed + 1, shuffle_seed=args.seed
+        ).write(os.path.join(directory, "reference"), args.documents)
+    )
+
+    results = dict()
+    outputs = dict()
+    for executor in EXECUTORS:
+        extractor = Extractor(
+            2, 70, 5, 20, False, False, executor=executor
+        )
+        candidates, extraction = best(
+            lambda: extractor.multi(domain, args.min_freq)[0], args.repeat
+        )
+
+        def count():
+            matcher = State.create_automaton(candidates.keys())
+            return count_matches(matcher, reference, executor)
+
+        counts, counting = best(count, args.repeat)
+
+        results[executor] = {
+            "extraction [s]": extraction,
+            "counting [s]": counting,
+        }
+        outputs[executor] = (set(candidates.keys()), counts)
+
+    serial = outputs["serial"]
+    for executor, output in outputs.items():
+        results[executor]["same results"] = output == serial
+
+    results["matching"] = matching(
+        outputs["serial"][0], reference, args.repeat
+    )
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    add_generator_arguments(parser)
+    parser.add_argument(
+        "--min_freq", metavar="N", type=int, default=5,
+        help="Minimum absolute frequence of a candidate "
+        "(Default: %(default)s)"
+    )
+    parser.add_argument(
+        "--repeat", metavar="N", type=int, default=3,
+        help="Runs of each executor, the best time is kept "
+        "(Default: %(default)s)"
+    )
+    args = parser.parse_args()
+
+    # progress bars of the pipeline are not shown
+    with tempfile.TemporaryDirectory() as tmpdir, \
+            contextlib.redirect_stdout(io.StringIO()):
+        results = run(args, tmpdir)
+
+    print(f"{os.cpu_count()} cpus, GIL "
+          f"{'enabled' if gil_enabled() else 'disabled'}")
+    for executor, values in results.items():
+        print(f"\n{executor}")
+        for label, value in values.items():
+            if isinstance(value, bool):
+                print(f"  {label:<24}{str(value):>10}")
+            else:
+                print(f"  {label:<24}{value:>10.4f}")
+
+
+if __name__ == "__main__":
+    mp.set_start_method("spawn")
+    main()
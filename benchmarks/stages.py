@@ -0,0 +1,266 @@
+"""
+Benchmark of every stage of the pipeline on a synthetic corpus
+(see benchmarks.corpus): paragraph selection, tagging, candidate
+extraction and filtering, automaton build and matching, scoring,
+and end-to-end runs with a single process and multiprocessing.
+The times (best of --repeat runs) can be saved as a JSON baseline
+and compared with a previous one.
+
+    python -m benchmarks.stages --save baseline.json
+    python -m benchmarks.stages --baseline baseline.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import os
+import platform
+import sys
+import tempfile
+
+import nltk
+
+from benchmarks.automaton import measure
+from benchmarks.compare import compare, print_comparison
+from benchmarks.corpus import add_generator_arguments, generator_from_arguments
+from src.ahoc_automaton import State
+from src.discriminator import Discriminator
+from src.extractor import Extractor
+
+
+def best(function, repeat):
+    """
+    returns the result of function and the best elapsed time
+    of repeat runs
+    """
+    times = list()
+    for _ in range(repeat):
+        result, elapsed, _ = measure(function)
+        times.append(elapsed)
+
+    return result, min(times)
+
+
+def read_lines(paths):
+    lines = list()
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as infile:
+            lines.extend(line.strip() for line in infile if line.strip())
+    return lines
+
+
+def extraction_stages(extractor, paragraphs, repeat):
+    """
+    time the stages of Extractor.extract_document separately,
+    the output of each stage is the input of the next one
+    """
+    results = dict()
+
+    def keep_paragraphs():
+        kept = (extractor.keep_paragraph(p) for p in paragraphs)
+        return [sentences for sentences in kept if sentences]
+    kept, results["keep_paragraph"] = best(keep_paragraphs, repeat)
+
+    def preprocess():
+        return [extractor.preprocess(sentences) for sentences in kept]
+    tagged, results["preprocess"] = best(preprocess, repeat)
+
+    def extract_words():
+        return [list(extractor.extract_words(t)) for t in tagged]
+    _, results["extract_words"] = best(extract_words, repeat)
+
+    # noun phrases given to keep_candidate by extract_words
+    parser = nltk.RegexpParser(extractor.grammar)
+    trees = [
+        tree
+        for paragraph in tagged
+        for sentence in paragraph
+        for tree in parser.parse(sentence).subtrees(
+            filter=lambda x: x.label() == "NP"
+        )
+    ]
+
+    def keep_candidates():
+        return [extractor.keep_candidate(tree) for tree in trees]
+    _, results["keep_candidate"] = best(keep_candidates, repeat)
+
+    return results
+
+
+def scoring_stages(candidates, reference, min_freq, alpha, theta, repeat):
+    """
+    time the automaton and the discriminator on the
+    candidates of the domain corpus
+    """
+    results = dict()
+
+    patterns = list(candidates)
+    automaton, results["automaton build"] = best(
+        lambda: State.create_automaton(patterns), repeat
+    )
+
+    def find_match():
+        automaton.reset()
+        for line in reference:
+            automaton.find_match(line, True)
+        return automaton.counts
+    counts, results["find_match"] = best(find_match, repeat)
+
+    def discriminator():
+        return Discriminator(
+            candidates, min_freq, reference_frequency=counts
+        )
+
+    def calculate_dr_dc():
+        d = discriminator()
+        d.calculate_dr_dc()
+        return d
+    _, results["calculate_dr_dc"] = best(calculate_dr_dc, repeat)
+
+    def calculate_dr_dc_pruned():
+        d = discriminator()
+        d.calculate_dr_dc(alpha, theta)
+        return d
+    _, results["calculate_dr_dc pruned"] = best(
+        calculate_dr_dc_pruned, repeat
+    )
+
+    scored = calculate_dr_dc()
+
+    def generate_list():
+        scored.final_candidates = set()
+        scored.rejected_candidates = set()
+        scored.generate_list(alpha, theta)
+    _, results["generate_list"] = best(generate_list, repeat)
+
+    return results
+
+
+def end_to_end(extractor, files, reference, min_freq, alpha, theta, multi):
+    """
+    extraction (single process or multiprocessing), reference
+    counting and scoring
+    """
+    if multi:
+        candidates, _ = extractor.multi(files, min_freq)
+    else:
+        candidates, _ = extractor.single(files)
+
+    discriminator = Discriminator(candidates, min_freq)
+    for line in reference:
+        discriminator.find_reference_frequence(line)
+    discriminator.calculate_dr_dc()
+    discriminator.generate_list(alpha, theta)
+
+    return discriminator
+
+
+def run(args, directory):
+    domain = generator_from_arguments(args).write(
+        os.path.join(directory, "domain"), args.documents
+    )
+    reference = read_lines(
+        generator_from_arguments(
+            args, seed=args.seed + 1, shuffle_seed=args.seed
+        ).write(os.path.join(directory, "reference"), args.documents)
+    )
+
+    extractor = Extractor(2, 70, 5, 20, False, False)
+    results = dict()
+
+    results.update(
+        extraction_stages(extractor, read_lines(domain), args.repeat)
+    )
+    candidates, _ = extractor.single(domain)
+    results.update(scoring_stages(
+        candidates, reference, args.min_freq, args.alpha, args.theta,
+        args.repeat
+    ))
+
+    for mode, multi in (("single", False), ("multi", True)):
+        _, results[f"end-to-end {mode}"] = best(
+            lambda: end_to_end(
+                extractor, domain, reference, args.min_freq,
+                args.alpha, args.theta, multi
+            ),
+            args.repeat
+        )
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    add_generator_arguments(parser)
+    parser.add_argument(
+        "--min_freq", metavar="N", type=int, default=5,
+        help="Minimum absolute frequence of a candidate "
+        "(Default: %(default)s)"
+    )
+    parser.add_argument(
+        "--alpha", metavar="N", type=float, default=0.99,
+        help="Alpha value for the discriminator (Default: %(default)s)"
+    )
+    parser.add_argument(
+        "--theta", metavar="N", type=float, default=0.6,
+        help="Theta value for the discriminator (Default: %(default)s)"
+    )
+    parser.add_argument(
+        "--repeat", metavar="N", type=int, default=3,
+        help="Runs of each stage, the best time is kept "
+        "(Default: %(default)s)"
+    )
+    parser.add_argument(
+        "--save", metavar="FILE",
+        help="Save the results as JSON (e.g. a new baseline)"
+    )
+    parser.add_argument(
+        "--baseline", metavar="FILE",
+        help="Compare the results with a JSON baseline"
+    )
+    parser.add_argument(
+        "--threshold", metavar="X", type=float, default=0.1,
+        help="Relative slowdown reported as regression "
+        "(Default: %(default)s)"
+    )
+    args = parser.parse_args()
+
+    # progress bars of the pipeline are not shown
+    with tempfile.TemporaryDirectory() as tmpdir, \
+            contextlib.redirect_stdout(io.StringIO()):
+        results = run(args, tmpdir)
+
+    parameters = {
+        name: value for name, value in vars(args).items()
+        if name not in {"save", "baseline", "threshold"}
+    }
+    output = {
+        "parameters": parameters,
+        "machine": {
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+        },
+        "results": results,
+    }
+
+    if args.save is not None:
+        with open(args.save, "w", encoding="utf-8") as ofile:
+            json.dump(output, ofile, indent=2)
+
+    if args.baseline is not None:
+        with open(args.baseline, "r", encoding="utf-8") as infile:
+            baseline = json.load(infile)["results"]
+        rows = compare(baseline, results, args.threshold)
+        print_comparison(rows)
+        if any(regression for *_, regression in rows):
+            sys.exit(1)
+    else:
+        for stage, elapsed in results.items():
+            print(f"  {stage:<24}{elapsed:>10.4f} s")
+
+
+if __name__ == "__main__":
+    mp.set_start_method("spawn")
+    main()
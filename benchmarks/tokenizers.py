@@ -0,0 +1,116 @@
+"""
+Evaluation of the tokenizers on a domain corpus: throughput of the
+extraction with each tokenizer and overlap of its candidates with
+the candidates of the NLTK tokenizer (all candidates and the ones
+reaching min_freq), to choose the tokenizer of a domain.
+
+    python -m benchmarks.tokenizers DOMAIN --min_freq 25
+"""
+
+import argparse
+import contextlib
+import io
+import tempfile
+
+from benchmarks.automaton import measure
+from benchmarks.corpus import add_generator_arguments, generator_from_arguments
+from src.extractor import Extractor
+from src.tokenizers import TOKENIZERS
+from src.utils import retrieve_files
+
+
+def overlap(reference, candidates):
+    """
+    jaccard index, precision and recall of a set of
+    candidates with respect to the reference set
+    """
+    shared = len(reference & candidates)
+    union = len(reference | candidates)
+    jaccard = shared / union if union else 1.0
+    precision = shared / len(candidates) if candidates else 1.0
+    recall = shared / len(reference) if reference else 1.0
+
+    return jaccard, precision, recall
+
+
+def evaluate(files, n_bytes, min_freq):
+    """
+    extract the candidates of files with every tokenizer,
+    returns a dictionary name -> results
+    """
+    candidates = dict()
+    results = dict()
+
+    for name, tokenizer in TOKENIZERS.items():
+        extractor = Extractor(2, 70, 5, 20, False, False, None, tokenizer())
+        (final, _), elapsed, _ = measure(lambda: extractor.single(files))
+
+        candidates[name] = (
+            set(final),
+            {c for c, frequency in final.items() if sum(frequency) >= min_freq}
+        )
+        results[name] = {
+            "time [s]": elapsed,
+            "throughput [MB/s]": n_bytes / elapsed / 2**20,
+            "candidates": len(final),
+        }
+
+    nltk_all, nltk_frequent = candidates["nltk"]
+    for name, (all_candidates, frequent) in candidates.items():
+        for label, reference, found in (
+                ("all", nltk_all, all_candidates),
+                ("frequent", nltk_frequent, frequent)):
+            jaccard, precision, recall = overlap(reference, found)
+            results[name][f"jaccard {label}"] = jaccard
+            results[name][f"precision {label}"] = precision
+            results[name][f"recall {label}"] = recall
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "domain", metavar="DOMAIN", nargs="?",
+        help="Path to the domain corpus (Default: a synthetic corpus)"
+    )
+    parser.add_argument(
+        "--recursive", action="store_true",
+        help="Collect files in subdirectories of the domain corpus"
+    )
+    parser.add_argument(
+        "--min_freq", metavar="N", type=int, default=25,
+        help="Minimum absolute frequence of a candidate "
+        "(Default: %(default)s)"
+    )
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        domain = args.domain
+        if domain is None:
+            domain = tmpdir
+            generator_from_arguments(args).write(tmpdir, args.documents)
+
+        sized_files = retrieve_files(
+            domain, recursive=args.recursive, with_sizes=True
+        )
+        files = [path for path, _ in sized_files]
+        n_bytes = sum(size for _, size in sized_files)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = evaluate(files, n_bytes, args.min_freq)
+
+    print(f"{len(files)} files, {n_bytes / 2**20:.2f} MB, "
+          f"overlap with the nltk tokenizer")
+    for name, values in results.items():
+        print(f"\n{name}")
+        for label, value in values.items():
+            if isinstance(value, int):
+                print(f"  {label:<24}{value:>10}")
+            else:
+                print(f"  {label:<24}{value:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
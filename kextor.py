@@ -1,157 +1,801 @@
 import multiprocessing as mp
 import os
+import sys
+import time
 from pathlib import Path
 
 from nltk.corpus import reuters
 
 from src.cli import parse_arguments
-from src.extractor import Extractor
-from src.discriminator import Discriminator
+from src.corpus import (
+    READ_ERRORS, is_archive, load_documents, read_documents, unit_weight,
+    work_units
+)
+from src.extractor import Extractor, warm_up
+from src.discriminator import Discriminator, count_reference_union
+from src.executors import WorkerPool, count_matches, n_workers
+from src.mapreduce import load_counts, save_counts, select_shard
+from src.planner import plan_extraction
+from src.prefetch import Prefetcher, ReadTimes
+from src.reference_index import (
+    INDEXES, IndexTooLarge, read_source, save_source
+)
+from src.stream import StreamingDiscriminator
+from src.tagged_store import TaggedStore
+from src.tokenizers import TOKENIZERS
+from src.vocabulary import Postings
+from src.writers import WRITERS, rank
 import src.utils as ut
 
 
+# keywords reported by the preview (without --top-k)
+PREVIEW_KEYWORDS = 25
+# the preview samples ranges of at most 1 MB of the files which are split,
+# so that a single big file is not sampled in a few contiguous blocks
+SAMPLE_CHUNK = 2**20
+
+
 def main():
     # collect arguments
     args = parse_arguments()
-    path = args.domain
-    min_sen = args.min_sen
-    max_cap = args.max_cap
-    min_tok = args.min_tok
-    max_tok = args.max_tok
+
+    if args.command == "map":
+        return map_shard(args)
+    if args.command == "count":
+        return count_shard(args)
+    if args.command == "reduce":
+        return reduce_partials(args)
+    if args.command == "batch":
+        return batch(args)
+    if args.command == "stream":
+        return stream(args)
+
     min_freq = args.min_freq
-    not_paragraph = args.not_paragraphed
     reference = args.reference
-    alpha = args.alpha
-    theta = args.theta
-    validation = args.validation
-    verbose = args.verbose
-    single = args.single
 
-    if not os.path.isdir(path):
-        print("invalid PATH")
+    skipped = list()
+    files, sizes = collect_files(args, errors=skipped)
+    if not files:
         return False
 
-    errors = []
-    # collect files
-    files = ut.retrieve_files(path)
+    if args.sample is not None:
+        return preview(args, files, sizes, skipped)
+
+    # the same workers extract, count and score
+    with WorkerPool(args.executor, warm_up) as workers:
+        # EXTRACT CANDIDATES
+        candidates, errors = extract(
+            args, files, min_freq, sizes, workers, plan_run=True
+        )
+        errors = skipped + errors
+
+        # DISCRIMINATE CANDIDATES
+        if args.reference_index is not None:
+            discriminator = Discriminator(
+                candidates, min_freq,
+                reference_index=load_reference_index(args, errors)
+            )
+        else:
+            discriminator = Discriminator(candidates, min_freq)
+
+            # read reference corpus, default reuters
+            count_reference(
+                discriminator, reference_files(reference, errors),
+                reference, errors, args.prefetch, workers
+            )
+
+        score(args, discriminator, workers)
+    print_workers(workers)
+
+    save_output(args, discriminator, errors)
+
+
+def collect_files(args, path=None, errors=None):
+    """
+    collect the files of the domain corpus and their sizes,
+    directories which can not be read are added to errors
+    """
+    if path is None:
+        path = args.domain
+
+    if not os.path.exists(path):
+        print("invalid PATH")
+        return None, None
+
+    # a manifest is only reused for the same corpus and filters
+    settings = corpus_settings(args, path)
+
+    # collect files (a single file can be an archive)
+    sized_files = None
+    if args.manifest is not None and os.path.isfile(args.manifest):
+        sized_files = ut.read_manifest(args.manifest, settings)
+        if sized_files is None:
+            print("The manifest was written for another corpus "
+                  "or other filters, collecting the files again")
+
+    if sized_files is None:
+        skipped = list()
+        sized_files = ut.retrieve_files(
+            path,
+            recursive=args.recursive,
+            include=args.include,
+            exclude=args.exclude,
+            with_sizes=True,
+            errors=skipped
+        )
+        if errors is not None:
+            errors += skipped
+        # without the skipped directories the manifest would be stale
+        if args.manifest is not None and not skipped:
+            ut.write_manifest(args.manifest, sized_files, settings)
+
+    sizes = dict(sized_files)
+    files = [filepath for filepath, _ in sized_files]
 
     if len(files) == 0:
         print("Empty directory")
-        return False
+        return None, None
+
+    return files, sizes
 
-    # EXTRACT CANDIDATES
-    extractor = Extractor(
-        min_sen,
-        max_cap,
-        min_tok,
-        max_tok,
-        not_paragraph,
-        validation
+
+def corpus_settings(args, path):
+    """
+    returns the root and the filters of a domain corpus
+    """
+    return {
+        "root": os.path.abspath(path),
+        "recursive": args.recursive,
+        "include": args.include,
+        "exclude": args.exclude,
+    }
+
+
+def create_extractor(args, memory_limit=None, executor="process"):
+    return Extractor(
+        args.min_sen,
+        args.max_cap,
+        args.min_tok,
+        args.max_tok,
+        args.not_paragraphed,
+        args.validation,
+        memory_limit,
+        TOKENIZERS[args.tokenizer](),
+        args.prefetch,
+        executor
     )
 
-    if single:
+
+def domain_units(args, files, n_splits, chunk_size=None):
+    """
+    returns the work units of the domain files: JSONL files and text
+    files with several documents are split in byte ranges
+    """
+    jsonl_fields = None
+    if args.jsonl:
+        jsonl_fields = (args.text_field, args.id_field)
+    return list(work_units(
+        files, n_splits, jsonl_fields, args.documents, chunk_size
+    ))
+
+
+def extract(args, files, min_freq, sizes, workers, plan_run=False):
+    """
+    extract candidates from the files of the domain corpus
+    with the given workers (a WorkerPool). With --auto and plan_run
+    the plan also chooses the workers of the following stages
+    """
+    # split JSONL and text files with several documents in byte ranges
+    if args.jsonl or args.documents:
+        files = domain_units(args, files, os.cpu_count() or 1)
+
+    memory_limit = None
+    if args.memory_limit is not None:
+        memory_limit = args.memory_limit * 2**20
+
+    extractor = create_extractor(args, memory_limit, workers)
+
+    if args.tagged_store is not None:
+        store, errors = load_tagged_store(args, extractor, files, sizes)
+        candidates = extractor.extract_stored(store, verbose=True)
+    elif args.auto:
+        candidates, errors = extract_planned(
+            extractor, files, min_freq, sizes, workers, plan_run
+        )
+    elif args.single and memory_limit is not None:
+        candidates, errors = extractor.external(files, min_freq, verbose=True)
+    elif args.single:
         candidates, errors = extractor.single(files, verbose=True)
     else:
-        candidates, errors = extractor.multi(files)
+        candidates, errors = extractor.multi(files, min_freq, sizes)
 
-    # DISCRIMINATE CANDIDATES
-    discriminator = Discriminator(candidates, min_freq)
+    if args.prefetch:
+        print(f"\nDomain corpus: {extractor.read_times}")
 
-    # read reference corpus, default reuters
+    return candidates, errors
+
+
+def extract_planned(
+        extractor, files, min_freq, sizes, workers, plan_run=False):
+    """
+    extract candidates with the plan chosen from a sample of the
+    files: a single process or the workers, with size balanced tasks.
+    With plan_run the workers (a WorkerPool) are set by the plan for
+    the whole run: a single process plan starts no worker at all
+    """
+    units = list(work_units(files, n_workers(workers)))
+    plan = plan_extraction(extractor, units, sizes, workers, workers.started)
+    print(f"Plan: {plan}")
+    # workers are started by the first task (of the extraction, or of
+    # the reference counting if the plan is a single process)
+    if plan_run or plan.n_workers > 1:
+        plan.apply(workers)
+
+    # the candidates of the sample are merged with the other units
+    sample, sample_errors = plan.sample
+    start = time.perf_counter()
+    if plan.n_workers == 1 and extractor.memory_limit is not None:
+        candidates, errors = extractor.external(
+            plan.tasks[0], min_freq, verbose=True, partial=sample
+        )
+    elif plan.n_workers == 1:
+        candidates, errors = extractor.single(plan.tasks[0], verbose=True)
+        for candidate, frequency in sample.items():
+            candidates.setdefault(candidate, list()).extend(frequency)
+    else:
+        candidates, errors = extractor.multi(
+            None, min_freq, sizes, plan.tasks, partial=sample
+        )
+    elapsed = time.perf_counter() - start
+
+    print(f"\nPlan: predicted {plan.predicted:.2f} s, "
+          f"actual {elapsed:.2f} s")
+
+    return candidates, sample_errors + errors
+
+
+def load_tagged_store(args, extractor, files, sizes):
+    """
+    load the tagged domain corpus, tag and save it if it does not
+    exist yet, or was created from other files, with other settings
+    or with another tokenizer
+    """
+    # the store is only reused for the same (unchanged) files read
+    # in the same way
+    paths = dict.fromkeys(getattr(unit, "path", unit) for unit in files)
+    settings = corpus_settings(args, args.domain)
+    settings.update({
+        "jsonl": [args.text_field, args.id_field] if args.jsonl else None,
+        "documents": args.documents,
+        "files": ut.file_states(paths),
+    })
+
+    if os.path.isfile(args.tagged_store):
+        store = TaggedStore.load(args.tagged_store, settings)
+        if store is not None and store.tokenizer == extractor.tokenizer.name:
+            return store, list()
+        print("The tagged store was created from other files, with other "
+              "settings or with another tokenizer, tagging the corpus again")
+
+    if args.single:
+        store, errors = extractor.tag_documents(files, verbose=True)
+    else:
+        store, errors = extractor.tag_multi(files, sizes)
+    store.settings = settings
+    store.save(args.tagged_store)
+
+    return store, errors
+
+
+def reference_files(reference, errors=None):
+    """
+    returns the documents of the reference corpus:
+    reuters file ids (default) or the files given by the user,
+    directories which can not be read are added to errors
+    """
+    if reference is None:
+        return reuters.fileids()
+    return ut.retrieve_files(reference, errors=errors)
+
+
+def reference_lines(files, reference, errors, prefetch=0):
+    """
+    yields the lines of the given files of the reference corpus,
+    if prefetch is set the next files are read in background threads
+    """
+    # default reference corpus: reuters
     if reference is None:
-        reference_files = reuters.fileids()
-        for i, document in enumerate(reference_files):
-            text = reuters.raw(document)
-            discriminator.find_reference_frequence(text)
-            ut.progress_bar(i+1, len(reference_files),
+        for i, document in enumerate(files):
+            yield reuters.raw(document)
+            ut.progress_bar(i+1, len(files),
                             prefix="Counting", fixed_len=True)
 
     # reference was given by user, read every file
     else:
-        reference_files = ut.retrieve_files(reference)
-        for i, filepath in enumerate(reference_files):
+        times = ReadTimes()
+        if prefetch:
+            units = Prefetcher(
+                files, load_documents, prefetch, times=times,
+                stream=read_documents
+            )
+        else:
+            units = ((path, read_documents(path)) for path in files)
+
+        for i, (filepath, documents) in enumerate(units):
             try:
-                with open(filepath, "r", encoding="utf-8") as rfile:
+                for name, rfile in documents:
+                    if rfile is None:
+                        errors.append(name)
+                        continue
+
                     for line in rfile:
                         line = line.strip()
                         if len(line) > 0:
-                            discriminator.find_reference_frequence(line)
-            except (OSError, UnicodeDecodeError):
+                            yield line
+            except READ_ERRORS:
                 errors.append(filepath)
 
-            ut.progress_bar(i+1, len(reference_files),
+            ut.progress_bar(i+1, len(files),
                             prefix="Counting", fixed_len=True)
 
-    discriminator.calculate_dr_dc()
-    discriminator.generate_list(alpha, theta)
+        if prefetch:
+            print(f"\nReference corpus: {times}")
 
-    # SAVE OUTPUT
-    # make sure output dir exists to avoid errors
-    if not os.path.isdir("output"):
-        os.mkdir("output")
-
-    # remove already existing file
-    output_path = Path("output/keywords.txt")
-    if os.path.isfile(output_path):
-        os.remove(output_path)
-
-    # sort and save final candidates
-    candidate_list = discriminator.final_candidates
-    candidate_list = sorted(
-        candidate_list,
-        key=lambda x: x[-1],
-        reverse=True
-    )
 
-    with open(output_path, "a", encoding="utf-8") as ofile:
-        ofile.write(f"# alpha\t{alpha}\n")
-        ofile.write(f"# theta\t{theta}\n")
-        for word, f in candidate_list:
-            ofile.write(f"{word}\t{round(f, 6)}\n")
+def count_reference(
+        discriminator, files, reference, errors, prefetch=0,
+        executor="serial"):
+    """
+    count the candidates of the discriminator in
+    the given files of the reference corpus
+    """
+    lines = reference_lines(files, reference, errors, prefetch)
+    count_matches(discriminator.matcher, lines, executor)
 
-    # ERROR
+
+def reference_source(reference, files):
+    """
+    returns the reference corpus an index is built from: the path and
+    the size and modification time of every file (reuters: file ids)
+    """
+    if reference is None:
+        return {"reference": None, "files": list(files)}
+    return {
+        "reference": os.path.abspath(reference),
+        "files": ut.file_states(os.path.abspath(path) for path in files),
+    }
+
+
+def load_reference_index(args, errors):
+    """
+    load the index of the reference corpus, build and save it if
+    it does not exist yet or was built from another reference corpus
+    """
+    index_class = INDEXES[args.index_type]
+    files = reference_files(args.reference, errors)
+    source = reference_source(args.reference, files)
+    if index_class.exists(args.reference_index):
+        if read_source(args.reference_index) == source:
+            return index_class.load(args.reference_index)
+        print("The reference index was built from another reference "
+              "corpus or its files have changed, building it again")
+
+    try:
+        index = index_class.build(
+            reference_lines(files, args.reference, errors, args.prefetch)
+        )
+    except IndexTooLarge as error:
+        sys.exit(f"kextor.py: {error}")
+    index.save(args.reference_index)
+    save_source(args.reference_index, source)
+
+    return index
+
+
+def score(args, discriminator, workers=None):
+    """
+    calculate DR, DC and f-values of the candidates (with --prune
+    only for candidates which can reach theta)
+    """
+    if args.prune:
+        discriminator.calculate_dr_dc(args.alpha, args.theta, workers)
+    else:
+        discriminator.calculate_dr_dc(executor=workers)
+    discriminator.generate_list(args.alpha, args.theta)
+
+    if args.prune:
+        n_candidates, n_pruned = discriminator.pruning_rate()
+        rate = n_pruned / n_candidates * 100 if n_candidates else 0
+        print(f"\nPruned {n_pruned} of {n_candidates} candidates "
+              f"({rate:.1f}%)")
+
+
+def print_workers(workers):
+    """
+    print the time spent starting the workers and running tasks
+    """
+    if workers.started:
+        print(f"\nWorkers: {workers}")
+
+
+def print_errors(errors):
     if errors:
         print("\nThe following file(s) could not be opened:")
         for error in errors:
             print(f"\t- {error}")
 
-    # save files for evaluation + rejected
-    if verbose:
-        paths = (
-            Path("output/domain_consensus.txt"),
-            Path("output/domain_relevance.txt"),
-            Path("output/rejected.txt")
+
+def save_output(args, discriminator, errors, output_dir="output"):
+    """
+    save keywords (and rejected candidates) in the output directory
+    """
+    alpha = args.alpha
+    theta = args.theta
+
+    # SAVE OUTPUT
+    # make sure output dir exists to avoid errors
+    os.makedirs(output_dir, exist_ok=True)
+
+    writer = WRITERS[args.format]
+
+    # rank and save final candidates
+    output_path = Path(output_dir, f"keywords.{writer.extension}")
+    candidate_list = rank(discriminator.final_candidates, args.top_k)
+    with writer(output_path, alpha, theta) as ofile:
+        ofile.write(records(discriminator, candidate_list))
+
+    # ERROR
+    print_errors(errors)
+
+    # save rejected candidates (with DR and DC) for evaluation
+    if args.verbose:
+        rej_path = Path(output_dir, f"rejected.{writer.extension}")
+        candidate_list = rank(discriminator.rejected_candidates, args.top_k)
+        with writer(rej_path, alpha, theta) as ofile:
+            ofile.write(records(discriminator, candidate_list))
+
+
+def records(discriminator, candidate_list):
+    """
+    combine candidates and f-values with
+    domain relevance and consensus
+    """
+    for word, f in candidate_list:
+        dr = float(discriminator.domain_relevance[word])
+        dc = float(discriminator.domain_consensus[word])
+        yield word, f, dr, dc
+
+
+def preview(args, files, sizes, skipped=()):
+    """
+    extract the candidates of a sample of the domain corpus with a
+    proportionally lower min_freq and report the keywords with
+    bootstrap confidence intervals of their f-value
+    """
+    units = domain_units(args, files, os.cpu_count() or 1, SAMPLE_CHUNK)
+    sample = Extractor.sample_units(units, args.sample, args.seed)
+
+    # min_freq is scaled by the fraction of bytes in the sample
+    fraction = len(sample) / len(units)
+    total = sum(unit_weight(unit, sizes) for unit in units)
+    if total > 0:
+        fraction = sum(unit_weight(unit, sizes) for unit in sample) / total
+    min_freq = max(1, round(args.min_freq * fraction))
+    print(f"Sample: {len(sample)} of {len(units)} units "
+          f"({fraction:.1%} of the bytes), min_freq {min_freq}")
+
+    extractor = create_extractor(args)
+    candidates, documents, n_documents, errors = extractor.indexed(
+        sample, verbose=True
+    )
+    errors = list(skipped) + errors
+    documents = Postings.from_dict(documents)
+
+    with WorkerPool(args.executor) as workers:
+        if args.reference_index is not None:
+            discriminator = Discriminator(
+                candidates, min_freq,
+                reference_index=load_reference_index(args, errors)
+            )
+        else:
+            discriminator = Discriminator(candidates, min_freq)
+            count_reference(
+                discriminator, reference_files(args.reference, errors),
+                args.reference, errors, args.prefetch, workers
+            )
+        score(args, discriminator, workers)
+
+    keywords = rank(
+        discriminator.final_candidates, args.top_k or PREVIEW_KEYWORDS
+    )
+    intervals = discriminator.bootstrap(
+        documents, n_documents, args.alpha, [word for word, _ in keywords],
+        args.bootstrap, seed=args.seed
+    )
+
+    print(f"\n{len(discriminator.final_candidates)} provisional keywords "
+          f"in {n_documents} documents, f-value with 95% interval:")
+    for word, f in keywords:
+        low, high = intervals[word]
+        print(f"\t{word}\t{f:.4f}\t[{low:.4f}, {high:.4f}]")
+
+    save_output(
+        args, discriminator, errors, os.path.join("output", "sample")
+    )
+
+
+def map_shard(args):
+    """
+    extract the candidates of a slice of the domain corpus and
+    save them as partial postings (min_freq is applied by reduce)
+    """
+    skipped = list()
+    files, sizes = collect_files(args, errors=skipped)
+    if not files:
+        return False
+
+    # JSONL and text files with several documents are split in byte
+    # ranges first, so that a big file is spread across the shards.
+    # The ranges (of at most CHUNK_SIZE bytes) depend only on the
+    # file sizes, so every node computes the same ones
+    if args.jsonl or args.documents:
+        files = domain_units(args, files, args.shard[1])
+
+    files = select_shard(files, args.shard, args.partition)
+    if len(files) == 0:
+        candidates, errors = dict(), list()
+    else:
+        with WorkerPool(args.executor, warm_up) as workers:
+            candidates, errors = extract(args, files, 0, sizes, workers)
+        print_workers(workers)
+    errors = skipped + errors
+
+    if not isinstance(candidates, Postings):
+        candidates = Postings.from_dict(candidates)
+    candidates.save(args.out)
+
+    print_errors(errors)
+
+
+def count_shard(args):
+    """
+    count the candidates of the partial postings (reaching min_freq)
+    in a slice of the reference corpus and save the counts
+    """
+    candidates = Postings.merge(Postings.load(p) for p in args.partials)
+    discriminator = Discriminator(candidates, args.min_freq)
+
+    errors = list()
+    files = select_shard(
+        reference_files(args.reference, errors), args.shard, args.partition
+    )
+    with WorkerPool(args.executor) as workers:
+        count_reference(
+            discriminator, files, args.reference, errors, args.prefetch,
+            workers
         )
+    print_workers(workers)
 
-        # remove old files
-        for path in paths:
-            if os.path.isfile(path):
-                os.remove(path)
-
-        # sort list of rejected candidates
-        candidate_list = discriminator.rejected_candidates
-        candidate_list = sorted(
-            candidate_list,
-            key=lambda x: x[-1],
-            reverse=True
+    save_counts(args.out, discriminator.matcher.counts, args.min_freq)
+
+    print_errors(errors)
+
+
+def reduce_partials(args):
+    """
+    merge partial postings (and reference counts) and
+    generate the keywords
+    """
+    candidates = Postings.merge(Postings.load(p) for p in args.partials)
+    errors = list()
+
+    if args.counts is not None:
+        try:
+            counts = load_counts(args.counts, args.min_freq)
+        except ValueError as error:
+            sys.exit(f"kextor.py: {error}")
+        discriminator = Discriminator(
+            candidates, args.min_freq, reference_frequency=counts
+        )
+    elif args.reference_index is not None:
+        discriminator = Discriminator(
+            candidates, args.min_freq,
+            reference_index=load_reference_index(args, errors)
         )
+    else:
+        discriminator = Discriminator(candidates, args.min_freq)
+
+    with WorkerPool(args.executor) as workers:
+        if discriminator.matcher is not None:
+            count_reference(
+                discriminator, reference_files(args.reference, errors),
+                args.reference, errors, args.prefetch, workers
+            )
+        score(args, discriminator, workers)
+    print_workers(workers)
+
+    save_output(args, discriminator, errors)
+
+
+def batch(args):
+    """
+    generate the keywords of several domain corpora: the candidates
+    of all domains are counted with a single automaton (or index) so
+    that the reference corpus is read only once
+    """
+    min_freq = args.min_freq
+    discriminators = list()
+    output_dirs = list()
+    all_errors = list()
+
+    # the same workers are used for all domains
+    with WorkerPool(args.executor, warm_up) as workers:
+        # EXTRACT CANDIDATES of every domain
+        for path in args.domains:
+            skipped = list()
+            files, sizes = collect_files(args, path, skipped)
+            if not files:
+                continue
+
+            print(f"Domain: {path}")
+            candidates, errors = extract(args, files, min_freq, sizes, workers)
+            all_errors.append(skipped + errors)
+
+            # reference frequencies are set after counting
+            discriminators.append(
+                Discriminator(candidates, min_freq, count_reference=False)
+            )
+
+            # domains with the same name get a numbered directory
+            name = os.path.basename(os.path.normpath(path))
+            output_dir = os.path.join("output", name)
+            i = 1
+            while output_dir in output_dirs:
+                output_dir = os.path.join("output", f"{name}_{i}")
+                i += 1
+            output_dirs.append(output_dir)
+
+        if not discriminators:
+            return False
+
+        # COUNT the union of all candidates in the reference corpus
+        errors = list()
+        if args.reference_index is not None:
+            index = load_reference_index(args, errors)
+            for discriminator in discriminators:
+                discriminator.reference_frequency = index.frequencies(
+                    discriminator.candidates.vocabulary
+                )
+        else:
+            files = reference_files(args.reference, errors)
+            lines = reference_lines(
+                files, args.reference, errors, args.prefetch
+            )
+            count_reference_union(discriminators, lines, workers)
+
+        # DISCRIMINATE CANDIDATES of every domain
+        for discriminator, output_dir, domain_errors in zip(
+                discriminators, output_dirs, all_errors):
+            score(args, discriminator, workers)
+            save_output(
+                args, discriminator, domain_errors + errors, output_dir
+            )
+    print_workers(workers)
+
 
-        rej_path = Path("output/rejected.txt")
-        with open(rej_path, "a", encoding="utf-8") as ofile:
-            ofile.write(f"# alpha\t{alpha}\n")
-            ofile.write(f"# theta\t{theta}\n")
-            for word, f in candidate_list:
-                ofile.write(f"{word}\t{round(f, 6)}\n")
-
-        dc_path = Path("output/domain_consensus.txt")
-        with open(dc_path, "a", encoding="utf-8") as cf:
-            for word, value in discriminator.domain_consensus.items():
-                cf.write(f"{word}\t{round(value, 6)}\n")
-
-        dr_path = Path("output/domain_relevance.txt")
-        with open(dr_path, "a", encoding="utf-8") as cr:
-            for word, value in discriminator.domain_relevance.items():
-                cr.write(f"{word}\t{round(value, 6)}\n")
+def stream_settings(args):
+    """
+    returns the settings a saved window was created with, it is only
+    continued with the same corpus, window, index and extraction settings
+    """
+    settings = corpus_settings(args, args.domain)
+    settings.update({
+        "jsonl": args.jsonl,
+        "documents": args.documents,
+        "window": args.window,
+        "window_seconds": args.window_seconds,
+        "reference_index": os.path.abspath(args.reference_index),
+        "index_type": args.index_type,
+        "extraction": [
+            args.min_sen, args.max_cap, args.min_tok, args.max_tok,
+            args.not_paragraphed, args.validation, args.tokenizer
+        ],
+    })
+    return settings
+
+
+def window_files(args, files, positions):
+    """
+    drops the files whose documents would leave the window before the
+    last file is read: the files modified more than --window-seconds
+    before the last one and, when every file is a single document, all
+    but the last --window files
+    """
+    if not files:
+        return files
+
+    if args.window_seconds is not None:
+        oldest = positions[files[-1]][0] - args.window_seconds * 1e9
+        files = [path for path in files if positions[path][0] >= oldest]
+
+    single = not (args.jsonl or args.documents)
+    if args.window is not None and single and not any(
+        is_archive(path) for path in files
+    ):
+        files = files[-args.window:]
+
+    return files
+
+
+def stream(args):
+    """
+    extract the keywords of a sliding window over the documents
+    of the domain corpus (in order of modification time), with --state
+    the window is saved and the next run only reads the new files
+    """
+    errors = list()
+    files, _ = collect_files(args, errors=errors)
+    if not files:
+        return False
+
+    discriminator = StreamingDiscriminator(
+        load_reference_index(args, errors),
+        args.min_freq,
+        window_size=args.window,
+        window_seconds=args.window_seconds
+    )
+    extractor = create_extractor(args)
+
+    settings = stream_settings(args)
+    last_file = None
+    if args.state is not None and os.path.isfile(args.state):
+        restored, last_file = discriminator.restore(args.state, settings)
+        if restored:
+            print(f"{len(discriminator)} documents in the saved window")
+        else:
+            print("The window was saved for another corpus or with other "
+                  "settings, reading the whole corpus again")
+
+    # modification time (ns) and path, the files after the last file
+    # read by the previous run are new
+    positions = dict()
+    for filepath in files:
+        try:
+            mtime = os.stat(filepath).st_mtime_ns
+        except OSError:
+            errors.append(filepath)
+            continue
+        if last_file is None or (mtime, str(filepath)) > tuple(last_file):
+            positions[filepath] = (mtime, str(filepath))
+    files = window_files(args, sorted(positions, key=positions.get),
+                         positions)
+    if files:
+        last_file = positions[files[-1]]
+
+    n_documents = 0
+    units = domain_units(args, files, 1)
+    for unit, filedict in extractor.documents(units, errors, with_units=True):
+        discriminator.add_document(filedict, positions[unit.path][0] / 1e9)
+        n_documents += 1
+
+        if args.report_every and n_documents % args.report_every == 0:
+            keywords = discriminator.keywords(
+                args.alpha, args.theta, args.top_k or 10
+            )
+            print(f"\n{n_documents} documents, "
+                  f"{len(discriminator)} in the window")
+            for word, f in keywords:
+                print(f"\t{word}\t{round(f, 6)}")
+
+    if args.prefetch:
+        print(f"\nDomain corpus: {extractor.read_times}")
+
+    if args.state is not None:
+        discriminator.save(args.state, settings, last_file)
+
+    discriminator.calculate_dr_dc()
+    discriminator.generate_list(args.alpha, args.theta)
+    save_output(args, discriminator, errors)
 
 
 if __name__ == "__main__":
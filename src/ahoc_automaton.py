@@ -1,8 +1,25 @@
+import gc
+import threading
 from collections import deque
 
+import numpy as np
+
+
+# a transition of the flat automaton is stored as
+# (state << SYMBOL_BITS) | code point of the symbol
+SYMBOL_BITS = 21
+
+# threads sharing a FlatAutomaton prepare it only once
+_goto_lock = threading.Lock()
+
 
 class State:
 
+    __slots__ = (
+        "children", "root", "symbol", "output", "fail", "output_link",
+        "results", "__counter", "counts"
+    )
+
     def __init__(self, symbol=None):
         self.children = dict()
         self.root = False
@@ -12,6 +29,7 @@ class State:
         self.symbol = symbol
         self.output = list()
         self.fail = None
+        self.output_link = None
         self.results = dict()
         self.__counter = 0
         self.counts = dict()
@@ -20,10 +38,14 @@ class State:
         return self.symbol
 
     def __str__(self, level=0):
-        ret = "  "*level+repr(self.symbol)+"\n"
-        for child in self.children.values():
-            ret += child.__str__(level+1)
-        return ret
+        lines = list()
+        stack = [(self, level)]
+        while stack:
+            state, depth = stack.pop()
+            lines.append("  "*depth+repr(state.symbol)+"\n")
+            for child in reversed(list(state.children.values())):
+                stack.append((child, depth+1))
+        return "".join(lines)
 
     def reset(self):
         """
@@ -38,8 +60,8 @@ class State:
 
     def traverse(self, states=None):
         """
-        a recursive function to traverse the
-        automaton and return a list of states
+        traverse the automaton (depth first)
+        and return a list of states
 
         Parameters:
             - None (self)
@@ -50,10 +72,11 @@ class State:
         if states is None:
             states = list()
 
-        states.append(self.symbol)
-
-        for child in self.children.values():
-            child.traverse(states)
+        stack = [self]
+        while stack:
+            state = stack.pop()
+            states.append(state.symbol)
+            stack.extend(reversed(list(state.children.values())))
 
         return states
 
@@ -142,8 +165,12 @@ class State:
                 if child.fail is None:
                     child.fail = root
 
-                # carry over the output
-                child.output = child.output + child.fail.output
+                # link to the nearest state on the fail path with output
+                # (instead of copying its output)
+                if child.fail.output:
+                    child.output_link = child.fail
+                else:
+                    child.output_link = child.fail.output_link
 
     def find_match(self, line, case_insensitive=False):
         """
@@ -179,26 +206,67 @@ class State:
             if current_state is None:
                 current_state = root
             else:
-                # if we are in a terminal state
-                # (aka state has output) save result
-                for pattern in current_state.output:
-                    if pattern not in self.results:
-                        self.results[pattern] = list()
-
-                    if pattern not in self.counts:
-                        self.counts[pattern] = 0
-                    # add counter to i (for multiline input)
-                    it = i + self.__counter
-                    self.results[pattern].append(it - len(pattern) + 1)
-                    self.counts[pattern] += 1
+                # if we are in a terminal state (aka state or the
+                # states of its output links have output) save result
+                state = current_state
+                while state is not None:
+                    for pattern in state.output:
+                        if pattern not in self.results:
+                            self.results[pattern] = list()
+
+                        if pattern not in self.counts:
+                            self.counts[pattern] = 0
+                        # add counter to i (for multiline input)
+                        it = i + self.__counter
+                        self.results[pattern].append(it - len(pattern) + 1)
+                        self.counts[pattern] += 1
+                    state = state.output_link
 
         self.__counter += len(line)
 
+    def count_matches(self, lines, case_insensitive=False):
+        """
+        count the matches of the patterns in the given lines.
+        Unlike find_match, results and counts of the automaton are
+        not modified, so it can be shared by several threads
+
+        Returns:
+            - dictionary pattern -> number of matches
+        """
+        counts = dict()
+        root = self
+
+        for line in lines:
+            if case_insensitive:
+                line = line.lower()
+
+            current_state = root
+            for char in line:
+                while (current_state.find_next_state(char) is None
+                       and current_state.root is False):
+                    current_state = current_state.fail
+
+                current_state = current_state.find_next_state(char)
+
+                if current_state is None:
+                    current_state = root
+                else:
+                    state = current_state
+                    while state is not None:
+                        for pattern in state.output:
+                            counts[pattern] = counts.get(pattern, 0) + 1
+                        state = state.output_link
+
+        return counts
+
     @classmethod
     def create_automaton(cls, string_list):
         """
         A class method to create and return a complete Aho Corasick Automaton
-        given a list of patterns to be added as states
+        given a list of patterns to be added as states.
+        Patterns are sorted and added in bulk: each pattern shares
+        its states with the common prefix of the previous one, so
+        only the remaining states have to be created
 
         Parameters:
             - cls (class State):
@@ -210,11 +278,303 @@ class State:
               to match the patterns given as argument
         """
         automaton = cls()
-        for string in string_list:
-            automaton.add_pattern(string)
-        automaton.fail_connections()
+
+        # states of the previous pattern
+        path = [automaton]
+        previous = ""
+
+        # millions of new states would trigger the garbage collector
+        # over and over, although none of them can be collected
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            for pattern in sorted(set(string_list)):
+                common = 0
+                limit = min(len(previous), len(pattern))
+                while common < limit and previous[common] == pattern[common]:
+                    common += 1
+
+                del path[common+1:]
+                this_state = path[-1]
+                for char in pattern[common:]:
+                    new_state = cls(char)
+                    this_state.children[char] = new_state
+                    path.append(new_state)
+                    this_state = new_state
+
+                this_state.output.append(pattern)
+                previous = pattern
+
+            automaton.fail_connections()
+        finally:
+            if gc_enabled:
+                gc.enable()
+
         return automaton
 
+    def compile(self):
+        """
+        convert the automaton into a FlatAutomaton (arrays instead
+        of objects) which can be saved and loaded without pickle
+        """
+        states = [self]
+        index = {id(self): 0}
+        queue = deque([self])
+        while queue:
+            state = queue.popleft()
+            for child in state.children.values():
+                index[id(child)] = len(states)
+                states.append(child)
+                queue.append(child)
+
+        edge_keys = list()
+        edge_targets = list()
+        patterns = list()
+        pattern = np.full(len(states), -1, dtype=np.int32)
+        fail = np.zeros(len(states), dtype=np.int32)
+        output_link = np.full(len(states), -1, dtype=np.int32)
+
+        for i, state in enumerate(states):
+            for symbol, child in state.children.items():
+                edge_keys.append((i << SYMBOL_BITS) | ord(symbol))
+                edge_targets.append(index[id(child)])
+
+            if state.output:
+                pattern[i] = len(patterns)
+                patterns.append(state.output[0])
+            if state.fail is not None:
+                fail[i] = index[id(state.fail)]
+            if state.output_link is not None:
+                output_link[i] = index[id(state.output_link)]
+
+        edge_keys = np.array(edge_keys, dtype=np.int64)
+        order = np.argsort(edge_keys)
+
+        return FlatAutomaton(
+            edge_keys[order],
+            np.array(edge_targets, dtype=np.int32)[order],
+            fail,
+            output_link,
+            pattern,
+            patterns
+        )
+
+
+class FlatAutomaton:
+    """
+    An Aho-Corasick automaton stored in flat arrays: states are
+    numbered (root = 0), transitions are sorted keys
+    (state << SYMBOL_BITS | symbol) and their target states.
+    It can be saved to and loaded from a npz file without pickle
+    """
+
+    def __init__(
+            self, edge_keys, edge_targets, fail, output_link,
+            pattern, patterns):
+        self.edge_keys = edge_keys
+        self.edge_targets = edge_targets
+        self.fail = fail
+        self.output_link = output_link
+        self.pattern = pattern
+        self.patterns = list(patterns)
+        self.goto = None
+        self.results = dict()
+        self.__counter = 0
+        self.counts = dict()
+
+    def __len__(self):
+        return len(self.fail)
+
+    def reset(self):
+        """
+        delete results, counts and the counter
+        """
+        self.results = dict()
+        self.__counter = 0
+        self.counts = dict()
+
+    def save(self, path):
+        """
+        save the automaton in a (numpy) npz file
+        """
+        data = "\0".join(self.patterns).encode("utf-8")
+        with open(path, "wb") as ofile:
+            np.savez(
+                ofile,
+                edge_keys=self.edge_keys,
+                edge_targets=self.edge_targets,
+                fail=self.fail,
+                output_link=self.output_link,
+                pattern=self.pattern,
+                patterns=np.frombuffer(data, dtype=np.uint8),
+                n_patterns=np.array([len(self.patterns)])
+            )
+
+    @classmethod
+    def load(cls, path):
+        """
+        load an automaton saved with save
+        """
+        with np.load(path) as data:
+            patterns = list()
+            if data["n_patterns"][0] > 0:
+                patterns = data["patterns"].tobytes().decode("utf-8")
+                patterns = patterns.split("\0")
+
+            return cls(
+                data["edge_keys"],
+                data["edge_targets"],
+                data["fail"],
+                data["output_link"],
+                data["pattern"],
+                patterns
+            )
+
+    def build_goto(self):
+        """
+        prepare the transitions used for matching, this is done once
+        before the first match. goto[state] is a dictionary character
+        -> target state (like the children of a State), created by
+        transitions the first time the state is visited, so that
+        millions of patterns do not have to be put in dictionaries
+        before the first match
+        """
+        with _goto_lock:
+            # another thread may have prepared the automaton meanwhile
+            if self.goto is not None:
+                return
+
+            self._fail = self.fail.tolist()
+            self._output_link = self.output_link.tolist()
+            self._pattern = self.pattern.tolist()
+            # first state with output (the state or its output link)
+            states = np.arange(len(self.fail), dtype=np.int32)
+            self._output = np.where(
+                self.pattern >= 0, states, self.output_link
+            ).tolist()
+            # the edges of state i are edge_keys[first[i]:first[i + 1]]
+            self._first = np.searchsorted(
+                self.edge_keys >> SYMBOL_BITS, np.arange(len(self.fail) + 1)
+            ).tolist()
+            self._symbols = self.edge_keys & ((1 << SYMBOL_BITS) - 1)
+            # set last: the automaton is ready once goto is set
+            self.goto = [None] * len(self.fail)
+
+    def transitions(self, state):
+        """
+        returns the transitions of a state, read from the sorted edge
+        keys. They are stored in goto once the dictionary is complete:
+        threads which visit the state at the same time build the
+        same dictionary
+        """
+        start, end = self._first[state], self._first[state + 1]
+        edges = dict(zip(
+            map(chr, self._symbols[start:end].tolist()),
+            self.edge_targets[start:end].tolist()
+        ))
+        self.goto[state] = edges
+        return edges
+
+    def find_match(self, line, case_insensitive=False):
+        """
+        given a string, run it through the automaton to find a match,
+        results and counts are saved like in State.find_match
+        """
+        if self.goto is None:
+            self.build_goto()
+
+        if case_insensitive:
+            line = line.lower()
+
+        goto = self.goto
+        transitions = self.transitions
+        fail = self._fail
+        output = self._output
+        output_link = self._output_link
+        pattern_index = self._pattern
+
+        current_state = 0
+        for i, char in enumerate(line):
+            edges = goto[current_state]
+            if edges is None:
+                edges = transitions(current_state)
+            next_state = edges.get(char)
+
+            # if no new state --> follow fail links
+            while next_state is None and current_state != 0:
+                current_state = fail[current_state]
+                edges = goto[current_state]
+                if edges is None:
+                    edges = transitions(current_state)
+                next_state = edges.get(char)
+
+            # if next state does not exists, go back to root
+            if next_state is None:
+                current_state = 0
+                continue
+
+            current_state = next_state
+            state = output[current_state]
+            while state >= 0:
+                pattern = self.patterns[pattern_index[state]]
+                if pattern not in self.results:
+                    self.results[pattern] = list()
+                    self.counts[pattern] = 0
+                # add counter to i (for multiline input)
+                it = i + self.__counter
+                self.results[pattern].append(it - len(pattern) + 1)
+                self.counts[pattern] += 1
+                state = output_link[state]
+
+        self.__counter += len(line)
+
+    def count_matches(self, lines, case_insensitive=False):
+        """
+        count the matches of the patterns in the given lines without
+        modifying results and counts (like State.count_matches)
+        """
+        if self.goto is None:
+            self.build_goto()
+
+        goto = self.goto
+        transitions = self.transitions
+        fail = self._fail
+        output = self._output
+        output_link = self._output_link
+        pattern_index = self._pattern
+        patterns = self.patterns
+        counts = dict()
+
+        for line in lines:
+            if case_insensitive:
+                line = line.lower()
+
+            current_state = 0
+            for char in line:
+                edges = goto[current_state]
+                if edges is None:
+                    edges = transitions(current_state)
+                next_state = edges.get(char)
+
+                while next_state is None and current_state != 0:
+                    current_state = fail[current_state]
+                    edges = goto[current_state]
+                    if edges is None:
+                        edges = transitions(current_state)
+                    next_state = edges.get(char)
+
+                if next_state is None:
+                    current_state = 0
+                    continue
+
+                current_state = next_state
+                state = output[current_state]
+                while state >= 0:
+                    pattern = patterns[pattern_index[state]]
+                    counts[pattern] = counts.get(pattern, 0) + 1
+                    state = output_link[state]
+
+        return counts
 
 if __name__ == "__main__":
     text = (
@@ -1,18 +1,67 @@
 import argparse
+import sys
 
+from src.corpus import parse_boundary
 
-def parse_arguments():
-    parser = argparse.ArgumentParser()
+
+SUBCOMMANDS = ("map", "count", "reduce", "batch", "stream")
+
+
+def add_corpus_arguments(parser):
     parser.add_argument(
-        "domain", metavar="DOMAIN", action="store",
-        help="Path to the domain corpus"
+        "--recursive", action="store_true", default=False,
+        help="Collect files in subdirectories of the domain corpus "
+        "(Default: %(default)s)"
     )
 
     parser.add_argument(
-        "--reference", metavar="REF",
-        action="store", help="Path to the reference Corpus"
+        "--include", metavar="GLOB", action="append",
+        help="Only use domain files matching this pattern "
+        "(can be repeated)"
+    )
+
+    parser.add_argument(
+        "--exclude", metavar="GLOB", action="append",
+        help="Skip domain files matching this pattern (can be repeated)"
+    )
+
+    parser.add_argument(
+        "--manifest", metavar="FILE", action="store",
+        help="Read the list of domain files from FILE if it exists, "
+        "otherwise save it there after collecting the files"
+    )
+
+    # documents of JSONL files or of text files
+    documents = parser.add_mutually_exclusive_group()
+    documents.add_argument(
+        "--jsonl", action="store_true", default=False,
+        help="Domain corpus consists of JSONL files with one document "
+        "per record (Default: %(default)s)"
+    )
+
+    parser.add_argument(
+        "--text-field", metavar="FIELD", action="store", default="text",
+        help="Field of a JSONL record containing the text "
+        "(Default: %(default)s)"
+    )
+
+    parser.add_argument(
+        "--id-field", metavar="FIELD", action="store", default="id",
+        help="Field of a JSONL record containing the document id "
+        "(Default: %(default)s)"
     )
 
+    documents.add_argument(
+        "--documents", metavar="BOUNDARY", action="store",
+        type=parse_documents,
+        help="Domain text files contain several documents, separated by "
+        "blank lines (blank), by lines matching a regular expression "
+        "(regex:PATTERN) or of N lines each (lines:N). Big files are "
+        "split in byte ranges for the workers"
+    )
+
+
+def add_extraction_arguments(parser):
     parser.add_argument(
         "--min_sen", metavar="N", action="store",
         help="Minimum ammount of sentences per paragraph "
@@ -39,6 +88,94 @@ def parse_arguments():
         "(Default: %(default)s)"
     )
 
+    parser.add_argument(
+        "--not-paragraphed", action="store_true", default=False,
+        help="Domain corpus has NOT one paragraph per line "
+        "(Default: %(default)s)"
+    )
+
+    parser.add_argument(
+        "--validation", action="store_true", default=False,
+        help="Validates candidates with a dictionary "
+        "(Default: %(default)s)"
+    )
+
+    parser.add_argument(
+        "--tokenizer", action="store", default="nltk",
+        choices=["nltk", "regex"],
+        help="Sentence and word tokenizer: NLTK (Punkt and Treebank) or "
+        "a faster regular expression (Default: %(default)s)"
+    )
+
+
+def add_execution_arguments(parser):
+    parser.add_argument(
+        "--tagged-store", metavar="FILE", action="store",
+        help="Tokenized and POS-tagged domain corpus: it is created (and "
+        "saved in FILE) on the first run, following runs with other "
+        "extraction parameters only apply the filters"
+    )
+
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--single", action="store_true",
+        help="disable multiprocessing"
+    )
+    mode.add_argument(
+        "--auto", action="store_true",
+        help="Choose a single process or workers (and how many) from "
+        "the extraction time of a sample of the domain corpus"
+    )
+
+    parser.add_argument(
+        "--memory-limit", metavar="MB", action="store", type=int,
+        help="Memory for the candidates of the domain corpus (shared by "
+        "the workers), above the limit they are spilled to temporary "
+        "files and merged at the end"
+    )
+
+
+def add_prefetch_argument(parser):
+    parser.add_argument(
+        "--prefetch", metavar="N", action="store", type=int, default=0,
+        help="Read the next N files in background threads while the "
+        "current one is processed and report the time spent waiting "
+        "for files (Default: %(default)s, disabled)"
+    )
+
+
+def add_executor_argument(parser):
+    parser.add_argument(
+        "--executor", action="store",
+        choices=["process", "thread", "serial"],
+        help="Run the extraction and the reference counting in worker "
+        "processes, in threads (for free-threaded Python builds) or in a "
+        "single process (Default: process, serial with --single)"
+    )
+
+
+def add_sample_arguments(parser):
+    parser.add_argument(
+        "--sample", metavar="FRACTION", action="store", type=float,
+        help="Preview: extract a random fraction of the domain corpus "
+        "(stratified by directory), scale min_freq and report the "
+        "keywords with bootstrap confidence intervals of their f-value"
+    )
+
+    parser.add_argument(
+        "--bootstrap", metavar="N", action="store", type=int, default=200,
+        help="Resamples of the documents for the confidence intervals "
+        "of the preview (Default: %(default)s)"
+    )
+
+    parser.add_argument(
+        "--seed", metavar="N", action="store", type=int, default=0,
+        help="Seed of the sample and of the resamples "
+        "(Default: %(default)s)"
+    )
+
+
+def add_min_freq_argument(parser):
     parser.add_argument(
         "--min_freq", metavar="N", action="store",
         type=int, default=25,
@@ -46,6 +183,32 @@ def parse_arguments():
         "(Default: %(default)s)"
     )
 
+
+def add_reference_argument(parser):
+    parser.add_argument(
+        "--reference", metavar="REF",
+        action="store", help="Path to the reference Corpus"
+    )
+
+
+def add_reference_index_argument(parser):
+    parser.add_argument(
+        "--reference-index", metavar="DIR", action="store",
+        help="Directory of the index of the reference corpus: it is built "
+        "(and saved there) on the first run and used instead of "
+        "reading the reference corpus in the following runs"
+    )
+
+    parser.add_argument(
+        "--index-type", action="store", default="bigram",
+        choices=["bigram", "suffix"],
+        help="Index of the reference corpus: a table of token bigrams "
+        "(candidates of two tokens) or a suffix array (candidates of "
+        "any length) (Default: %(default)s)"
+    )
+
+
+def add_discriminator_arguments(parser):
     parser.add_argument(
         "--alpha", metavar="N", action="store",
         type=float, default=0.99,
@@ -60,28 +223,333 @@ def parse_arguments():
         "(Default: %(default)s)"
     )
 
+
+def add_pruning_argument(parser):
     parser.add_argument(
-        "--not-paragraphed", action="store_true", default=False,
-        help="Domain corpus has NOT one paragraph per line "
+        "--prune", action="store_true", default=False,
+        help="Skip the domain consensus of candidates whose f-value "
+        "can not reach theta (same keywords, can not be used with "
+        "--verbose) (Default: %(default)s)"
+    )
+
+
+def check_executor(parser, args):
+    single = getattr(args, "single", False)
+    if single and args.executor not in (None, "serial"):
+        parser.error(f"--single can not be used with --executor "
+                     f"{args.executor}")
+
+    # --single also counts and scores in the calling process
+    if args.executor is None:
+        args.executor = "serial" if single else "process"
+
+
+def check_pruning(parser, args):
+    if args.prune and args.verbose:
+        parser.error("--prune can not be used with --verbose: "
+                     "rejected candidates need their f-value")
+    # the bound of the f-value assumes a weighted mean of DR and DC
+    if args.prune and not 0 <= args.alpha <= 1:
+        parser.error("--prune requires an --alpha between 0 and 1")
+
+
+def check_sample(parser, args):
+    if args.sample is None:
+        return
+    if not 0 < args.sample <= 1:
+        parser.error("--sample must be a fraction between 0 and 1")
+
+    # the preview extracts the sample in a single process, in memory
+    options = {
+        "--auto": args.auto, "--single": args.single,
+        "--tagged-store": args.tagged_store is not None,
+        "--memory-limit": args.memory_limit is not None,
+    }
+    for option, given in options.items():
+        if given:
+            parser.error(f"--sample can not be used with {option}")
+
+
+def add_output_arguments(parser):
+    parser.add_argument(
+        "--verbose", action="store_true", default=False,
+        help="Save rejected candidates "
         "(Default: %(default)s)"
     )
 
     parser.add_argument(
-        "--validation", action="store_true", default=False,
-        help="Validates candidates with a dictionary "
+        "--top-k", metavar="N", action="store", type=parse_positive,
+        help="Only save the N best keywords (and rejected candidates)"
+    )
+
+    parser.add_argument(
+        "--format", action="store", default="tsv",
+        choices=["tsv", "jsonl", "binary"],
+        help="Format of the output files (Default: %(default)s)"
+    )
+
+
+def add_shard_arguments(parser):
+    parser.add_argument(
+        "--shard", metavar="I/N", action="store", default="0/1",
+        type=parse_shard,
+        help="Process the I-th of N slices of the corpus "
         "(Default: %(default)s)"
     )
 
     parser.add_argument(
-        "--verbose", action="store_true", default=False,
-        help="Save domain relevance, consensus and rejected "
-        "candidates (Default: %(default)s)"
+        "--partition", action="store", default="index",
+        choices=["index", "hash"],
+        help="Select the slice by position in the sorted list of files "
+        "or by hash of the file path (Default: %(default)s)"
     )
 
     parser.add_argument(
-        "--single", action="store_true",
-        help="disable multiprocessing"
+        "--out", metavar="FILE", action="store", required=True,
+        help="Path of the partial result"
+    )
+
+
+def parse_positive(value):
+    """
+    parse a positive integer
+    """
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid positive number {value!r}")
+
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"invalid positive number {value!r}")
+
+    return number
+
+
+def parse_shard(shard):
+    """
+    parse a shard string 'I/N' into a tuple (I, N)
+    """
+    try:
+        index, n_shards = (int(i) for i in shard.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid shard {shard!r}")
+
+    if not 0 <= index < n_shards:
+        raise argparse.ArgumentTypeError(f"invalid shard {shard!r}")
+
+    return index, n_shards
+
+
+def parse_documents(boundary):
+    """
+    check a document boundary (see corpus.parse_boundary)
+    """
+    try:
+        parse_boundary(boundary)
+    except ValueError:
+        raise argparse.ArgumentTypeError(
+            f"invalid document boundary {boundary!r}"
+        )
+
+    return boundary
+
+
+def parse_map_arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="kextor.py map",
+        description="Extract candidates from a slice of the domain corpus"
+    )
+    parser.add_argument(
+        "domain", metavar="DOMAIN", action="store",
+        help="Path to the domain corpus"
+    )
+    add_corpus_arguments(parser)
+    add_extraction_arguments(parser)
+    add_execution_arguments(parser)
+    add_shard_arguments(parser)
+    add_prefetch_argument(parser)
+    add_executor_argument(parser)
+
+    args = parser.parse_args(argv)
+    check_executor(parser, args)
+
+    return args
+
+
+def parse_count_arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="kextor.py count",
+        description="Count the candidates of the partial results "
+        "in a slice of the reference corpus"
+    )
+    parser.add_argument(
+        "partials", metavar="PARTIAL", nargs="+",
+        help="Partial results of the map command"
+    )
+    add_reference_argument(parser)
+    add_min_freq_argument(parser)
+    add_shard_arguments(parser)
+    add_prefetch_argument(parser)
+    add_executor_argument(parser)
+
+    args = parser.parse_args(argv)
+    check_executor(parser, args)
+
+    return args
+
+
+def parse_reduce_arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="kextor.py reduce",
+        description="Merge partial results and generate the keywords"
+    )
+    parser.add_argument(
+        "partials", metavar="PARTIAL", nargs="+",
+        help="Partial results of the map command"
+    )
+    parser.add_argument(
+        "--counts", metavar="FILE", nargs="+",
+        help="Reference counts of the count command, if not given "
+        "the reference corpus is read"
+    )
+    add_reference_argument(parser)
+    add_reference_index_argument(parser)
+    add_min_freq_argument(parser)
+    add_discriminator_arguments(parser)
+    add_pruning_argument(parser)
+    add_output_arguments(parser)
+    add_prefetch_argument(parser)
+    add_executor_argument(parser)
+
+    args = parser.parse_args(argv)
+    check_executor(parser, args)
+    check_pruning(parser, args)
+
+    return args
+
+
+def parse_batch_arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="kextor.py batch",
+        description="Generate the keywords of several domain corpora "
+        "reading the reference corpus only once"
+    )
+    parser.add_argument(
+        "domains", metavar="DOMAIN", nargs="+",
+        help="Paths to the domain corpora"
+    )
+    add_reference_argument(parser)
+    add_reference_index_argument(parser)
+    add_corpus_arguments(parser)
+    add_extraction_arguments(parser)
+    add_execution_arguments(parser)
+    add_min_freq_argument(parser)
+    add_discriminator_arguments(parser)
+    add_pruning_argument(parser)
+    add_output_arguments(parser)
+    add_prefetch_argument(parser)
+    add_executor_argument(parser)
+
+    args = parser.parse_args(argv)
+    if args.manifest is not None:
+        parser.error("--manifest can not be used with several domains")
+    if args.tagged_store is not None:
+        parser.error("--tagged-store can not be used with several domains")
+    check_executor(parser, args)
+    check_pruning(parser, args)
+
+    return args
+
+
+def parse_stream_arguments(argv):
+    parser = argparse.ArgumentParser(
+        prog="kextor.py stream",
+        description="Keywords of a sliding window over the documents of "
+        "the domain corpus, read in order of modification time"
+    )
+    parser.add_argument(
+        "domain", metavar="DOMAIN", action="store",
+        help="Path to the domain corpus"
+    )
+    parser.add_argument(
+        "--window", metavar="N", action="store", type=int,
+        help="Keep the last N documents"
+    )
+    parser.add_argument(
+        "--window-seconds", metavar="S", action="store", type=float,
+        help="Keep the documents modified in the S seconds before "
+        "the last document"
+    )
+    parser.add_argument(
+        "--report-every", metavar="N", action="store", type=int,
+        help="Print the best keywords (--top-k, Default: 10) "
+        "every N documents"
+    )
+    parser.add_argument(
+        "--state", metavar="FILE", action="store",
+        help="Save the window to FILE, the next run continues it and only "
+        "reads the files modified after the last file read"
+    )
+    add_reference_argument(parser)
+    add_reference_index_argument(parser)
+    add_corpus_arguments(parser)
+    add_extraction_arguments(parser)
+    add_min_freq_argument(parser)
+    add_discriminator_arguments(parser)
+    add_output_arguments(parser)
+    add_prefetch_argument(parser)
+
+    args = parser.parse_args(argv)
+    if args.reference_index is None:
+        parser.error("the stream command requires --reference-index")
+
+    return args
+
+
+def parse_arguments(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if argv and argv[0] in SUBCOMMANDS:
+        command = argv[0]
+        if command == "map":
+            args = parse_map_arguments(argv[1:])
+        elif command == "count":
+            args = parse_count_arguments(argv[1:])
+        elif command == "reduce":
+            args = parse_reduce_arguments(argv[1:])
+        elif command == "batch":
+            args = parse_batch_arguments(argv[1:])
+        else:
+            args = parse_stream_arguments(argv[1:])
+        args.command = command
+        return args
+
+    parser = argparse.ArgumentParser(
+        epilog="Distributed mode: kextor.py {map,count,reduce} -h, "
+        "several domains: kextor.py batch -h, "
+        "sliding window: kextor.py stream -h"
+    )
+    parser.add_argument(
+        "domain", metavar="DOMAIN", action="store",
+        help="Path to the domain corpus"
     )
+    add_reference_argument(parser)
+    add_reference_index_argument(parser)
+    add_corpus_arguments(parser)
+    add_extraction_arguments(parser)
+    add_execution_arguments(parser)
+    add_min_freq_argument(parser)
+    add_discriminator_arguments(parser)
+    add_pruning_argument(parser)
+    add_output_arguments(parser)
+    add_prefetch_argument(parser)
+    add_executor_argument(parser)
+    add_sample_arguments(parser)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    check_executor(parser, args)
+    check_pruning(parser, args)
+    check_sample(parser, args)
+    args.command = None
     return args
@@ -0,0 +1,643 @@
+"""
+The corpus readers stream documents out of the files of a corpus.
+Besides plain text files, documents can be stored in compressed
+files (.gz, .bz2, .xz), in (compressed) tar archives, which
+are read directly without unpacking them to disk, or as records
+of JSONL files, which are split in byte ranges for the workers.
+Big text files can also be split in byte ranges: their documents
+are separated by blank lines, by lines matching a regular expression
+or have a fixed number of lines, a range reads the documents
+which start in it
+"""
+
+import bz2
+import gzip
+import json
+import lzma
+import math
+import os
+import re
+import tarfile
+from pathlib import Path
+from typing import NamedTuple
+
+
+COMPRESSED = {
+    ".gz": gzip.open,
+    ".bz2": bz2.open,
+    ".xz": lzma.open,
+}
+
+ARCHIVES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+# byte ranges of JSONL files are never bigger than this
+CHUNK_SIZE = 64 * 2**20
+
+# members of a compressed archive sent to a worker at a time (bytes)
+BATCH_SIZE = 2**20
+
+# bytes read at a time while counting the lines of a file
+BLOCK_SIZE = 2**20
+
+
+class InvalidRecord(ValueError):
+    """
+    raised when a JSONL record is not valid JSON
+    or has no text field
+    """
+
+
+# errors that make a document (or a whole unit) unreadable
+READ_ERRORS = (
+    OSError, UnicodeDecodeError, EOFError, lzma.LZMAError, tarfile.TarError,
+    InvalidRecord
+)
+
+
+class WorkUnit(NamedTuple):
+    """
+    a unit of work for the extractor: a whole file (or archive)
+    """
+    path: Path
+
+    def __str__(self):
+        return str(self.path)
+
+
+class ArchiveMembers(NamedTuple):
+    """
+    a unit of work for the extractor: some members of an uncompressed
+    tar archive, given as tuples (name, offset of the data, size)
+    which are read directly without scanning the archive
+    """
+    path: Path
+    members: tuple
+
+    def __str__(self):
+        return f"{self.path} [{len(self.members)} members]"
+
+
+class MemberBatch(NamedTuple):
+    """
+    a unit of work for the extractor: some members of a compressed
+    tar archive, already decompressed by the calling process and given
+    as tuples (name, data)
+    """
+    path: Path
+    members: tuple
+
+    def __str__(self):
+        return f"{self.path} [{len(self.members)} members]"
+
+
+class JsonlRange(NamedTuple):
+    """
+    a unit of work for the extractor: all records of a JSONL file
+    whose line starts between the bytes start and end (end=None
+    means until the end of the file). Each record is a document
+    """
+    path: Path
+    start: int
+    end: int
+    text_field: str = "text"
+    id_field: str = "id"
+
+    def __str__(self):
+        return f"{self.path} [{self.start}:{self.end}]"
+
+
+class TextRange(NamedTuple):
+    """
+    a unit of work for the extractor: all documents of a text file
+    which start between the bytes start and end (end=None means
+    until the end of the file). boundary separates the documents,
+    see parse_boundary
+    """
+    path: Path
+    start: int
+    end: int
+    boundary: str = "blank"
+
+    def __str__(self):
+        return f"{self.path} [{self.start}:{self.end}]"
+
+
+# work units (anything else is the path of a file)
+UNITS = (WorkUnit, ArchiveMembers, MemberBatch, JsonlRange, TextRange)
+
+
+def is_archive(path):
+    """
+    returns True if the path is a tar archive
+    """
+    return str(path).lower().endswith(ARCHIVES)
+
+
+def is_compressed_archive(unit):
+    """
+    returns True if the unit is a whole compressed tar archive,
+    which can only be read sequentially
+    """
+    return (
+        isinstance(unit, WorkUnit) and is_archive(unit.path)
+        and not str(unit.path).lower().endswith(".tar")
+    )
+
+
+def open_text(path):
+    """
+    open a (possibly compressed) text file for reading
+    """
+    opener = COMPRESSED.get(Path(path).suffix.lower(), open)
+    return opener(path, "rt", encoding="utf-8")
+
+
+def index_archive(path):
+    """
+    returns the tuples (name, offset, size) of the files in an
+    uncompressed tar archive, only the headers of the members are read
+    """
+    with tarfile.open(path, "r:") as archive:
+        return [
+            (member.name, member.offset_data, member.size)
+            for member in archive.getmembers() if member.isfile()
+        ]
+
+
+def archive_units(path, n_splits, chunk_size=CHUNK_SIZE):
+    """
+    yields the units of an archive: an uncompressed archive is indexed
+    once and split in at least n_splits groups of consecutive members
+    (of about the same size, none bigger than chunk_size if possible).
+    A compressed archive can only be read sequentially and is a single
+    unit, so that it is decompressed only once (see member_batches)
+    """
+    path = Path(path)
+    try:
+        members = index_archive(path)
+    except READ_ERRORS:
+        # compressed (or unreadable, which is reported by the reader)
+        yield WorkUnit(path)
+        return
+
+    # empty members still count
+    total = sum(size + 1 for _, _, size in members)
+    n_units = max(n_splits, math.ceil(total / chunk_size))
+    n_units = max(1, min(n_units, len(members)))
+
+    unit = list()
+    n_bytes = 0
+    bound = 1
+    for member in members:
+        unit.append(member)
+        n_bytes += member[2] + 1
+        if bound < n_units and n_bytes * n_units >= total * bound:
+            yield ArchiveMembers(path, tuple(unit))
+            unit = list()
+            bound = n_bytes * n_units // total + 1
+
+    if unit:
+        yield ArchiveMembers(path, tuple(unit))
+
+
+def member_batches(path, batch_size=BATCH_SIZE):
+    """
+    decompresses a (compressed) tar archive once and yields its members
+    in batches of about batch_size bytes, which can be extracted by
+    several workers
+    """
+    path = Path(path)
+    batch = list()
+    n_bytes = 0
+    with tarfile.open(path, "r|*") as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            data = archive.extractfile(member).read()
+            batch.append((member.name, data))
+            n_bytes += len(data) + 1
+            if n_bytes >= batch_size:
+                yield MemberBatch(path, tuple(batch))
+                batch = list()
+                n_bytes = 0
+
+    if batch:
+        yield MemberBatch(path, tuple(batch))
+
+
+def split_ranges(path, n_splits, chunk_size=CHUNK_SIZE):
+    """
+    returns the boundaries of the byte ranges a file of the given
+    size is split into: at least n_splits ranges (if the file is
+    big enough) none of which bigger than chunk_size.
+    Ranges are aligned to lines by the reader
+    """
+    size = os.path.getsize(path)
+    n_ranges = max(n_splits, math.ceil(size / chunk_size))
+    n_ranges = max(1, min(n_ranges, size))
+
+    boundaries = [size * i // n_ranges for i in range(n_ranges + 1)]
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def parse_boundary(boundary):
+    """
+    parse a document boundary: 'lines:N' (a document every N lines),
+    'blank' (documents separated by blank lines) or 'regex:PATTERN'
+    (documents separated by lines matching PATTERN). Returns a tuple
+    (kind, value) with the number of lines or the compiled pattern
+    """
+    kind, _, value = boundary.partition(":")
+    if kind == "lines":
+        n_lines = int(value)
+        if n_lines > 0:
+            return kind, n_lines
+
+    elif kind == "blank" and not value:
+        return kind, None
+
+    elif kind == "regex" and value:
+        try:
+            return kind, re.compile(value)
+        except re.error as error:
+            raise ValueError(str(error))
+
+    raise ValueError(f"invalid document boundary {boundary!r}")
+
+
+def nth_newline(block, n):
+    """
+    returns the position of the n-th newline of a block of bytes
+    or None if it has less than n newlines
+    """
+    if block.count(b"\n") < n:
+        return None
+
+    position = -1
+    for _ in range(n):
+        position = block.find(b"\n", position + 1)
+    return position
+
+
+def line_ranges(path, n_splits, n_lines, chunk_size=CHUNK_SIZE):
+    """
+    like split_ranges, but every range starts at a line whose number
+    is a multiple of n_lines, so that documents of n_lines lines never
+    cross two ranges. The file is read once to count its lines
+    """
+    size = os.path.getsize(path)
+    targets = [start for start, _ in split_ranges(path, n_splits, chunk_size)]
+
+    boundaries = [0]
+    i = 1
+    line = 0        # number of the line starting at position
+    position = 0
+    wanted = None   # number of the line starting the next range
+    with open(path, "rb") as infile:
+        for block in iter(lambda: infile.read(BLOCK_SIZE), b""):
+            end = position + len(block)
+            while True:
+                if wanted is None:
+                    while i < len(targets) and targets[i] <= boundaries[-1]:
+                        i += 1
+                    if i == len(targets) or targets[i] >= end:
+                        break
+
+                    # first document after the line containing the target
+                    index = line + block.count(b"\n", 0, targets[i] - position)
+                    wanted = (index // n_lines + 1) * n_lines
+
+                newline = nth_newline(block, wanted - line)
+                if newline is None:
+                    break
+                boundaries.append(position + newline + 1)
+                wanted = None
+
+            if wanted is None and i == len(targets):
+                break
+            line += block.count(b"\n")
+            position = end
+
+    if boundaries[-1] < size:
+        boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def text_ranges(path, n_splits, boundary, chunk_size=CHUNK_SIZE):
+    """
+    yields the TextRanges of a text file split for n_splits workers
+    (in ranges of at most chunk_size bytes)
+    """
+    path = Path(path)
+    # compressed files can not be seeked
+    if path.suffix.lower() in COMPRESSED:
+        yield TextRange(path, 0, None, boundary)
+        return
+
+    kind, value = parse_boundary(boundary)
+    if kind == "lines":
+        ranges = line_ranges(path, n_splits, value, chunk_size)
+    else:
+        ranges = split_ranges(path, n_splits, chunk_size)
+
+    for start, end in ranges:
+        yield TextRange(path, start, end, boundary)
+
+
+def work_units(paths, n_splits=1, jsonl_fields=None, boundary=None,
+               chunk_size=None):
+    """
+    given a list of paths, yields the work units to be processed:
+    one unit for each file and (at least) n_splits units for every
+    uncompressed archive, so that the members of a big archive
+    can be processed by several workers. Files which are split are
+    split in units of at most chunk_size bytes (CHUNK_SIZE by default,
+    archives are always split if chunk_size is given).
+    If jsonl_fields (a tuple text field, id field) is given,
+    files are read as JSONL and split in byte ranges. If a document
+    boundary is given, text files are split in byte ranges and
+    their documents are separated by the boundary.
+    Paths which already are work units are kept as they are
+    """
+    split_archives = n_splits > 1 or chunk_size is not None
+    if chunk_size is None:
+        chunk_size = CHUNK_SIZE
+
+    for path in paths:
+        if isinstance(path, UNITS):
+            yield path
+
+        elif jsonl_fields is not None:
+            path = Path(path)
+            # compressed files can not be seeked
+            if path.suffix.lower() in COMPRESSED:
+                yield JsonlRange(path, 0, None, *jsonl_fields)
+            else:
+                for start, end in split_ranges(path, n_splits, chunk_size):
+                    yield JsonlRange(path, start, end, *jsonl_fields)
+
+        elif is_archive(path) and split_archives:
+            yield from archive_units(path, n_splits, chunk_size)
+
+        elif boundary is not None and not is_archive(path):
+            yield from text_ranges(path, n_splits, boundary, chunk_size)
+
+        else:
+            yield WorkUnit(Path(path))
+
+
+def unit_weight(unit, sizes):
+    """
+    estimate the amount of work of a unit (in bytes)
+    given a dictionary path -> file size
+    """
+    if isinstance(unit, (JsonlRange, TextRange)):
+        if unit.end is not None:
+            return unit.end - unit.start
+        return sizes.get(unit.path, 0)
+
+    if isinstance(unit, ArchiveMembers):
+        return sum(size for _, _, size in unit.members)
+
+    if isinstance(unit, MemberBatch):
+        return sum(len(data) for _, data in unit.members)
+
+    if isinstance(unit, WorkUnit):
+        return sizes.get(unit.path, 0)
+
+    return sizes.get(Path(unit), 0)
+
+
+def unit_bytes(unit):
+    """
+    estimate the size of a unit (in bytes) once it is read from the
+    size of its file, None for compressed files (and archives) whose
+    size once read can not be estimated
+    """
+    if isinstance(unit, MemberBatch):
+        return unit_weight(unit, dict())
+
+    path = Path(getattr(unit, "path", unit))
+    if path.suffix.lower() in COMPRESSED or (
+            is_archive(path) and not str(path).lower().endswith(".tar")):
+        return None
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = 0
+    return unit_weight(unit, {path: size})
+
+
+def read_documents(unit):
+    """
+    yields a tuple (name, lines) for every document in the unit,
+    where lines is an iterable of strings. A unit can also be
+    a simple path
+    """
+    if isinstance(unit, JsonlRange):
+        yield from read_jsonl(unit)
+        return
+
+    if isinstance(unit, TextRange):
+        yield from read_text_range(unit)
+        return
+
+    if isinstance(unit, ArchiveMembers):
+        yield from read_members(unit)
+        return
+
+    if isinstance(unit, MemberBatch):
+        for name, data in unit.members:
+            yield f"{unit.path}/{name}", decode_lines(data)
+        return
+
+    if not isinstance(unit, WorkUnit):
+        unit = WorkUnit(Path(unit))
+
+    if is_archive(unit.path):
+        yield from read_archive(unit)
+
+    else:
+        with open_text(unit.path) as infile:
+            yield str(unit.path), infile
+
+
+def load_documents(unit):
+    """
+    reads all documents of a unit into memory (e.g. in a background
+    thread) and returns a list of tuples (name, lines). Lines are None
+    if the document could not be read
+    """
+    documents = list()
+    try:
+        for name, lines in read_documents(unit):
+            try:
+                documents.append((name, list(lines)))
+            except READ_ERRORS:
+                documents.append((name, None))
+    except READ_ERRORS:
+        documents.append((str(unit), None))
+
+    return documents
+
+
+def record_lines(record, text_field):
+    """
+    lazily returns the lines of the text of a JSONL record,
+    invalid records raise an error while the document is being read
+    """
+    if not isinstance(record, dict) or text_field not in record:
+        raise InvalidRecord(f"no field {text_field!r}")
+
+    yield from str(record[text_field]).splitlines()
+
+
+def read_jsonl(unit):
+    """
+    reads the records of a JSONL file whose line starts in the
+    byte range of the unit. A range starting in the middle of a line
+    skips it: the line belongs to the previous range
+    """
+    opener = COMPRESSED.get(unit.path.suffix.lower(), open)
+
+    with opener(unit.path, "rb") as infile:
+        if unit.start > 0:
+            infile.seek(unit.start - 1)
+            infile.readline()
+
+        while unit.end is None or infile.tell() < unit.end:
+            position = infile.tell()
+            line = infile.readline()
+            if not line:
+                break
+
+            line = line.strip()
+            if len(line) == 0:
+                continue
+
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+
+            name = f"{unit.path}@{position}"
+            if isinstance(record, dict) and unit.id_field in record:
+                name = f"{unit.path}:{record[unit.id_field]}"
+
+            yield name, record_lines(record, unit.text_field)
+
+
+def read_line_documents(infile, unit, n_lines):
+    """
+    reads the documents of n_lines lines of a range which starts
+    at the beginning of a document
+    """
+    infile.seek(unit.start)
+    while unit.end is None or infile.tell() < unit.end:
+        position = infile.tell()
+        document = list()
+        while len(document) < n_lines:
+            line = infile.readline()
+            if not line:
+                break
+            document.append(line.decode("utf-8"))
+
+        if not document:
+            break
+        yield f"{unit.path}@{position}", document
+
+
+def read_separated_documents(infile, unit, is_boundary):
+    """
+    reads the documents separated by boundary lines which start
+    in the range. Lines before the first boundary of a range (but
+    the first) belong to a document of the previous range, which is
+    read past the end of its range until the next boundary
+    """
+    started = unit.start == 0
+    if unit.start > 0:
+        infile.seek(unit.start - 1)
+        infile.readline()
+
+    document = list()
+    start = unit.start
+    while True:
+        position = infile.tell()
+        # no document starts in the range, the lines
+        # belong to a document of a previous range
+        if not started and unit.end is not None and position >= unit.end:
+            break
+
+        line = infile.readline()
+        if not line:
+            break
+
+        line = line.decode("utf-8")
+        if not is_boundary(line):
+            if started:
+                document.append(line)
+            continue
+
+        # the boundary belongs to the next range
+        if unit.end is not None and position >= unit.end:
+            break
+
+        if document:
+            yield f"{unit.path}@{start}", document
+        document = list()
+        start = infile.tell()
+        started = True
+
+    if document:
+        yield f"{unit.path}@{start}", document
+
+
+def read_text_range(unit):
+    """
+    reads the documents of a text file which start in the byte
+    range of the unit, the lines of a document are read at once
+    """
+    kind, value = parse_boundary(unit.boundary)
+    opener = COMPRESSED.get(unit.path.suffix.lower(), open)
+
+    with opener(unit.path, "rb") as infile:
+        if kind == "lines":
+            yield from read_line_documents(infile, unit, value)
+        elif kind == "blank":
+            yield from read_separated_documents(
+                infile, unit, lambda line: not line.strip()
+            )
+        else:
+            yield from read_separated_documents(infile, unit, value.search)
+
+
+def decode_lines(data):
+    """
+    lazily decodes the content of an archive member, decoding
+    errors are raised while the document is being read
+    """
+    yield from data.decode("utf-8").splitlines()
+
+
+def read_archive(unit):
+    """
+    streams the members of a tar archive. The archive is read
+    sequentially, so compressed archives are never decompressed to disk
+    """
+    with tarfile.open(unit.path, "r|*") as archive:
+        for member in archive:
+            if member.isfile():
+                name = f"{unit.path}/{member.name}"
+                data = archive.extractfile(member).read()
+                yield name, decode_lines(data)
+
+
+def read_members(unit):
+    """
+    reads the members of an uncompressed tar archive selected
+    by the unit at their offsets
+    """
+    with open(unit.path, "rb") as infile:
+        for name, offset, size in unit.members:
+            infile.seek(offset)
+            yield f"{unit.path}/{name}", decode_lines(infile.read(size))
@@ -9,12 +9,79 @@ saves a list of accepted and rejected candidates
 import numpy as np
 
 from src.ahoc_automaton import State
+from src.executors import count_matches, executor_pool
 from src.utils import progress_bar
+from src.vocabulary import ArrayMapping, Postings, segment_sums
+
+
+# candidates are pruned only if their bound is below theta by more
+# than this margin, so that rounding errors never change the result
+PRUNING_MARGIN = 1e-9
+
+# candidates of a task when the domain consensus is
+# calculated by the workers of a pool
+SCORING_CHUNK = 1 << 18
+
+
+def consensus(task):
+    """
+    domain consensus of consecutive candidates given their term
+    frequencies (tfs), their number of documents (lengths)
+    and their total frequencies
+    """
+    tfs, lengths, totals = task
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+
+    PtD = tfs / np.repeat(totals, lengths)
+    logged = PtD * np.log2(1 / PtD)
+    return segment_sums(logged, offsets)
+
+
+def consensus_tasks(tfs, lengths, totals, size=None):
+    """
+    divide the candidates in tasks of (at most) size candidates
+    (default SCORING_CHUNK)
+    """
+    if size is None:
+        size = SCORING_CHUNK
+    ends = np.cumsum(lengths)
+    for start in range(0, len(lengths), size):
+        stop = min(start + size, len(lengths))
+        first = ends[start-1] if start > 0 else 0
+        yield (
+            tfs[first:ends[stop-1]], lengths[start:stop], totals[start:stop]
+        )
+
+
+def count_reference_union(discriminators, lines, executor="serial"):
+    """
+    count the candidates of several discriminators in the lines of the
+    reference corpus with a single automaton, so that the corpus is
+    read only once. Every discriminator gets the counts of the union
+    but only uses the counts of its own candidates
+    """
+    union = set()
+    for discriminator in discriminators:
+        union.update(discriminator.candidates)
+
+    matcher = State.create_automaton(union)
+    count_matches(matcher, lines, executor)
+
+    for discriminator in discriminators:
+        discriminator.reference_frequency = matcher.counts
+
+    return matcher.counts
 
 
 class Discriminator:
 
-    def __init__(self, candidates, min_freq, clean_corpus=True):
+    def __init__(
+            self, candidates, min_freq, clean_corpus=True,
+            reference_frequency=None, reference_index=None,
+            count_reference=True):
+        if not isinstance(candidates, Postings):
+            candidates = Postings.from_dict(candidates)
         self.candidates = candidates
         self.matcher = None
         self.domain_frequency = {}
@@ -23,11 +90,37 @@ class Discriminator:
         self.rejected_candidates = set()
         self.domain_relevance = {}
         self.domain_consensus = {}
-        self.domain_conditional_probs = {}
-        self.reference_conditional_probs = {}
+        self.pruned = None
         if clean_corpus:
             self.clean_corpus(min_freq)
-        self.initialize_ahoc()
+        self.initialize_arrays()
+
+        # reference frequencies can be given (e.g. already counted
+        # in the distributed mode), looked up in an index of the
+        # reference corpus or set later (count_reference is False,
+        # e.g. counted for several domains at once), otherwise
+        # they are counted with the automaton
+        if reference_frequency is not None:
+            self.reference_frequency = reference_frequency
+        elif reference_index is not None:
+            self.reference_frequency = reference_index.frequencies(
+                self.candidates.vocabulary
+            )
+        elif count_reference:
+            self.initialize_ahoc()
+
+    def initialize_arrays(self):
+        """
+        conditional probabilities are stored in arrays indexed
+        by the row of each candidate in the vocabulary
+        """
+        vocabulary = self.candidates.vocabulary
+        self.domain_conditional_probs = ArrayMapping(
+            vocabulary, np.zeros(len(vocabulary))
+        )
+        self.reference_conditional_probs = ArrayMapping(
+            vocabulary, np.zeros(len(vocabulary))
+        )
 
     def clean_corpus(self, min_freq):
         """
@@ -37,20 +130,16 @@ class Discriminator:
         This method also calculates the absolute frequency of
         each valid candidate in the domain corpus
         """
+        totals = self.candidates.totals()
 
-        # collect words with lower frequency than threshold
-        words = list(self.candidates.keys())
-
-        for word in words:
-            abs_freq = sum(self.candidates[word])
+        # eliminate invalid entries
+        keep = totals >= min_freq
+        self.candidates = self.candidates.select(keep)
 
-            # eliminate invalid entries
-            if abs_freq < min_freq:
-                del self.candidates[word]
-
-            # save absolute frequency of valid candidates
-            else:
-                self.domain_frequency[word] = abs_freq
+        # save absolute frequency of valid candidates
+        self.domain_frequency = ArrayMapping(
+            self.candidates.vocabulary, totals[keep]
+        )
 
     def initialize_ahoc(self):
         """
@@ -130,47 +219,167 @@ class Discriminator:
 
         return total_domain, total_reference
 
-    def calculate_dr_dc(self):
+    def reference_array(self):
+        """
+        returns the reference frequency of each candidate as
+        an array indexed by the candidate rows
+        """
+        if isinstance(self.reference_frequency, ArrayMapping):
+            return self.reference_frequency.array
+
+        return np.fromiter(
+            (self.reference_frequency.get(candidate, 0)
+             for candidate in self.candidates.vocabulary),
+            dtype=np.int64, count=len(self.candidates)
+        )
+
+    def calculate_dr_dc(self, alpha=None, theta=None, executor=None):
         """
         Calculate for each candidate domain relevance
         and consensus and saves them in the respective
-        dictionary
+        dictionary.
+
+        If alpha and theta are given, domain consensus is not
+        calculated for candidates which can not reach theta:
+        DC is at most log2 of the number of documents containing
+        the candidate, so f <= alpha * DR + (1 - alpha) * log2(df).
+        These candidates are marked in pruned (their DC is nan)
+        and are neither accepted nor rejected by generate_list.
+
+        If an executor (e.g. a WorkerPool) is given, the domain
+        consensus of many candidates is calculated in chunks
+        by its workers
         """
         # copy absolute frequency from aho-corasick automaton
-        self.reference_frequency = self.matcher.counts
-
-        candidates = self.candidates.keys()
-        tot_candidates = len(candidates)
-
-        total_domain, total_reference = self.calculate_total()
-
-        for i, candidate in enumerate(candidates):
-
-            # CONDITIONAL PROBABILITIES
-            # domain corpus
-            domain_prob = self.cond_prob(
-                candidate, self.domain_frequency, total_domain
+        if self.matcher is not None:
+            self.reference_frequency = self.matcher.counts
+
+        vocabulary = self.candidates.vocabulary
+        domain = self.candidates.totals()
+        reference = self.reference_array()
+
+        total_domain = domain.sum()
+        total_reference = reference.sum()
+
+        # CONDITIONAL PROBABILITIES
+        domain_probs = self.domain_conditional_probs.array
+        domain_probs[:] = domain / total_domain if total_domain else 0
+
+        reference_probs = self.reference_conditional_probs.array
+        if total_reference > 0:
+            reference_probs[:] = reference / total_reference
+
+        # DOMAIN RELEVANCE
+        dr = domain_probs / (domain_probs + reference_probs)
+        self.domain_relevance = ArrayMapping(vocabulary, dr)
+
+        # PRUNING with the upper bound of f
+        lengths = self.candidates.lengths()
+        self.pruned = np.zeros(len(vocabulary), dtype=bool)
+        if alpha is not None and theta is not None:
+            bound = alpha * dr + (1 - alpha) * np.log2(lengths)
+            self.pruned = bound < theta - PRUNING_MARGIN
+
+        # DOMAIN CONSENSUS
+        dc = np.full(len(vocabulary), np.nan)
+        exact = ~self.pruned
+        if exact.any():
+            task = (
+                self.candidates.tfs[np.repeat(exact, lengths)],
+                lengths[exact],
+                domain[exact]
             )
-            self.domain_conditional_probs[candidate] = domain_prob
+            if executor is None or len(task[1]) <= SCORING_CHUNK:
+                dc[exact] = consensus(task)
+            else:
+                with executor_pool(executor) as pool:
+                    dc[exact] = np.concatenate(
+                        list(pool.imap(consensus, consensus_tasks(*task)))
+                    )
+        self.domain_consensus = ArrayMapping(vocabulary, dc)
 
-            # reference corpus
-            if candidate in self.reference_frequency:
-                ref_prob = self.cond_prob(
-                    candidate, self.reference_frequency, total_reference
+        progress_bar(1, 1, prefix='Calculating', fixed_len=True)
+
+    def bootstrap(
+            self, documents, n_documents, alpha, candidates,
+            n_resamples=200, confidence=0.95, seed=0):
+        """
+        confidence intervals of the f-values of the given candidates
+        (e.g. the keywords of a sample of the domain corpus): the
+        documents are resampled with replacement n_resamples times
+        and DR, DC and f are calculated on every resample (reference
+        frequencies are fixed). documents are postings with the index
+        of the document of every frequency (see Extractor.indexed).
+        Returns a dictionary candidate -> (low, high)
+        """
+        rng = np.random.default_rng(seed)
+        candidates = list(candidates)
+        if not candidates:
+            return dict()
+
+        # document of each frequency of the (remaining) candidates
+        keep = np.isin(
+            documents.vocabulary.keys, self.candidates.vocabulary.keys
+        )
+        document_ids = documents.select(keep).tfs
+
+        # total frequency of the candidates in each document
+        document_totals = np.bincount(
+            document_ids, weights=self.candidates.tfs, minlength=n_documents
+        )
+
+        reference = self.reference_array()
+        total_reference = reference.sum()
+
+        # postings of the requested candidates
+        tfs = [self.candidates[candidate] for candidate in candidates]
+        ids = [documents[candidate] for candidate in candidates]
+        lengths = np.array([len(tf) for tf in tfs], dtype=np.int64)
+        offsets = np.zeros(len(candidates) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        tfs = np.concatenate(tfs + [np.zeros(0)]).astype(float)
+        ids = np.concatenate(ids + [np.zeros(0, dtype=np.int64)])
+        tf_log_tf = tfs * np.log2(tfs)
+
+        reference_probs = np.zeros(len(candidates))
+        if total_reference > 0:
+            rows = [
+                self.candidates.vocabulary.index[candidate]
+                for candidate in candidates
+            ]
+            reference_probs = reference[rows] / total_reference
+
+        f_values = np.empty((n_resamples, len(candidates)))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for i in range(n_resamples):
+                weights = np.bincount(
+                    rng.integers(0, n_documents, n_documents),
+                    minlength=n_documents
                 )
-                self.reference_conditional_probs[candidate] = ref_prob
+                w = weights[ids]
+                totals = segment_sums(w * tfs, offsets)
+                entropy = segment_sums(w * tf_log_tf, offsets)
 
-            # DOMAIN RELEVANCE
-            dr = self.calculate_domain_relevance(candidate)
-            self.domain_relevance[candidate] = dr
+                domain_probs = totals / (weights @ document_totals)
+                dr = domain_probs / (domain_probs + reference_probs)
+                dc = np.log2(totals) - entropy / totals
+                f_values[i] = self.calculate_f_value(dr, dc, alpha)
 
-            # DOMAIN CONSENSUS
-            consensus = self.calculate_domain_consensus(candidate)
-            self.domain_consensus[candidate] = consensus
+        # candidates missing from a resample have no f-value
+        f_values[~np.isfinite(f_values)] = np.nan
+        tail = (1 - confidence) / 2 * 100
+        low, high = np.nanpercentile(f_values, [tail, 100 - tail], axis=0)
 
-            progress_bar(
-                i+1, tot_candidates, prefix='Calculating', fixed_len=True
-            )
+        return dict(zip(candidates, zip(low.tolist(), high.tolist())))
+
+    def pruning_rate(self):
+        """
+        returns the number of candidates and the number of
+        candidates pruned by calculate_dr_dc
+        """
+        if self.pruned is None:
+            return len(self.candidates), 0
+        return len(self.pruned), int(np.count_nonzero(self.pruned))
 
     def calculate_f_value(self, dom_rel, dom_cons, alpha):
         """
@@ -190,20 +399,26 @@ class Discriminator:
         It then saves the candidate and its f-value
         accordingly
         """
-        candidates = self.domain_relevance.keys()
-        tot_candidates = len(candidates)
-
-        for i, candidate in enumerate(candidates):
-            dr = self.domain_relevance[candidate]
-            consensus = self.domain_consensus[candidate]
-            f_value = self.calculate_f_value(dr, consensus, alpha)
-
+        vocabulary = self.domain_relevance.vocabulary
+        f_values = self.calculate_f_value(
+            self.domain_relevance.values(),
+            self.domain_consensus.values(),
+            alpha
+        )
+
+        pruned = self.pruned
+        if pruned is None:
+            pruned = np.zeros(len(vocabulary), dtype=bool)
+
+        # strings are resolved only here, for the output
+        for candidate, f_value, is_pruned in zip(
+                vocabulary, f_values.tolist(), pruned.tolist()):
+            if is_pruned:
+                continue
             if f_value < theta:
                 self.rejected_candidates.add((candidate, f_value))
             else:
                 self.final_candidates.add((candidate, f_value))
 
-            if verbose:
-                progress_bar(
-                    i+1, tot_candidates, prefix='Generating', fixed_len=True
-                )
+        if verbose:
+            progress_bar(1, 1, prefix='Generating', fixed_len=True)
@@ -0,0 +1,298 @@
+"""
+The executors run the tasks of the extraction, of the reference
+counting and of the scoring: in worker processes (multiprocessing,
+the default), in threads (which share the lexicons, the tagger and
+the automaton, for free-threaded Python builds) or one after the
+other in the calling process (serial). All of them are used like
+multiprocessing.Pool.
+
+A WorkerPool starts the workers once and is reused by all the stages
+of a run: worker processes are started by a forkserver which already
+imported NLTK and they load the lexicons and the tagger before the
+first task. The time spent starting the workers is measured
+separately from the time spent in tasks.
+
+Tasks never modify shared objects: extraction tasks run on a copy of
+the extractor and reference counting tasks count the matches of a
+chunk of lines in a new dictionary, which is added to the counts of
+the automaton by the calling process
+"""
+
+import contextlib
+import functools
+import multiprocessing as mp
+import os
+import tempfile
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from src.ahoc_automaton import FlatAutomaton, State
+
+
+# lines of the reference corpus matched by a task
+CHUNK_LINES = 10000
+
+# worker processes of a WorkerPool are started by a forkserver
+# (if the platform has one) which already imported these modules
+START_METHOD = (
+    "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+)
+PRELOAD = ["nltk", "numpy", "src.extractor", "src.discriminator"]
+
+
+class SerialPool:
+    """
+    runs the tasks in the calling process (same interface
+    as multiprocessing.Pool)
+    """
+
+    def __init__(self, processes=None, initializer=None, initargs=()):
+        if initializer is not None:
+            initializer(*initargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def imap(self, func, iterable):
+        return map(func, iterable)
+
+    def imap_unordered(self, func, iterable):
+        return map(func, iterable)
+
+    def close(self):
+        pass
+
+    def join(self):
+        pass
+
+
+EXECUTORS = {
+    "process": mp.Pool,
+    "thread": ThreadPool,
+    "serial": SerialPool,
+}
+
+
+def start_worker(ready, warm_up):
+    """
+    initializer of the worker processes of a WorkerPool: run
+    warm_up and send its duration to the calling process
+    """
+    start = time.perf_counter()
+    if warm_up is not None:
+        warm_up()
+    ready.put(time.perf_counter() - start)
+
+
+class WorkerPool:
+    """
+    a pool of workers (processes, threads or serial) started on
+    first use and reused until it is closed. warm_up (a function)
+    is run once by every worker process, or once by the calling
+    process for threads and serial
+    """
+
+    def __init__(self, executor="process", warm_up=None, processes=None):
+        self.executor = executor
+        self.warm_up = warm_up
+        self.processes = processes or n_workers(executor)
+        self.pool = None
+        self.started = False
+        self.warm_up_time = 0.0
+        self.task_time = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def start(self):
+        """
+        start the workers and wait until all of them are ready
+        """
+        if self.pool is not None:
+            return
+
+        self.started = True
+        start = time.perf_counter()
+        if self.executor == "process":
+            context = mp.get_context(START_METHOD)
+            if START_METHOD == "forkserver":
+                context.set_forkserver_preload(PRELOAD)
+            ready = context.SimpleQueue()
+            self.pool = context.Pool(
+                self.processes, initializer=start_worker,
+                initargs=(ready, self.warm_up)
+            )
+            for _ in range(self.processes):
+                ready.get()
+        else:
+            if self.warm_up is not None:
+                self.warm_up()
+            self.pool = EXECUTORS[self.executor](self.processes)
+        self.warm_up_time += time.perf_counter() - start
+
+    def timed(self, results):
+        start = time.perf_counter()
+        try:
+            yield from results
+        finally:
+            self.task_time += time.perf_counter() - start
+
+    def imap(self, func, iterable):
+        self.start()
+        return self.timed(self.pool.imap(func, iterable))
+
+    def imap_unordered(self, func, iterable):
+        self.start()
+        return self.timed(self.pool.imap_unordered(func, iterable))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def __str__(self):
+        return (
+            f"{self.processes} {self.executor} worker(s): warm-up "
+            f"{self.warm_up_time:.2f} s, tasks {self.task_time:.2f} s"
+        )
+
+
+class BoundedTasks:
+    """
+    the tasks of a pool, created lazily (e.g. read from a compressed
+    archive): a pool takes all the tasks of an iterable as soon as it
+    can, so a task is only given after the result of an earlier one
+    was received (done), at most limit tasks are pending
+    """
+
+    def __init__(self, tasks, limit):
+        self.tasks = tasks
+        self.slots = threading.Semaphore(limit)
+        self.closed = False
+        self.n_tasks = 0
+
+    def __iter__(self):
+        for task in self.tasks:
+            self.slots.acquire()
+            if self.closed:
+                return
+            self.n_tasks += 1
+            yield task
+
+    def done(self):
+        """
+        call for every result received
+        """
+        self.slots.release()
+
+    def close(self):
+        """
+        stop giving tasks (e.g. the results are not read anymore)
+        """
+        self.closed = True
+        self.slots.release()
+
+
+def backend(executor):
+    """
+    returns the name of an executor (or of the executor of a WorkerPool)
+    """
+    if isinstance(executor, WorkerPool):
+        return executor.executor
+    return executor
+
+
+def n_workers(executor):
+    """
+    returns the number of tasks run at the same time by an executor
+    """
+    if isinstance(executor, WorkerPool):
+        return executor.processes
+    if executor == "serial":
+        return 1
+    return os.cpu_count() or 1
+
+
+def executor_pool(executor):
+    """
+    returns a pool for the executor: a WorkerPool is used as it
+    is (and not closed), a name starts a new pool
+    """
+    if isinstance(executor, WorkerPool):
+        return contextlib.nullcontext(executor)
+    return EXECUTORS[executor](n_workers(executor))
+
+
+def chunks(lines, size):
+    """
+    divide an iterable of lines in lists of (at most) size lines
+    """
+    chunk = list()
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == size:
+            yield chunk
+            chunk = list()
+    if chunk:
+        yield chunk
+
+
+# automaton loaded by a worker process (path, automaton)
+_matcher = (None, None)
+
+
+def count_chunk(matcher, lines):
+    """
+    count the matches of a chunk of lines, matcher is an automaton
+    or (in worker processes) the path of a saved FlatAutomaton,
+    which is loaded once by every worker
+    """
+    global _matcher
+    if isinstance(matcher, str):
+        path, automaton = _matcher
+        if path != matcher:
+            automaton = FlatAutomaton.load(matcher)
+            _matcher = (matcher, automaton)
+        matcher = automaton
+
+    return matcher.count_matches(lines, True)
+
+
+def count_matches(matcher, lines, executor="serial", chunk_size=CHUNK_LINES):
+    """
+    count the (case insensitive) matches of the patterns of the
+    automaton in the given lines with an executor (a name or a
+    WorkerPool), the counts are added to matcher.counts. Worker
+    processes load a FlatAutomaton saved in a temporary file,
+    threads share the automaton
+    """
+    # lines are read by the calling process: only a few chunks
+    # per worker are submitted at a time
+    batches = chunks(chunks(lines, chunk_size), n_workers(executor) * 4)
+    counts = matcher.counts
+
+    with tempfile.TemporaryDirectory() as tmpdir, \
+            executor_pool(executor) as pool:
+        shared = matcher
+        if backend(executor) == "process":
+            if isinstance(matcher, State):
+                matcher = matcher.compile()
+            shared = os.path.join(tmpdir, "automaton.npz")
+            matcher.save(shared)
+
+        for batch in batches:
+            for partial in pool.imap_unordered(
+                    functools.partial(count_chunk, shared), batch):
+                for pattern, count in partial.items():
+                    counts[pattern] = counts.get(pattern, 0) + count
+
+    return counts
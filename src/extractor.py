@@ -5,27 +5,95 @@ a file occurrency dictionary with candidates and their
 occurrence within the documents of the corpus
 """
 
-import multiprocessing as mp
+import copy
+import functools
+import heapq
+import itertools
+import os
+import pickle
+import random
 import string
+import tempfile
+from pathlib import Path
 
 import nltk
-
-from src.utils import progress_bar
+import numpy as np
+
+from src.corpus import (
+    READ_ERRORS, is_compressed_archive, load_documents, member_batches,
+    read_documents, unit_weight, work_units
+)
+from src.executors import BoundedTasks, executor_pool, n_workers
+from src.prefetch import Prefetcher, ReadTimes
+from src.spill import RunWriter, merge_runs, write_run
+from src.tagged_store import StoreWriter, TaggedStore
+from src.tokenizers import NltkTokenizer
+from src.utils import fingerprint, progress_bar
+from src.vocabulary import Postings
+
+
+@functools.lru_cache(maxsize=None)
+def load_lexicons():
+    """
+    returns the english words (used to validate candidates) and
+    the stopwords, loaded once by every process
+    """
+    return (
+        set(nltk.corpus.words.words()),
+        set(nltk.corpus.stopwords.words("english"))
+    )
+
+
+def warm_up():
+    """
+    load the lexicons, the tokenizers and the tagger,
+    e.g. in a new worker process before its first task
+    """
+    try:
+        load_lexicons()
+        NltkTokenizer().sent_tokenize("Warm up.")
+        nltk.pos_tag(["warm", "up"])
+    except LookupError:
+        # missing data is reported by the first task
+        pass
 
 
 class Extractor:
 
+    # noun phrases: noun, adjective or participle followed by a noun
+    grammar = "NP:{(<NN.*>|<JJ.*>|<VB(G|D|N)>)<NN.*>}"
+
     def __init__(
             self, min_sen, max_cap, min_tok,
-            max_tok, not_paragraph, validation):
+            max_tok, not_paragraph, validation, memory_limit=None,
+            tokenizer=None, prefetch=0, executor="process"):
         self.min_sen = min_sen
         self.max_cap = max_cap
         self.min_tok = min_tok
         self.max_tok = max_tok
         self.not_paragraph = not_paragraph
         self.validation = validation
-        self.validation_dictionary = set(nltk.corpus.words.words())
-        self.stopwords = set(nltk.corpus.stopwords.words("english"))
+        self.memory_limit = memory_limit
+        if tokenizer is None:
+            tokenizer = NltkTokenizer()
+        self.tokenizer = tokenizer
+        self.prefetch = prefetch
+        self.executor = executor
+        self.read_times = ReadTimes()
+        self.validation_dictionary, self.stopwords = load_lexicons()
+
+    def __getstate__(self):
+        # lexicons are not sent to the workers, which load them once,
+        # and workers run their tasks without a pool
+        state = self.__dict__.copy()
+        del state["validation_dictionary"]
+        del state["stopwords"]
+        state["executor"] = "serial"
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.validation_dictionary, self.stopwords = load_lexicons()
 
     @staticmethod
     def split_lists(list, n):
@@ -36,6 +104,46 @@ class Extractor:
         for i in range(0, n):
             yield list[i::n]
 
+    @staticmethod
+    def split_balanced(list, n, sizes):
+        """
+        divide a list of work units in n lists with (about) the same
+        amount of bytes: the biggest units are assigned first,
+        each one to the list with the smallest load
+        """
+        weighted = sorted(
+            list, key=lambda unit: unit_weight(unit, sizes), reverse=True
+        )
+        sublists = [[] for _ in range(n)]
+        loads = [(0, i) for i in range(n)]
+
+        for unit in weighted:
+            load, i = heapq.heappop(loads)
+            sublists[i].append(unit)
+            heapq.heappush(loads, (load + unit_weight(unit, sizes), i))
+
+        return sublists
+
+    @staticmethod
+    def sample_units(units, fraction, seed=0):
+        """
+        select a random fraction of the work units, stratified by
+        directory: every directory keeps the same fraction of its
+        units (at least one). The order of the units is kept
+        """
+        strata = dict()
+        for i, unit in enumerate(units):
+            directory = Path(getattr(unit, "path", unit)).parent
+            strata.setdefault(directory, list()).append(i)
+
+        rng = random.Random(seed)
+        selected = list()
+        for indices in strata.values():
+            k = max(1, round(fraction * len(indices)))
+            selected += rng.sample(indices, k)
+
+        return [units[i] for i in sorted(selected)]
+
     def keep_paragraph(self, text):
         """
         decides if a paragraph should be kept.
@@ -51,36 +159,58 @@ class Extractor:
 
         If conditions are met, the paragraph can be used to extract keywords
         """
-        sentences = nltk.sent_tokenize(text)
-        keep = True
+        sentences = self.tokenizer.sent_tokenize(text)
 
         # lenght of sentence must be higher than s
         if len(sentences) >= self.min_sen:
             return sentences
 
-        # paragraph contains at least c percent of capizalized words
-        tokens = nltk.word_tokenize(text)
+        tokens = self.tokenizer.word_tokenize(text)
+        if self.keep_statistics(*self.paragraph_statistics(tokens)):
+            return sentences
+
+        return False
+
+    @staticmethod
+    def paragraph_statistics(tokens):
+        """
+        returns the number of tokens and capitalized tokens of a
+        paragraph and whether it ends with punctuation
+        """
         capitalized = [tok for tok in tokens if tok[0].isupper()]
-        ratio = (len(capitalized) * 100) / len(tokens)
+        ends_with_punctuation = (
+            len(tokens) > 0 and tokens[-1] in string.punctuation
+        )
+        return len(tokens), len(capitalized), ends_with_punctuation
+
+    def keep_statistics(self, n_tokens, n_capitalized, ends_with_punctuation):
+        """
+        decides if a paragraph with less than s sentences
+        should be kept given its statistics
+        """
+        keep = True
+
+        if n_tokens == 0:
+            return False
+
+        # paragraph contains at least c percent of capizalized words
+        ratio = (n_capitalized * 100) / n_tokens
         if ratio < self.max_cap:
             keep = False
 
         # minimum number of tokens
-        if len(tokens) < self.min_tok:
+        if n_tokens < self.min_tok:
             keep = False
 
         # maximum number of tokens
-        if len(tokens) > self.max_tok:
+        if n_tokens > self.max_tok:
             keep = False
 
         # ends with punctation
-        if tokens[-1] not in string.punctuation:
+        if not ends_with_punctuation:
             keep = False
 
-        if keep:
-            return sentences
-
-        return False
+        return keep
 
     def preprocess(self, sentences):
         """
@@ -88,7 +218,9 @@ class Extractor:
         and returns a tagged sentences
         """
         # tokenize
-        tok_sents = [nltk.word_tokenize(sentence) for sentence in sentences]
+        tok_sents = [
+            self.tokenizer.word_tokenize(sentence) for sentence in sentences
+        ]
 
         # POS-tag sentences
         tagged = [nltk.pos_tag(sent) for sent in tok_sents]
@@ -166,8 +298,7 @@ class Extractor:
         of of POS tagged sentences as an argument
         """
 
-        grammar = "NP:{(<NN.*>|<JJ.*>|<VB(G|D|N)>)<NN.*>}"
-        cp = nltk.RegexpParser(grammar)
+        cp = nltk.RegexpParser(self.grammar)
 
         for sentence in POS_sents:
             parsed = cp.parse(sentence)
@@ -179,86 +310,545 @@ class Extractor:
                 if good_candidate:
                     yield good_candidate
 
-    def single(self, paths, verbose=False):
+    def extract_document(self, lines):
+        """
+        given the lines of a document, extracts the candidates
+        and returns a dictionary with their frequency in the document
+        """
+        filedict = dict()
+
+        for line in lines:
+            line = line.strip()
+            if len(line) > 0:
+
+                # extract sentences
+                if self.not_paragraph:
+                    sentences = self.tokenizer.sent_tokenize(line)
+                else:
+                    sentences = self.keep_paragraph(line)
+
+                # extract candidates from sentences
+                if sentences:
+                    preprocessed = self.preprocess(sentences)
+                    candidates = self.extract_words(preprocessed)
+
+                    for candidate in candidates:
+                        if candidate not in filedict:
+                            filedict[candidate] = 0
+                        filedict[candidate] += 1
+
+        return filedict
+
+    def tag_documents(self, paths, verbose=False):
         """
-        given a list of paths the function opens each file and extracts
-        potential candidates from them. For each text the function
-        calculates document frequency and saves it in self.candidates
+        tokenize and POS-tag every paragraph of the given paths
+        (or work units) and return them in a TaggedStore. Paragraphs
+        are not filtered, so that the store can be used with any
+        extraction parameter
         """
         errors = list()
-        final = dict()
+        writer = StoreWriter(self.tokenizer.name)
 
-        for i, filepath in enumerate(paths):
-            # process single file
+        for i, (unit, documents) in enumerate(self.read_units(paths)):
             try:
-                filedict = dict()
-                with open(filepath, "r", encoding="utf-8") as infile:
-                    for line in infile:
-                        line = line.strip()
-                        if len(line) > 0:
-
-                            # extract sentences
-                            if self.not_paragraph:
-                                sentences = nltk.sent_tokenize(line)
-                            else:
-                                sentences = self.keep_paragraph(line)
-
-                            # extract candidates from sentences
-                            if sentences:
-                                preprocessed = self.preprocess(sentences)
-                                candidates = self.extract_words(preprocessed)
-
-                                for candidate in candidates:
-                                    if candidate not in filedict:
-                                        filedict[candidate] = 0
-                                    filedict[candidate] += 1
-
-                # copy file results to final
-                for candidate, frequency in filedict.items():
-                    if candidate not in final:
-                        final[candidate] = list()
-                    final[candidate].append(frequency)
-
-                if verbose:
+                for name, lines in documents:
+                    if lines is None:
+                        errors.append(name)
+                        continue
+
+                    # a document is added only if it was read completely
+                    paragraphs = list()
+                    try:
+                        for line in lines:
+                            line = line.strip()
+                            if len(line) > 0:
+                                paragraphs.append(self.tag_paragraph(line))
+                    except READ_ERRORS:
+                        errors.append(name)
+                        continue
+
+                    for statistics, tagged in paragraphs:
+                        writer.add_paragraph(statistics, tagged)
+                    writer.end_document()
+
+            except READ_ERRORS:
+                errors.append(str(unit))
+
+            if verbose:
+                progress_bar(
+                    i+1, len(paths), prefix="Tagging", fixed_len=True
+                )
+
+        return writer.close(), errors
+
+    def tag_paragraph(self, text):
+        """
+        returns the statistics used by keep_paragraph and
+        the tagged sentences of a paragraph
+        """
+        tokens = self.tokenizer.word_tokenize(text)
+        sentences = self.tokenizer.sent_tokenize(text)
+        return self.paragraph_statistics(tokens), self.preprocess(sentences)
+
+    def tag_multi(self, corpus, sizes=None):
+        """
+        create the TaggedStore of a corpus using multiprocessing
+        """
+        sublists = self.partition(corpus, sizes)
+        stores = list()
+        errors = list()
+
+        tasks, batches, n_tasks = self.pool_tasks(sublists, errors)
+        with executor_pool(self.executor) as pool:
+            tag = functools.partial(self.run_task, "tag_documents")
+            try:
+                outputs = pool.imap_unordered(tag, tasks)
+                for i, ((store, error), times) in enumerate(outputs):
+                    batches.done()
                     progress_bar(
-                        i+1, len(paths), prefix="Extracting", fixed_len=True
+                        i+1, n_tasks + batches.n_tasks, prefix="Tagging",
+                        fixed_len=True
                     )
+                    self.read_times.add(times)
+                    stores.append(store)
+                    errors += error
+            finally:
+                batches.close()
+
+        return TaggedStore.merge(stores), errors
+
+    def extract_stored(self, store, verbose=False):
+        """
+        extract candidates from a TaggedStore: only the paragraph
+        filter, the chunking and the candidate filter are applied.
+        Returns the same dictionary as single
+        """
+        final = dict()
+
+        for document in range(len(store)):
+            filedict = dict()
+
+            for n_sentences, statistics, paragraph in store.paragraphs(
+                    document):
+                keep = (
+                    self.not_paragraph
+                    or n_sentences >= self.min_sen
+                    or self.keep_statistics(*statistics)
+                )
+                if not keep or n_sentences == 0:
+                    continue
+
+                sentences = store.sentences(paragraph)
+                for candidate in self.extract_words(sentences):
+                    if candidate not in filedict:
+                        filedict[candidate] = 0
+                    filedict[candidate] += 1
+
+            for candidate, frequency in filedict.items():
+                if candidate not in final:
+                    final[candidate] = list()
+                final[candidate].append(frequency)
+
+            if verbose:
+                progress_bar(
+                    document+1, len(store), prefix="Extracting",
+                    fixed_len=True
+                )
+
+        return final
+
+    def read_units(self, paths):
+        """
+        yields every unit with its documents (tuples name, lines),
+        if prefetch is set the next prefetch units (but no compressed
+        unit) are loaded in background threads (lines are None if a
+        document could not be read)
+        """
+        if self.prefetch:
+            yield from Prefetcher(
+                paths, load_documents, self.prefetch, times=self.read_times,
+                stream=read_documents
+            )
+        else:
+            for unit in paths:
+                yield unit, read_documents(unit)
+
+    def run_task(self, method, paths, **kwargs):
+        """
+        run a method of the extractor in a worker and return its
+        result with the read times of the worker. The method runs
+        on a copy of the extractor (sharing lexicons and tokenizer),
+        so that tasks run by threads do not share the read times
+        """
+        worker = copy.copy(self)
+        worker.read_times = ReadTimes()
+        result = getattr(worker, method)(paths, **kwargs)
+        return result, worker.read_times
+
+    def documents(self, paths, errors, verbose=False, with_units=False):
+        """
+        given a list of paths (or work units) the function reads each
+        document and yields the dictionaries of its candidates (with
+        their unit if with_units is set), documents that can not be
+        read are added to errors
+        """
+        for i, (unit, documents) in enumerate(self.read_units(paths)):
+            # process single file (or archive members)
+            try:
+                for name, lines in documents:
+                    if lines is None:
+                        errors.append(name)
+                        continue
+
+                    try:
+                        filedict = self.extract_document(lines)
+                    except READ_ERRORS:
+                        errors.append(name)
+                        continue
+
+                    yield (unit, filedict) if with_units else filedict
+
+            except READ_ERRORS:
+                errors.append(str(unit))
 
-            except (OSError, UnicodeDecodeError):
-                errors.append(filepath)
+            if verbose:
+                progress_bar(
+                    i+1, len(paths), prefix="Extracting", fixed_len=True
+                )
+
+    def single(self, paths, verbose=False):
+        """
+        given a list of paths (or work units) the function reads each
+        document and extracts potential candidates from them.
+        For each document the function calculates document frequency
+        and returns them in a dictionary
+        """
+        errors = list()
+        final = dict()
+
+        for filedict in self.documents(paths, errors, verbose):
+            # copy document results to final
+            for candidate, frequency in filedict.items():
+                if candidate not in final:
+                    final[candidate] = list()
+                final[candidate].append(frequency)
 
         return final, errors
 
+    def indexed(self, paths, verbose=False):
+        """
+        like single, but also returns for every candidate the index
+        of each document (in the order of its frequencies) and the
+        number of documents
+        """
+        errors = list()
+        final = dict()
+        documents = dict()
+        n_documents = 0
+
+        for filedict in self.documents(paths, errors, verbose):
+            for candidate, frequency in filedict.items():
+                if candidate not in final:
+                    final[candidate] = list()
+                    documents[candidate] = list()
+                final[candidate].append(frequency)
+                documents[candidate].append(n_documents)
+            n_documents += 1
+
+        return final, documents, n_documents, errors
+
+    def spill(self, paths, tmpdir, memory_limit, verbose=False):
+        """
+        extract the candidates of the given paths, postings are written
+        to sorted runs in tmpdir every time they exceed memory_limit
+        (bytes). Returns the list of runs
+        """
+        errors = list()
+        writer = RunWriter(tmpdir, memory_limit)
+
+        for filedict in self.documents(paths, errors, verbose):
+            writer.add(filedict)
+
+        return writer.close(), errors
+
+    def external(self, paths, min_freq=0, verbose=False, partial=None):
+        """
+        extract candidates in a single process within the memory
+        limit: postings are spilled to disk and merged at the end.
+        partial (candidates already extracted from other files, as
+        returned by single) is merged with them
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            runs, errors = self.spill(
+                paths, tmpdir, self.memory_limit, verbose
+            )
+            if partial:
+                runs.append(self.partial_run(partial, tmpdir))
+            return merge_runs(runs, min_freq), errors
+
+    @staticmethod
+    def partial_run(partial, tmpdir):
+        """
+        write the postings of a partial result (as returned
+        by single) to a sorted run in tmpdir
+        """
+        return write_run(tmpdir, (
+            (candidate, " ".join(map(str, partial[candidate])))
+            for candidate in sorted(partial)
+        ))
+
     def join_results(self, results):
         """
-        join results from multiprocessing
+        join results from multiprocessing, each result is
+        a tuple of compact postings and errors
         """
-        single = dict()
         errors = list()
+        postings = list()
 
         for result, error in results:
             errors += error
-            for candidate, frequency in result.items():
-                if candidate not in single:
-                    single[candidate] = []
-                single[candidate] += frequency
+            postings.append(result)
+
+        return Postings.merge(postings), errors
+
+    def count_totals(self, paths, tmpdir):
+        """
+        first phase of the distributed extraction: the worker extracts
+        candidates from its files, keeps the postings in a temporary
+        file and only returns the fingerprint and total frequency
+        of each candidate
+        """
+        final, errors = self.single(paths)
+        keys, totals = self.fingerprint_totals(final)
 
-        return single, errors
+        fd, filepath = tempfile.mkstemp(suffix=".pkl", dir=tmpdir)
+        with os.fdopen(fd, "wb") as ofile:
+            pickle.dump((final, keys), ofile, pickle.HIGHEST_PROTOCOL)
 
-    def multi(self, corpus):
+        return filepath, keys, totals, errors
+
+    @staticmethod
+    def fingerprint_totals(final):
+        """
+        returns the fingerprints and the total frequencies
+        of the candidates of a result of single
+        """
+        keys = np.fromiter(
+            (fingerprint(candidate) for candidate in final),
+            dtype=np.uint64, count=len(final)
+        )
+        totals = np.fromiter(
+            (sum(frequency) for frequency in final.values()),
+            dtype=np.int64, count=len(final)
+        )
+        return keys, totals
+
+    @staticmethod
+    def select_survivors(keys, totals, min_freq):
+        """
+        given the fingerprints and total frequencies returned by
+        every worker, sum the totals of each candidate and return
+        the (sorted) fingerprints of candidates that reach min_freq
+        """
+        if len(keys) == 0:
+            return np.empty(0, dtype=np.uint64)
+
+        keys = np.concatenate(keys)
+        totals = np.concatenate(totals)
+
+        unique, inverse = np.unique(keys, return_inverse=True)
+        global_totals = np.bincount(inverse, weights=totals)
+
+        return unique[global_totals >= min_freq]
+
+    @staticmethod
+    def ship_postings(filepath, survivors):
+        """
+        second phase of the distributed extraction: load the
+        postings saved by count_totals and return (as compact
+        postings) only the candidates whose global frequency
+        reaches min_freq
+        """
+        with open(filepath, "rb") as infile:
+            final, keys = pickle.load(infile)
+        os.remove(filepath)
+
+        return Extractor.keep_survivors(final, keys, survivors)
+
+    @staticmethod
+    def keep_survivors(final, keys, survivors):
+        """
+        returns (as compact postings) the candidates of a result
+        of single whose fingerprint is one of the survivors
         """
-        extract candidates using multiprocessing
+        keep = np.isin(keys, survivors)
+        final = {
+            candidate: frequency
+            for candidate, frequency, k in zip(final, final.values(), keep)
+            if k
+        }
+        return Postings.from_dict(final)
+
+    def partition(self, corpus, sizes=None):
         """
-        sublists = self.split_lists(corpus, len(corpus))
+        divide a corpus in the lists of work units of the tasks,
+        balanced by size if sizes (a dictionary path -> file size)
+        is given
+        """
+        corpus = list(work_units(corpus, os.cpu_count() or 1))
+        n_tasks = min(len(corpus), (os.cpu_count() or 1) * 4)
+        if sizes:
+            return self.split_balanced(corpus, n_tasks, sizes)
+        return list(self.split_lists(corpus, n_tasks))
+
+    def pool_tasks(self, sublists, errors):
+        """
+        returns the tasks to run in the pool, the BoundedTasks of the
+        compressed archives and the number of other tasks. Compressed
+        archives are decompressed once, by the calling process, and
+        their members are given to the workers in batches (a task of
+        a single MemberBatch) while the results come back, so that
+        all the workers extract them
+        """
+        archives = list()
+        others = list()
+        for task in sublists:
+            units = list()
+            for unit in task:
+                if is_compressed_archive(unit):
+                    archives.append(unit)
+                else:
+                    units.append(unit)
+            if units:
+                others.append(units)
+
+        def batches():
+            for unit in archives:
+                try:
+                    for batch in member_batches(unit.path):
+                        yield [batch]
+                except READ_ERRORS:
+                    errors.append(str(unit))
+
+        # archives first: they are read by a single thread
+        bounded = BoundedTasks(batches(), 2 * n_workers(self.executor))
+        return itertools.chain(bounded, others), bounded, len(others)
+
+    def multi(
+            self, corpus, min_freq=0, sizes=None, tasks=None, partial=None):
+        """
+        extract candidates using multiprocessing (or the executor
+        of the extractor: processes, threads or serial).
+
+        The extraction is done in two phases to avoid sending
+        candidates to the parent process which will be removed
+        by the discriminator anyway: workers first return the total
+        frequency of each candidate (as fingerprints) and only
+        candidates reaching min_freq in the whole corpus are
+        then sent with their document frequencies.
+
+        If sizes (a dictionary path -> file size) is given, files are
+        distributed to the tasks so that each task reads the same
+        amount of bytes. tasks (lists of work units, e.g. chosen by
+        the planner) replace the partition of the corpus. partial
+        (candidates already extracted from other files, as returned
+        by single) is merged like the result of a task. Compressed
+        archives are decompressed by the calling process and their
+        members are extracted by all the workers (see pool_tasks).
+
+        If a memory limit is set, each worker spills its postings
+        to sorted runs instead and the runs of all workers are merged
+        (k-way) in the parent process
+        """
+        sublists = tasks
+        if sublists is None:
+            sublists = self.partition(corpus, sizes)
+
+        if self.memory_limit is not None:
+            return self.multi_external(sublists, min_freq, partial)
 
+        files = list()
+        keys = list()
+        totals = list()
+        errors = list()
         results = list()
 
-        with mp.Pool() as pool:
-            for i, out in enumerate(pool.imap(self.single, sublists)):
-                progress_bar(
-                    i+1, len(corpus), prefix="Extracting", fixed_len=True
+        if partial:
+            partial_keys, partial_totals = self.fingerprint_totals(partial)
+            keys.append(partial_keys)
+            totals.append(partial_totals)
+
+        tasks, batches, n_tasks = self.pool_tasks(sublists, errors)
+        with tempfile.TemporaryDirectory() as tmpdir, \
+                executor_pool(self.executor) as pool:
+            count = functools.partial(
+                self.run_task, "count_totals", tmpdir=tmpdir
+            )
+            try:
+                outputs = pool.imap_unordered(count, tasks)
+                for i, (out, times) in enumerate(outputs):
+                    batches.done()
+                    progress_bar(
+                        i+1, n_tasks + batches.n_tasks, prefix="Extracting",
+                        fixed_len=True
+                    )
+                    self.read_times.add(times)
+                    filepath, key, total, error = out
+                    files.append(filepath)
+                    keys.append(key)
+                    totals.append(total)
+                    errors += error
+            finally:
+                batches.close()
+
+            survivors = self.select_survivors(keys, totals, min_freq)
+            ship = functools.partial(self.ship_postings, survivors=survivors)
+            results += [
+                (result, list()) for result in pool.imap_unordered(ship, files)
+            ]
+
+        if partial:
+            results.append((
+                self.keep_survivors(partial, partial_keys, survivors), list()
+            ))
+
+        candidates, _ = self.join_results(results)
+        return candidates, errors
+
+    def multi_external(self, sublists, min_freq=0, partial=None):
+        """
+        extract candidates using multiprocessing within the memory
+        limit, which is shared by the workers. partial (as returned
+        by single) is merged with the runs of the workers
+        """
+        memory_limit = self.memory_limit // n_workers(self.executor)
+
+        runs = list()
+        errors = list()
+
+        tasks, batches, n_tasks = self.pool_tasks(sublists, errors)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with executor_pool(self.executor) as pool:
+                spill = functools.partial(
+                    self.run_task, "spill", tmpdir=tmpdir,
+                    memory_limit=memory_limit
                 )
-                results.append(out)
+                try:
+                    outputs = pool.imap_unordered(spill, tasks)
+                    for i, ((run, error), times) in enumerate(outputs):
+                        batches.done()
+                        progress_bar(
+                            i+1, n_tasks + batches.n_tasks,
+                            prefix="Extracting", fixed_len=True
+                        )
+                        self.read_times.add(times)
+                        runs += run
+                        errors += error
+                finally:
+                    batches.close()
+
+            if partial:
+                runs.append(self.partial_run(partial, tmpdir))
+            candidates = merge_runs(runs, min_freq)
 
-        candidates, errors = self.join_results(results)
         return candidates, errors
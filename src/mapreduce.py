@@ -0,0 +1,68 @@
+"""
+Helpers for the distributed mode: the map command extracts the
+candidates of a slice of the domain corpus and saves them as
+partial postings, the count command counts the candidates in
+a slice of the reference corpus and the reduce command merges
+everything and generates the keywords
+"""
+
+import numpy as np
+
+from src.utils import fingerprint
+from src.vocabulary import decode_strings, encode_strings
+
+
+def select_shard(files, shard, partition="index"):
+    """
+    select the files (or work units) of a shard (a tuple index,
+    number of shards). Files are selected by their position in the
+    (sorted) list or by the fingerprint of their path
+    """
+    index, n_shards = shard
+
+    if partition == "hash":
+        return [
+            path for path in files
+            if fingerprint(str(path)) % n_shards == index
+        ]
+
+    return files[index::n_shards]
+
+
+def save_counts(path, counts, min_freq=1):
+    """
+    save a dictionary candidate -> reference frequency
+    in a (numpy) npz file, with the min_freq of the counted candidates
+    """
+    with open(path, "wb") as ofile:
+        np.savez(
+            ofile,
+            strings=encode_strings(counts.keys()),
+            counts=np.fromiter(
+                counts.values(), dtype=np.int64, count=len(counts)
+            ),
+            min_freq=np.int64(min_freq)
+        )
+
+
+def load_counts(paths, min_freq=None):
+    """
+    load and sum the counts saved by save_counts. If min_freq is
+    given, counts of candidates selected with a higher min_freq are
+    refused: the candidates between the two would have no count
+    """
+    total = dict()
+    for path in paths:
+        with np.load(path) as data:
+            counted = int(data["min_freq"])
+            if min_freq is not None and counted > min_freq:
+                raise ValueError(
+                    f"{path} counts the candidates reaching min_freq "
+                    f"{counted}, count them again with --min_freq "
+                    f"{min_freq} or lower"
+                )
+            strings = decode_strings(data["strings"])
+            for candidate, count in zip(strings, data["counts"].tolist()):
+                total[candidate] = total.get(candidate, 0) + count
+
+    return total
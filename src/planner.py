@@ -0,0 +1,165 @@
+"""
+The planner chooses how the domain corpus is extracted: it extracts
+a few sampled files to measure the extraction time per byte and
+predicts the runtime of a single process and of 2, 3, ... workers
+for the remaining files (the candidates of the sample are kept).
+Work units are assigned to the workers by size (largest first, each
+one to the least loaded worker), the members of compressed archives
+are shared by all the workers, so the runtime of a pool is the
+time of its most loaded worker plus the time to start the workers,
+which is the time the calling process took to load the lexicons,
+the tokenizers and the tagger (each worker process loads them too).
+The fastest plan is chosen (fewer workers if they are almost as fast)
+and it is used by the other stages of the run as well
+"""
+
+import math
+import random
+import sys
+import time
+
+from src.corpus import BATCH_SIZE, is_compressed_archive, unit_weight
+from src.executors import backend, n_workers
+from src.extractor import warm_up
+
+
+# files extracted to measure the cost per byte (at most SAMPLE_BYTES)
+SAMPLE_FILES = 5
+SAMPLE_BYTES = 2**20
+
+# a plan with more workers is only chosen if it is faster by this factor
+MIN_SPEEDUP = 0.05
+
+
+class Plan:
+    """
+    n_workers extract the tasks (lists of the units which were not
+    sampled), sample is the result of single on the sampled units
+    """
+
+    def __init__(self, n_workers, tasks, cost, predicted, sample=None):
+        self.n_workers = n_workers
+        self.tasks = tasks
+        self.cost = cost
+        self.predicted = predicted
+        self.sample = sample if sample is not None else (dict(), list())
+
+    def apply(self, workers):
+        """
+        set the workers (a WorkerPool) used by all the stages of the
+        run if they are not running yet: with a single process the
+        reference is also counted and the candidates scored in the
+        calling process, so that no worker is started
+        """
+        if workers.started:
+            return
+        if self.n_workers == 1:
+            workers.executor = "serial"
+        workers.processes = self.n_workers
+
+    def __str__(self):
+        mode = "single process"
+        if self.n_workers > 1:
+            mode = f"{self.n_workers} workers"
+        return (
+            f"{mode}, {len(self.tasks)} task(s), "
+            f"{self.cost * 2**20:.3f} s/MB, "
+            f"predicted {self.predicted:.2f} s"
+        )
+
+
+def sample_units(units, sizes, n_samples=SAMPLE_FILES, seed=0):
+    """
+    returns up to n_samples random units with at most SAMPLE_BYTES
+    (at least the smallest unit)
+    """
+    shuffled = list(units)
+    random.Random(seed).shuffle(shuffled)
+
+    sample = list()
+    n_bytes = 0
+    for unit in shuffled:
+        weight = unit_weight(unit, sizes)
+        if n_bytes + weight <= SAMPLE_BYTES:
+            sample.append(unit)
+            n_bytes += weight
+        if len(sample) == n_samples:
+            break
+
+    if not sample and units:
+        sample = [min(units, key=lambda unit: unit_weight(unit, sizes))]
+
+    return sample
+
+
+def measure_cost(extractor, units, sizes):
+    """
+    extract a sample of the units in the calling process. Returns
+    the sampled units, their result (candidates and errors), the
+    extraction time per byte and the time spent loading the lexicons,
+    the tokenizers and the tagger before (not part of the cost)
+    """
+    start = time.perf_counter()
+    warm_up()
+    startup = time.perf_counter() - start
+
+    sample = sample_units(units, sizes)
+    n_bytes = sum(unit_weight(unit, sizes) for unit in sample)
+
+    start = time.perf_counter()
+    result = extractor.single(sample)
+    elapsed = time.perf_counter() - start
+
+    return sample, result, elapsed / max(n_bytes, 1), startup
+
+
+def max_parallel_workers(executor):
+    """
+    number of workers which can run at the same time: threads
+    only run in parallel on free-threaded Python builds
+    """
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", lambda: True)
+    if backend(executor) == "thread" and is_gil_enabled():
+        return 1
+    return n_workers(executor)
+
+
+def plan_extraction(extractor, units, sizes, executor, started=False):
+    """
+    returns the fastest Plan to extract the units with the executor
+    (a name or a WorkerPool), started is True if its workers
+    are already running
+    """
+    sample, result, cost, startup = measure_cost(extractor, units, sizes)
+    sampled = set(sample)
+    units = [unit for unit in units if unit not in sampled]
+    weights = [unit_weight(unit, sizes) for unit in units]
+
+    best = Plan(1, [units], cost, cost * sum(weights), result)
+    if started or backend(executor) != "process":
+        startup = 0.0
+
+    # compressed archives are sent to the workers in batches of members
+    archives = [unit for unit in units if is_compressed_archive(unit)]
+    others = [unit for unit in units if not is_compressed_archive(unit)]
+    shared = sum(unit_weight(unit, sizes) for unit in archives)
+    n_batches = sum(
+        math.ceil(unit_weight(unit, sizes) / BATCH_SIZE) for unit in archives
+    )
+    max_workers = min(
+        max_parallel_workers(executor), len(others) + n_batches
+    )
+
+    for n in range(2, max_workers + 1):
+        tasks = extractor.split_balanced(others, n, sizes)
+        tasks[0] += archives
+        makespan = shared / n + max(
+            sum(unit_weight(unit, sizes) for unit in task
+                if not is_compressed_archive(unit))
+            for task in tasks
+        )
+        predicted = startup + cost * makespan
+        if predicted < best.predicted * (1 - MIN_SPEEDUP):
+            best = Plan(n, tasks, cost, predicted, result)
+
+    return best
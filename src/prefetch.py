@@ -0,0 +1,136 @@
+"""
+The prefetcher loads the next units of a corpus in background
+threads while the current one is processed, so that the extraction
+does not wait for slow storage (e.g. a network filesystem). At most
+depth units and max_bytes bytes (estimated from the file sizes) are
+loaded ahead. Compressed units, whose size once read is not known,
+are never loaded ahead: they are streamed when they are reached.
+The time spent waiting for a unit and the time spent processing
+are measured separately
+"""
+
+import collections
+import concurrent.futures
+import time
+
+from src.corpus import unit_bytes
+
+
+PREFETCH_THREADS = 2
+
+# at most this many bytes are loaded ahead (at least one unit)
+PREFETCH_BYTES = 256 * 2**20
+
+
+class ReadTimes:
+    """
+    time (seconds) spent waiting for units, reading them
+    (in background threads) and processing them
+    """
+
+    def __init__(self, wait=0.0, read=0.0, compute=0.0):
+        self.wait = wait
+        self.read = read
+        self.compute = compute
+
+    def add(self, other):
+        self.wait += other.wait
+        self.read += other.read
+        self.compute += other.compute
+
+    def __str__(self):
+        return (
+            f"I/O wait {self.wait:.2f} s, compute {self.compute:.2f} s, "
+            f"background read {self.read:.2f} s"
+        )
+
+
+def timed(load, unit):
+    start = time.perf_counter()
+    result = load(unit)
+    return result, time.perf_counter() - start
+
+
+class Prefetcher:
+    """
+    iterates over the tuples (unit, load(unit)) of the given units
+    (in order), loading up to depth units and max_bytes bytes ahead.
+    weight estimates the size of a unit before it is loaded: units
+    without estimate (None) are not loaded ahead, (unit, stream(unit))
+    is returned when they are reached (load(unit) if stream is not set)
+    """
+
+    def __init__(
+            self, units, load, depth=4, threads=PREFETCH_THREADS,
+            times=None, max_bytes=PREFETCH_BYTES, weight=unit_bytes,
+            stream=None):
+        self.units = units
+        self.load = load
+        self.stream = stream if stream is not None else load
+        self.depth = max(1, depth)
+        self.threads = threads
+        self.times = times if times is not None else ReadTimes()
+        self.max_bytes = max_bytes
+        self.weight = weight
+
+    def __iter__(self):
+        executor = concurrent.futures.ThreadPoolExecutor(self.threads)
+        pending = collections.deque()
+        units = iter(self.units)
+        # next unit (and its size) waiting for memory to be loaded
+        waiting = None
+        ahead = 0
+
+        def submit():
+            nonlocal waiting, ahead
+            while len(pending) < self.depth:
+                if waiting is None:
+                    unit = next(units, None)
+                    if unit is None:
+                        return
+                    waiting = (unit, self.weight(unit))
+
+                unit, size = waiting
+                if size is None:
+                    return
+                if pending and ahead + size > self.max_bytes:
+                    return
+
+                future = executor.submit(timed, self.load, unit)
+                pending.append((unit, size, future))
+                ahead += size
+                waiting = None
+
+        start = time.perf_counter()
+        wait = 0.0
+        try:
+            submit()
+
+            while pending or waiting is not None:
+                if not pending:
+                    # a unit which is not loaded ahead, the next units
+                    # are loaded while it is processed
+                    unit, _ = waiting
+                    waiting = None
+                    submit()
+                    yield unit, self.stream(unit)
+                    continue
+
+                unit, size, future = pending.popleft()
+                ahead -= size
+
+                before = time.perf_counter()
+                result, elapsed = future.result()
+                wait += time.perf_counter() - before
+                self.times.read += elapsed
+
+                submit()
+                yield unit, result
+
+        finally:
+            # cancel_futures of shutdown needs Python 3.9
+            for _, _, future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+            self.times.wait += wait
+            self.times.compute += time.perf_counter() - start - wait
@@ -0,0 +1,317 @@
+"""
+A reference index is built once for a reference corpus and answers
+frequency queries for any set of candidates, so that the reference
+corpus does not have to be scanned with a new automaton every time.
+The BigramTable stores the frequency of every (lowercased) token
+bigram as a sorted array of fingerprints, the SuffixArray stores
+the sorted suffixes of the whole (lowercased) reference text and
+can count candidates of any length. Both are memory mapped
+when loaded
+"""
+
+import bisect
+import json
+import os
+import re
+
+import numpy as np
+
+from src.utils import fingerprint
+from src.vocabulary import ArrayMapping
+
+
+TOKEN = re.compile(r"\w+(?:-\w+)*")
+
+# the reference corpus an index was built from, saved next to the index
+SOURCE_FILE = "source.json"
+
+# the suffix array is sorted in memory (about 30 bytes per byte of
+# text while it is built): bigger reference texts are refused
+MAX_SUFFIX_TEXT = 2**29
+
+
+class IndexTooLarge(ValueError):
+    """
+    raised when the reference corpus is too big for an index
+    """
+
+
+def save_source(directory, source):
+    """
+    save the reference corpus (e.g. its path and the size and
+    modification time of its files) an index was built from
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, SOURCE_FILE), "w",
+              encoding="utf-8") as ofile:
+        json.dump(source, ofile)
+
+
+def read_source(directory):
+    """
+    returns the reference corpus saved with save_source,
+    None for an index saved without it
+    """
+    path = os.path.join(directory, SOURCE_FILE)
+    if not os.path.isfile(path):
+        return None
+    with open(path, "r", encoding="utf-8") as infile:
+        return json.load(infile)
+
+
+def tokenize(line):
+    """
+    lowercase tokens of a line of the reference corpus,
+    tokens may contain "-" like the extracted candidates
+    """
+    return TOKEN.findall(line.lower())
+
+
+class BigramTable:
+
+    keys_file = "bigram_keys.npy"
+    counts_file = "bigram_counts.npy"
+
+    def __init__(self, keys, counts):
+        self.keys = keys
+        self.counts = counts
+
+    def __len__(self):
+        return len(self.keys)
+
+    @staticmethod
+    def count_batch(batch):
+        """
+        returns the sorted unique fingerprints of a batch
+        of bigrams and their counts
+        """
+        keys, counts = np.unique(
+            np.array(batch, dtype=np.uint64), return_counts=True
+        )
+        return keys, counts.astype(np.int64)
+
+    @staticmethod
+    def merge(runs):
+        """
+        merge sorted runs (tuples keys, counts) into a single run
+        """
+        keys = np.concatenate([keys for keys, _ in runs])
+        counts = np.concatenate([counts for _, counts in runs])
+
+        unique, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, weights=counts, minlength=len(unique))
+
+        return unique, counts.astype(np.int64)
+
+    @classmethod
+    def build(cls, lines, batch_size=2**20):
+        """
+        count the token bigrams of an iterable of texts
+        (bigrams never cross a line). Every batch is counted on its
+        own and runs of about the same size are merged (like a binary
+        counter), so every bigram is merged O(log n) times
+        """
+        runs = list()
+
+        def add(batch):
+            runs.append(cls.count_batch(batch))
+            while len(runs) > 1 and len(runs[-2][0]) <= len(runs[-1][0]):
+                runs[-2:] = [cls.merge(runs[-2:])]
+
+        batch = list()
+        for text in lines:
+            for line in text.splitlines():
+                tokens = tokenize(line)
+                batch.extend(
+                    fingerprint(f"{first} {second}")
+                    for first, second in zip(tokens, tokens[1:])
+                )
+
+            if len(batch) >= batch_size:
+                add(batch)
+                batch = list()
+
+        add(batch)
+        return cls(*cls.merge(runs))
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, self.keys_file), self.keys)
+        np.save(os.path.join(directory, self.counts_file), self.counts)
+
+    @classmethod
+    def exists(cls, directory):
+        return os.path.isfile(os.path.join(directory, cls.keys_file))
+
+    @classmethod
+    def load(cls, directory):
+        """
+        load (memory mapped) a table saved with save
+        """
+        keys = np.load(os.path.join(directory, cls.keys_file), mmap_mode="r")
+        counts = np.load(
+            os.path.join(directory, cls.counts_file), mmap_mode="r"
+        )
+        return cls(keys, counts)
+
+    def lookup(self, keys):
+        """
+        returns the frequency of each fingerprint in keys
+        (0 if the bigram is not in the table)
+        """
+        frequencies = np.zeros(len(keys), dtype=np.int64)
+        if len(self.keys) == 0:
+            return frequencies
+
+        positions = np.searchsorted(self.keys, keys)
+        positions[positions == len(self.keys)] = 0
+        found = self.keys[positions] == keys
+        frequencies[found] = self.counts[positions[found]]
+
+        return frequencies
+
+    def frequencies(self, vocabulary):
+        """
+        returns the reference frequency of every candidate of
+        the vocabulary (indexed by the candidate rows)
+        """
+        return ArrayMapping(vocabulary, self.lookup(vocabulary.keys))
+
+
+class SuffixPrefixes:
+    """
+    a lazy sequence of the first m bytes of every suffix
+    (in the order of the suffix array), used for binary search
+    """
+
+    def __init__(self, text, suffixes, m):
+        self.text = text
+        self.suffixes = suffixes
+        self.m = m
+
+    def __len__(self):
+        return len(self.suffixes)
+
+    def __getitem__(self, i):
+        start = self.suffixes[i]
+        return self.text[start:start+self.m].tobytes()
+
+
+class SuffixArray:
+
+    text_file = "suffix_text.npy"
+    suffixes_file = "suffix_array.npy"
+
+    def __init__(self, text, suffixes):
+        self.text = text
+        self.suffixes = suffixes
+
+    def __len__(self):
+        return len(self.suffixes)
+
+    @staticmethod
+    def sort_suffixes(text):
+        """
+        sort the suffixes of text (an array of bytes) by prefix
+        doubling: at every step suffixes are sorted by the ranks of
+        their first k and next k bytes, until all ranks are different.
+        Ranks are 32 bit integers for texts shorter than 2 GB
+        """
+        n = len(text)
+        dtype = np.int32 if n < 2**31 else np.int64
+        if n == 0:
+            return np.empty(0, dtype=dtype)
+
+        rank = text.astype(dtype)
+        k = 1
+        while True:
+            second = np.full(n, -1, dtype=dtype)
+            second[:n-k] = rank[k:]
+
+            suffixes = np.lexsort((second, rank)).astype(dtype)
+            new_group = np.ones(n, dtype=bool)
+            sorted_rank = rank[suffixes]
+            new_group[1:] = sorted_rank[1:] != sorted_rank[:-1]
+            del sorted_rank
+            sorted_second = second[suffixes]
+            new_group[1:] |= sorted_second[1:] != sorted_second[:-1]
+            del sorted_second, second
+
+            rank[suffixes] = np.cumsum(new_group, dtype=dtype) - 1
+            del new_group
+
+            if rank[suffixes[-1]] == n - 1 or k >= n:
+                return suffixes
+            k *= 2
+
+    @classmethod
+    def build(cls, lines, max_size=MAX_SUFFIX_TEXT):
+        """
+        build the suffix array of an iterable of texts, lines
+        are lowercased and separated by a newline so that
+        matches never cross a line. Texts bigger than max_size
+        bytes raise IndexTooLarge
+        """
+        data = bytearray()
+        for i, line in enumerate(lines):
+            if i > 0:
+                data += b"\n"
+            data += line.lower().encode("utf-8")
+            if len(data) > max_size:
+                raise IndexTooLarge(
+                    f"the reference corpus is bigger than {max_size} bytes, "
+                    "too big for a suffix array (use the bigram index)"
+                )
+
+        text = np.frombuffer(data, dtype=np.uint8)
+        return cls(text, cls.sort_suffixes(text))
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, self.text_file), self.text)
+        np.save(os.path.join(directory, self.suffixes_file), self.suffixes)
+
+    @classmethod
+    def exists(cls, directory):
+        return os.path.isfile(os.path.join(directory, cls.suffixes_file))
+
+    @classmethod
+    def load(cls, directory):
+        """
+        load (memory mapped) a suffix array saved with save
+        """
+        text = np.load(os.path.join(directory, cls.text_file), mmap_mode="r")
+        suffixes = np.load(
+            os.path.join(directory, cls.suffixes_file), mmap_mode="r"
+        )
+        return cls(text, suffixes)
+
+    def count(self, candidate):
+        """
+        count the occurrences of a candidate in the reference text
+        with two binary searches (O(m log n))
+        """
+        pattern = candidate.lower().encode("utf-8")
+        prefixes = SuffixPrefixes(self.text, self.suffixes, len(pattern))
+
+        first = bisect.bisect_left(prefixes, pattern)
+        last = bisect.bisect_right(prefixes, pattern, lo=first)
+
+        return last - first
+
+    def frequencies(self, vocabulary):
+        """
+        returns the reference frequency of every candidate of
+        the vocabulary (indexed by the candidate rows)
+        """
+        counts = np.fromiter(
+            (self.count(candidate) for candidate in vocabulary),
+            dtype=np.int64, count=len(vocabulary)
+        )
+        return ArrayMapping(vocabulary, counts)
+
+
+INDEXES = {
+    "bigram": BigramTable,
+    "suffix": SuffixArray,
+}
@@ -0,0 +1,162 @@
+"""
+External merge of candidate postings: when the postings collected
+by a worker exceed its memory budget, they are written to a
+temporary file as a run sorted by candidate. At the end all runs
+are merged (k-way) into compact postings, keeping only candidates
+which reach the minimum frequency
+"""
+
+import array
+import heapq
+import operator
+import os
+import tempfile
+
+import numpy as np
+
+from src.vocabulary import Postings, Vocabulary
+
+
+# estimated memory of a new candidate entry (string, list and dict
+# slot) without the characters, and of a document frequency
+ENTRY_SIZE = 120
+FREQUENCY_SIZE = 8
+
+# maximum number of runs opened at the same time while merging
+MAX_OPEN_RUNS = 256
+
+
+class RunWriter:
+    """
+    collects the document frequencies of the candidates and
+    writes them to sorted runs when memory_limit (bytes) is exceeded
+    """
+
+    def __init__(self, directory, memory_limit):
+        self.directory = directory
+        self.memory_limit = memory_limit
+        self.final = dict()
+        self.size = 0
+        self.runs = list()
+
+    def add(self, filedict):
+        """
+        add the candidate frequencies of a document
+        """
+        for candidate, frequency in filedict.items():
+            if candidate not in self.final:
+                self.final[candidate] = list()
+                self.size += ENTRY_SIZE + len(candidate)
+            self.final[candidate].append(frequency)
+            self.size += FREQUENCY_SIZE
+
+        if self.size > self.memory_limit:
+            self.flush()
+
+    def flush(self):
+        """
+        write the collected postings as a run sorted by candidate
+        """
+        if not self.final:
+            return
+
+        self.runs.append(write_run(
+            self.directory,
+            (
+                (candidate, " ".join(map(str, self.final[candidate])))
+                for candidate in sorted(self.final)
+            )
+        ))
+        self.final = dict()
+        self.size = 0
+
+    def close(self):
+        """
+        flush the remaining postings and return the list of runs
+        """
+        self.flush()
+        return self.runs
+
+
+def write_run(directory, items):
+    """
+    write the (sorted) tuples (candidate, frequencies) to a new
+    run in directory and return its path
+    """
+    fd, path = tempfile.mkstemp(suffix=".run", dir=directory)
+    with os.fdopen(fd, "w", encoding="utf-8") as ofile:
+        for candidate, frequencies in items:
+            ofile.write(f"{candidate}\t{frequencies}\n")
+
+    return path
+
+
+def read_run(path):
+    """
+    yields the tuples (candidate, frequencies) of a run
+    """
+    with open(path, "r", encoding="utf-8") as infile:
+        for line in infile:
+            candidate, frequencies = line.rstrip("\n").split("\t")
+            yield candidate, frequencies
+
+
+def combine_runs(runs):
+    """
+    k-way merge of sorted runs, yields the tuples (candidate,
+    frequencies) with the frequencies of all runs (in run order)
+    """
+    current = None
+    frequencies = list()
+
+    items = heapq.merge(*map(read_run, runs), key=operator.itemgetter(0))
+    for candidate, run_frequencies in items:
+        if candidate != current:
+            if current is not None:
+                yield current, " ".join(frequencies)
+            current = candidate
+            frequencies = list()
+        frequencies.append(run_frequencies)
+
+    if current is not None:
+        yield current, " ".join(frequencies)
+
+
+def merge_runs(runs, min_freq=0):
+    """
+    merge sorted runs into postings, only candidates whose absolute
+    frequency reaches min_freq are kept. If there are too many runs
+    they are first merged into fewer (bigger) runs.
+    Runs are deleted after the merge
+    """
+    runs = list(runs)
+    while len(runs) > MAX_OPEN_RUNS:
+        merged = list()
+        for i in range(0, len(runs), MAX_OPEN_RUNS):
+            group = runs[i:i+MAX_OPEN_RUNS]
+            directory = os.path.dirname(group[0])
+            merged.append(write_run(directory, combine_runs(group)))
+            for path in group:
+                os.remove(path)
+        runs = merged
+
+    strings = list()
+    lengths = array.array("q")
+    tfs = array.array("q")
+
+    for candidate, frequencies in combine_runs(runs):
+        frequencies = [int(tf) for tf in frequencies.split()]
+        if sum(frequencies) >= min_freq:
+            strings.append(candidate)
+            lengths.append(len(frequencies))
+            tfs.extend(frequencies)
+
+    for path in runs:
+        os.remove(path)
+
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum(np.array(lengths, dtype=np.int64), out=offsets[1:])
+
+    return Postings(
+        Vocabulary(strings), offsets, np.array(tfs, dtype=np.int64)
+    )
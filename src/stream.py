@@ -0,0 +1,300 @@
+"""
+The streaming discriminator keeps the statistics of the candidates
+of a sliding window of documents (the last N documents or the
+documents of the last S seconds) instead of the postings. For every
+candidate it keeps the total frequency T, the number of documents
+and the sum S of tf * log2(tf), so that the domain consensus is
+
+    DC = log2(T) - S / T
+
+Adding or expiring a document only updates the rows of its
+candidates. Domain relevance depends on the totals of all the
+candidates, so DR, DC and f are calculated (with arrays) when
+the keywords are requested. The window can be saved and restored,
+so that a later run only adds the new documents
+"""
+
+import collections
+import json
+import math
+
+import numpy as np
+
+from src.vocabulary import (
+    ArrayMapping, Vocabulary, decode_strings, encode_strings
+)
+from src.writers import rank
+
+# statistics saved for every candidate of the window
+STATISTICS = ("totals", "documents", "tf_log_tf", "reference")
+
+
+class StreamingDiscriminator:
+
+    def __init__(
+            self, reference_index, min_freq, window_size=None,
+            window_seconds=None):
+        self.reference_index = reference_index
+        self.min_freq = min_freq
+        self.window_size = window_size
+        self.window_seconds = window_seconds
+
+        # documents of the window: (timestamp, {row: frequency})
+        self.window = collections.deque()
+
+        # statistics of each candidate, indexed by row
+        self.strings = list()
+        self.rows = dict()
+        self.n_alive = 0
+        self.totals = np.zeros(1024, dtype=np.int64)
+        self.documents = np.zeros(1024, dtype=np.int64)
+        self.tf_log_tf = np.zeros(1024)
+        self.reference = np.zeros(1024, dtype=np.int64)
+
+        self.final_candidates = set()
+        self.rejected_candidates = set()
+        self.domain_relevance = {}
+        self.domain_consensus = {}
+
+    def __len__(self):
+        return len(self.window)
+
+    def add_rows(self, candidates):
+        """
+        add new candidates with their reference frequency
+        """
+        first = len(self.strings)
+        self.strings += candidates
+        for i, candidate in enumerate(candidates, first):
+            self.rows[candidate] = i
+
+        # grow the arrays by doubling
+        if len(self.strings) > len(self.totals):
+            size = len(self.totals)
+            while size < len(self.strings):
+                size *= 2
+            for name in STATISTICS:
+                array = getattr(self, name)
+                grown = np.zeros(size, dtype=array.dtype)
+                grown[:len(array)] = array
+                setattr(self, name, grown)
+
+        vocabulary = Vocabulary(candidates)
+        frequencies = self.reference_index.frequencies(vocabulary)
+        self.reference[first:len(self.strings)] = frequencies.values()
+
+    def update(self, document, sign):
+        """
+        add (sign 1) or remove (sign -1) the frequencies of a document
+        """
+        for row, frequency in document.items():
+            self.totals[row] += sign * frequency
+            self.documents[row] += sign
+            if self.documents[row] == 0:
+                # avoid rounding errors of repeated updates
+                self.tf_log_tf[row] = 0.0
+                self.n_alive -= 1
+            else:
+                self.tf_log_tf[row] += sign * frequency * math.log2(frequency)
+                if sign == 1 and self.documents[row] == 1:
+                    self.n_alive += 1
+
+    def add_document(self, filedict, timestamp=None):
+        """
+        add the candidates of a document (a dictionary candidate ->
+        frequency, as created by Extractor.extract_document) and
+        expire the documents which are not in the window anymore
+        """
+        new = [c for c in filedict if c not in self.rows]
+        if new:
+            self.add_rows(new)
+
+        document = {
+            self.rows[candidate]: frequency
+            for candidate, frequency in filedict.items()
+        }
+        self.update(document, 1)
+        self.window.append((timestamp, document))
+
+        self.expire(timestamp)
+
+    def expire(self, now=None):
+        """
+        remove the documents older than the window
+        """
+        if self.window_size is not None:
+            while len(self.window) > self.window_size:
+                _, document = self.window.popleft()
+                self.update(document, -1)
+
+        if self.window_seconds is not None and now is not None:
+            oldest = now - self.window_seconds
+            while self.window and self.window[0][0] < oldest:
+                _, document = self.window.popleft()
+                self.update(document, -1)
+
+        # candidates which are not in the window anymore are removed
+        # when they are more than half of the rows
+        n = len(self.strings)
+        if n > 1024 and self.n_alive < n / 2:
+            self.compact()
+
+    def compact(self):
+        """
+        remove the rows of candidates without documents in the window
+        """
+        n = len(self.strings)
+        alive = np.flatnonzero(self.documents[:n] > 0)
+        new_rows = np.full(n, -1, dtype=np.int64)
+        new_rows[alive] = np.arange(len(alive))
+
+        self.strings = [self.strings[i] for i in alive.tolist()]
+        self.rows = {c: i for i, c in enumerate(self.strings)}
+        for name in STATISTICS:
+            array = getattr(self, name)
+            compacted = np.zeros(len(array), dtype=array.dtype)
+            compacted[:len(alive)] = array[alive]
+            setattr(self, name, compacted)
+
+        new_rows = new_rows.tolist()
+        self.window = collections.deque(
+            (timestamp, {new_rows[r]: f for r, f in document.items()})
+            for timestamp, document in self.window
+        )
+
+    def save(self, path, settings=None, last_file=None):
+        """
+        save the window in a (numpy) npz file with the settings it was
+        created with and the last file read (e.g. its modification
+        time and path)
+        """
+        n = len(self.strings)
+        rows = [row for _, document in self.window for row in document]
+        frequencies = [f for _, document in self.window
+                       for f in document.values()]
+        offsets = np.zeros(len(self.window) + 1, dtype=np.int64)
+        np.cumsum([len(document) for _, document in self.window],
+                  out=offsets[1:])
+        # documents without timestamp are saved with NaN
+        timestamps = [
+            math.nan if timestamp is None else timestamp
+            for timestamp, _ in self.window
+        ]
+
+        with open(path, "wb") as ofile:
+            np.savez(
+                ofile,
+                strings=encode_strings(self.strings),
+                timestamps=np.array(timestamps, dtype=float),
+                offsets=offsets,
+                rows=np.array(rows, dtype=np.int64),
+                frequencies=np.array(frequencies, dtype=np.int64),
+                state=np.array(json.dumps(
+                    {"settings": settings, "last_file": last_file}
+                )),
+                **{name: getattr(self, name)[:n] for name in STATISTICS}
+            )
+
+    def restore(self, path, settings=None):
+        """
+        restore a window saved with save. Returns a tuple (restored,
+        last file): if settings are given and the window was saved
+        with other settings, nothing is restored
+        """
+        with np.load(path) as data:
+            state = json.loads(str(data["state"]))
+            if settings is not None and state["settings"] != settings:
+                return False, None
+
+            self.set_rows(decode_strings(data["strings"]), {
+                name: data[name] for name in STATISTICS
+            })
+
+            offsets = data["offsets"].tolist()
+            rows = data["rows"].tolist()
+            frequencies = data["frequencies"].tolist()
+            self.window = collections.deque()
+            for i, timestamp in enumerate(data["timestamps"].tolist()):
+                if math.isnan(timestamp):
+                    timestamp = None
+                start, end = offsets[i], offsets[i+1]
+                self.window.append(
+                    (timestamp, dict(zip(rows[start:end],
+                                         frequencies[start:end])))
+                )
+
+        self.n_alive = int(np.count_nonzero(self.documents > 0))
+        return True, state["last_file"]
+
+    def set_rows(self, candidates, statistics):
+        """
+        replace the rows by the given candidates and their statistics
+        (arrays of the same length)
+        """
+        self.strings = list(candidates)
+        self.rows = {c: i for i, c in enumerate(self.strings)}
+        size = 1024
+        while size < len(self.strings):
+            size *= 2
+        for name in STATISTICS:
+            array = np.zeros(size, dtype=getattr(self, name).dtype)
+            array[:len(self.strings)] = statistics[name]
+            setattr(self, name, array)
+
+    def calculate_dr_dc(self):
+        """
+        calculate domain relevance and consensus of the candidates
+        of the window reaching min_freq (like the Discriminator on
+        the documents of the window)
+        """
+        n = len(self.strings)
+        totals = self.totals[:n]
+        keep = (totals >= self.min_freq) & (totals > 0)
+        rows = np.flatnonzero(keep)
+
+        domain = totals[rows]
+        reference = self.reference[rows]
+        total_domain = domain.sum()
+        total_reference = reference.sum()
+
+        domain_probs = np.zeros(len(rows))
+        if total_domain > 0:
+            domain_probs = domain / total_domain
+        reference_probs = np.zeros(len(rows))
+        if total_reference > 0:
+            reference_probs = reference / total_reference
+
+        dr = domain_probs / (domain_probs + reference_probs)
+        dc = np.log2(domain) - self.tf_log_tf[rows] / domain
+
+        vocabulary = Vocabulary([self.strings[i] for i in rows.tolist()])
+        self.domain_relevance = ArrayMapping(vocabulary, dr)
+        self.domain_consensus = ArrayMapping(vocabulary, dc)
+
+    def generate_list(self, alpha, theta):
+        """
+        decide which candidates of the window are keywords
+        """
+        self.final_candidates = set()
+        self.rejected_candidates = set()
+
+        vocabulary = self.domain_relevance.vocabulary
+        f_values = (
+            alpha * self.domain_relevance.values()
+            + (1 - alpha) * self.domain_consensus.values()
+        )
+
+        for candidate, f_value in zip(vocabulary, f_values.tolist()):
+            if f_value < theta:
+                self.rejected_candidates.add((candidate, f_value))
+            else:
+                self.final_candidates.add((candidate, f_value))
+
+    def keywords(self, alpha, theta, top_k=None):
+        """
+        returns the (top_k) keywords of the current window
+        as tuples (candidate, f) sorted by f
+        """
+        self.calculate_dr_dc()
+        self.generate_list(alpha, theta)
+        return rank(self.final_candidates, top_k)
@@ -0,0 +1,256 @@
+"""
+The tagged store keeps the tokenized and POS-tagged paragraphs of a
+domain corpus, so that runs with different extraction parameters
+only apply the (cheap) filters and the chunking. Tokens and tags are
+interned and saved as columns of ids: the tokens of sentence i are
+token_ids[sentence_offsets[i]:sentence_offsets[i+1]], the sentences
+of paragraph j are paragraph_offsets[j]:paragraph_offsets[j+1] and
+the paragraphs of document k are document_offsets[k]:document_offsets[k+1].
+For every paragraph the statistics used by keep_paragraph are saved
+as well, and the settings of the corpus the store was created from
+(its root, its filters and its files) are saved with it
+"""
+
+import array
+import json
+
+import numpy as np
+
+from src.vocabulary import decode_strings, encode_strings
+
+
+# types of the columns saved for every token and every paragraph
+COLUMNS = {
+    "token_ids": np.int32,
+    "tag_ids": np.uint16,
+    "n_tokens": np.int32,
+    "n_capitalized": np.int32,
+    "ends_with_punctuation": bool,
+}
+
+
+class StoreWriter:
+    """
+    collects tagged paragraphs document by document
+    and creates a TaggedStore
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.tokens = dict()
+        self.tags = dict()
+        self.token_ids = array.array("l")
+        self.tag_ids = array.array("l")
+        self.sentence_offsets = array.array("q", [0])
+        self.paragraph_offsets = array.array("q", [0])
+        self.document_offsets = array.array("q", [0])
+        self.n_tokens = array.array("l")
+        self.n_capitalized = array.array("l")
+        self.ends_with_punctuation = array.array("b")
+
+    def add_paragraph(self, statistics, tagged_sentences):
+        """
+        add a paragraph: its statistics (number of tokens, number of
+        capitalized tokens, ends with punctuation) and its sentences
+        as lists of (token, tag) tuples
+        """
+        for sentence in tagged_sentences:
+            for token, tag in sentence:
+                self.token_ids.append(
+                    self.tokens.setdefault(token, len(self.tokens))
+                )
+                self.tag_ids.append(self.tags.setdefault(tag, len(self.tags)))
+            self.sentence_offsets.append(len(self.token_ids))
+        self.paragraph_offsets.append(len(self.sentence_offsets) - 1)
+
+        n_tokens, n_capitalized, ends_with_punctuation = statistics
+        self.n_tokens.append(n_tokens)
+        self.n_capitalized.append(n_capitalized)
+        self.ends_with_punctuation.append(ends_with_punctuation)
+
+    def end_document(self):
+        self.document_offsets.append(len(self.paragraph_offsets) - 1)
+
+    def close(self):
+        columns = {
+            name: np.array(getattr(self, name), dtype=dtype)
+            for name, dtype in COLUMNS.items()
+        }
+        return TaggedStore(
+            self.tokenizer,
+            list(self.tokens),
+            list(self.tags),
+            sentence_offsets=np.array(self.sentence_offsets, dtype=np.int64),
+            paragraph_offsets=np.array(
+                self.paragraph_offsets, dtype=np.int64
+            ),
+            document_offsets=np.array(self.document_offsets, dtype=np.int64),
+            **columns
+        )
+
+
+class TaggedStore:
+
+    def __init__(
+            self, tokenizer, tokens, tags, token_ids, tag_ids,
+            sentence_offsets, paragraph_offsets, document_offsets,
+            n_tokens, n_capitalized, ends_with_punctuation, settings=None):
+        self.tokenizer = tokenizer
+        self.tokens = tokens
+        self.tags = tags
+        self.token_ids = token_ids
+        self.tag_ids = tag_ids
+        self.sentence_offsets = sentence_offsets
+        self.paragraph_offsets = paragraph_offsets
+        self.document_offsets = document_offsets
+        self.n_tokens = n_tokens
+        self.n_capitalized = n_capitalized
+        self.ends_with_punctuation = ends_with_punctuation
+        self.settings = settings
+
+    def __len__(self):
+        return len(self.document_offsets) - 1
+
+    @classmethod
+    def merge(cls, stores):
+        """
+        concatenate the stores created by different workers,
+        token and tag ids are mapped to the merged vocabularies
+        """
+        stores = list(stores)
+        tokens = dict()
+        tags = dict()
+        columns = {name: list() for name in COLUMNS}
+        offsets = {
+            "sentence_offsets": [np.zeros(1, dtype=np.int64)],
+            "paragraph_offsets": [np.zeros(1, dtype=np.int64)],
+            "document_offsets": [np.zeros(1, dtype=np.int64)],
+        }
+        # offsets of each store are shifted by the size of the
+        # previous stores (tokens, sentences and paragraphs)
+        shift = {name: 0 for name in offsets}
+
+        for store in stores:
+            token_map = np.array(
+                [tokens.setdefault(t, len(tokens)) for t in store.tokens],
+                dtype=np.int32
+            )
+            tag_map = np.array(
+                [tags.setdefault(t, len(tags)) for t in store.tags],
+                dtype=np.uint16
+            )
+            columns["token_ids"].append(token_map[store.token_ids])
+            columns["tag_ids"].append(tag_map[store.tag_ids])
+            for name in ("n_tokens", "n_capitalized",
+                         "ends_with_punctuation"):
+                columns[name].append(getattr(store, name))
+
+            for name in offsets:
+                offsets[name].append(getattr(store, name)[1:] + shift[name])
+
+            shift["sentence_offsets"] += len(store.token_ids)
+            shift["paragraph_offsets"] += len(store.sentence_offsets) - 1
+            shift["document_offsets"] += len(store.paragraph_offsets) - 1
+
+        arrays = {
+            name: np.concatenate(
+                columns[name] + [np.empty(0, dtype=dtype)]
+            ).astype(dtype)
+            for name, dtype in COLUMNS.items()
+        }
+        for name, parts in offsets.items():
+            arrays[name] = np.concatenate(parts)
+
+        tokenizer = stores[0].tokenizer if stores else None
+        return cls(tokenizer, list(tokens), list(tags), **arrays)
+
+    def save(self, path):
+        """
+        save the store in a (numpy) npz file
+        """
+        with open(path, "wb") as ofile:
+            np.savez(
+                ofile,
+                tokenizer=np.array(self.tokenizer),
+                tokens=encode_strings(self.tokens),
+                tags=encode_strings(self.tags),
+                token_ids=self.token_ids,
+                tag_ids=self.tag_ids,
+                sentence_offsets=self.sentence_offsets,
+                paragraph_offsets=self.paragraph_offsets,
+                document_offsets=self.document_offsets,
+                n_tokens=self.n_tokens,
+                n_capitalized=self.n_capitalized,
+                ends_with_punctuation=self.ends_with_punctuation,
+                settings=np.array(json.dumps(self.settings))
+            )
+
+    @classmethod
+    def load(cls, path, settings=None):
+        """
+        load a store saved with save. If settings are given and the
+        store was created with other settings, None is returned:
+        the store is stale
+        """
+        with np.load(path) as data:
+            saved = None
+            if "settings" in data.files:
+                saved = json.loads(str(data["settings"]))
+            if settings is not None and saved != settings:
+                return None
+
+            return cls(
+                str(data["tokenizer"]),
+                decode_strings(data["tokens"]),
+                decode_strings(data["tags"]),
+                data["token_ids"],
+                data["tag_ids"],
+                data["sentence_offsets"],
+                data["paragraph_offsets"],
+                data["document_offsets"],
+                data["n_tokens"],
+                data["n_capitalized"],
+                data["ends_with_punctuation"],
+                saved
+            )
+
+    def sentences(self, paragraph):
+        """
+        returns the sentences of a paragraph as
+        lists of (token, tag) tuples
+        """
+        first = self.paragraph_offsets[paragraph]
+        last = self.paragraph_offsets[paragraph+1]
+        bounds = self.sentence_offsets[first:last+1].tolist()
+
+        tokens = [
+            self.tokens[i]
+            for i in self.token_ids[bounds[0]:bounds[-1]].tolist()
+        ]
+        tags = [
+            self.tags[i] for i in self.tag_ids[bounds[0]:bounds[-1]].tolist()
+        ]
+
+        sentences = list()
+        for start, end in zip(bounds, bounds[1:]):
+            start, end = start - bounds[0], end - bounds[0]
+            sentences.append(list(zip(tokens[start:end], tags[start:end])))
+
+        return sentences
+
+    def paragraphs(self, document):
+        """
+        yields the paragraphs of a document as tuples (number of
+        sentences, statistics, paragraph index)
+        """
+        first = self.document_offsets[document]
+        last = self.document_offsets[document+1]
+        n_sentences = np.diff(self.paragraph_offsets[first:last+1])
+
+        for i, paragraph in enumerate(range(first, last)):
+            statistics = (
+                int(self.n_tokens[paragraph]),
+                int(self.n_capitalized[paragraph]),
+                bool(self.ends_with_punctuation[paragraph])
+            )
+            yield int(n_sentences[i]), statistics, paragraph
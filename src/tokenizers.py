@@ -0,0 +1,48 @@
+"""
+Tokenizers split a paragraph in sentences and a sentence in tokens.
+The NLTK tokenizer (Punkt and Treebank) is the default, the regex
+tokenizer uses one precompiled expression for each task: it is much
+faster but does not know abbreviations or contractions
+"""
+
+import re
+
+import nltk
+
+
+class NltkTokenizer:
+
+    name = "nltk"
+
+    def sent_tokenize(self, text):
+        return nltk.sent_tokenize(text)
+
+    def word_tokenize(self, text):
+        return nltk.word_tokenize(text)
+
+
+class RegexTokenizer:
+
+    name = "regex"
+
+    # a sentence ends with . ! or ? followed by whitespace
+    # and an uppercase letter, a digit or an opening quote/bracket
+    SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(\[])")
+
+    # words (also joined with - or ') or single punctuation characters
+    TOKEN = re.compile(r"\w+(?:[-']\w+)*|[^\w\s]")
+
+    def sent_tokenize(self, text):
+        return [
+            sentence for sentence in self.SENTENCE_END.split(text.strip())
+            if sentence
+        ]
+
+    def word_tokenize(self, text):
+        return self.TOKEN.findall(text)
+
+
+TOKENIZERS = {
+    "nltk": NltkTokenizer,
+    "regex": RegexTokenizer,
+}
@@ -1,3 +1,6 @@
+import fnmatch
+import hashlib
+import json
 import os
 from pathlib import Path
 
@@ -38,20 +41,135 @@ def progress_bar(
             print(" "*len(to_print), end=end)
 
 
-def retrieve_files(pathstring):
+def retrieve_files(
+        pathstring, recursive=False, include=None, exclude=None,
+        with_sizes=False, errors=None):
     """
     given a path, this function collects all
-    files and returns a list of paths
+    files and returns a list of paths.
+    If the path is a file (e.g. an archive) it is
+    the only element of the list
 
+    Parameters:
+        - recursive (bool): also collect files in subdirectories
+        - include (list of strings): glob patterns, if given only
+            files whose relative path matches one of them are kept
+        - exclude (list of strings): glob patterns of files to skip
+        - with_sizes (bool): return tuples (path, size in bytes)
+        - errors (list): directories which can not be read are
+            skipped and added to errors
+
+    Returns:
+        - list of paths (or tuples (path, size)), sorted by path
     """
-    if pathstring[-1] == "/":
-        pathstring = pathstring[:-1]
+    if os.path.isfile(pathstring):
+        if with_sizes:
+            return [(Path(pathstring), os.path.getsize(pathstring))]
+        return [Path(pathstring)]
+
     file_list = []
+    directories = [pathstring]
+    # directories already seen (symbolic links can make cycles)
+    visited = set()
+
+    while directories:
+        directory = directories.pop()
+        try:
+            stat = os.stat(directory)
+            if (stat.st_dev, stat.st_ino) in visited:
+                continue
+            visited.add((stat.st_dev, stat.st_ino))
+            entries = os.scandir(directory)
+        except OSError:
+            # e.g. a subdirectory without read permission
+            if errors is not None:
+                errors.append(directory)
+            continue
+
+        with entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if recursive:
+                        directories.append(entry.path)
+                    continue
+
+                if not entry.is_file():
+                    continue
+
+                relative = os.path.relpath(entry.path, pathstring)
+                if include and not any(
+                        fnmatch.fnmatch(relative, p) for p in include):
+                    continue
+                if exclude and any(
+                        fnmatch.fnmatch(relative, p) for p in exclude):
+                    continue
 
-    for path, _, files in os.walk(pathstring):
-        for file in files:
-            if path == pathstring:
-                filepath = Path(f"{path}/{file}")
-                file_list.append(filepath)
+                if with_sizes:
+                    file_list.append((Path(entry.path), entry.stat().st_size))
+                else:
+                    file_list.append(Path(entry.path))
 
+    file_list.sort()
     return file_list
+
+
+def write_manifest(manifest, files, settings=None):
+    """
+    save a list of tuples (path, size) in a manifest file
+    (one tab separated line per file). settings (a dictionary, e.g.
+    the root and the filters of the corpus) are saved in the header
+    """
+    with open(manifest, "w", encoding="utf-8") as ofile:
+        if settings is not None:
+            ofile.write(f"# settings\t{json.dumps(settings)}\n")
+        ofile.write("# size\tpath\n")
+        for path, size in files:
+            ofile.write(f"{size}\t{path}\n")
+
+
+def read_manifest(manifest, settings=None):
+    """
+    read a manifest file written by write_manifest and
+    return a list of tuples (path, size). If settings are given
+    and the manifest was written with other settings, None
+    is returned: the manifest is stale
+    """
+    files = []
+    saved = None
+    with open(manifest, "r", encoding="utf-8") as infile:
+        for line in infile:
+            if line.startswith("# settings\t"):
+                saved = json.loads(line.split("\t", 1)[1])
+                continue
+            if line.startswith("#"):
+                continue
+            size, path = line.rstrip("\n").split("\t", 1)
+            files.append((Path(path), int(size)))
+
+    if settings is not None and saved != settings:
+        return None
+
+    return files
+
+
+def file_states(paths):
+    """
+    returns the path, the size and the modification time (ns) of
+    every file, saved with the data derived from the files to
+    detect that they have changed
+    """
+    states = list()
+    for path in paths:
+        stat = os.stat(path)
+        states.append([str(path), stat.st_size, stat.st_mtime_ns])
+    return states
+
+
+def fingerprint(candidate):
+    """
+    returns a stable 64 bit fingerprint of a candidate string.
+    Unlike hash() it does not change between processes, so it
+    can be used to compare candidates extracted by different workers
+    """
+    digest = hashlib.blake2b(candidate.encode("utf-8"), digest_size=8)
+    return int.from_bytes(digest.digest(), "little")
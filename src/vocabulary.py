@@ -0,0 +1,231 @@
+"""
+The vocabulary interns candidate strings: each candidate gets a
+stable 64 bit fingerprint (used to exchange candidates between
+processes) and a row index (used to store statistics in arrays).
+Postings keep the document frequencies of all candidates in two
+flat arrays instead of one python list per candidate
+"""
+
+from collections.abc import Mapping
+
+import numpy as np
+
+from src.utils import fingerprint
+
+
+def encode_strings(strings):
+    """
+    encode a list of candidates (which never contain newlines)
+    in an array of bytes to save it without pickle
+    """
+    data = "\n".join(strings).encode("utf-8")
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def decode_strings(array):
+    """
+    decode an array of bytes created by encode_strings
+    """
+    if len(array) == 0:
+        return list()
+    return array.tobytes().decode("utf-8").split("\n")
+
+
+def segment_sums(values, offsets):
+    """
+    sums of the segments values[offsets[i]:offsets[i+1]] (0 for empty
+    segments: np.add.reduceat would return the value at their offset,
+    or fail if it is the end of values)
+    """
+    starts = offsets[:-1]
+    sums = np.zeros(len(starts), dtype=values.dtype)
+    filled = offsets[1:] > starts
+    if filled.any():
+        # an empty segment ends where the next one starts, so the
+        # remaining segments keep their extent
+        sums[filled] = np.add.reduceat(values, starts[filled])
+    return sums
+
+
+class Vocabulary:
+
+    def __init__(self, strings=(), keys=None):
+        self.strings = list(strings)
+        if keys is None:
+            keys = np.fromiter(
+                (fingerprint(string) for string in self.strings),
+                dtype=np.uint64, count=len(self.strings)
+            )
+        self.keys = keys
+        self.index = {string: i for i, string in enumerate(self.strings)}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __iter__(self):
+        return iter(self.strings)
+
+    def __contains__(self, candidate):
+        return candidate in self.index
+
+    def select(self, mask):
+        """
+        return a new vocabulary with the rows selected by mask
+        (a boolean array)
+        """
+        strings = [s for s, keep in zip(self.strings, mask) if keep]
+        return Vocabulary(strings, self.keys[mask])
+
+
+class ArrayMapping(Mapping):
+    """
+    a read (and update) only dictionary view over an array
+    indexed by the rows of a vocabulary
+    """
+
+    def __init__(self, vocabulary, array):
+        self.vocabulary = vocabulary
+        self.array = array
+
+    def __getitem__(self, candidate):
+        return self.array[self.vocabulary.index[candidate]]
+
+    def __setitem__(self, candidate, value):
+        self.array[self.vocabulary.index[candidate]] = value
+
+    def __iter__(self):
+        return iter(self.vocabulary)
+
+    def __len__(self):
+        return len(self.vocabulary)
+
+    def __contains__(self, candidate):
+        return candidate in self.vocabulary
+
+    def values(self):
+        return self.array
+
+
+class Postings(Mapping):
+    """
+    document frequencies of every candidate in CSR form: the
+    frequencies of the candidate in row i are
+    tfs[offsets[i]:offsets[i+1]]
+    """
+
+    def __init__(self, vocabulary, offsets, tfs):
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.tfs = tfs
+
+    @classmethod
+    def from_dict(cls, candidates):
+        """
+        create postings from a dictionary candidate -> list of
+        document frequencies (as returned by Extractor.single)
+        """
+        lengths = np.fromiter(
+            (len(frequency) for frequency in candidates.values()),
+            dtype=np.int64, count=len(candidates)
+        )
+        offsets = np.zeros(len(candidates) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        tfs = np.fromiter(
+            (tf for frequency in candidates.values() for tf in frequency),
+            dtype=np.int64, count=offsets[-1]
+        )
+
+        return cls(Vocabulary(candidates.keys()), offsets, tfs)
+
+    @classmethod
+    def merge(cls, postings):
+        """
+        merge postings coming from different workers, candidates
+        are matched by their fingerprint
+        """
+        strings = dict()
+        row_keys = list()
+        tfs = list()
+
+        for posting in postings:
+            vocabulary = posting.vocabulary
+            strings.update(zip(vocabulary.keys.tolist(), vocabulary.strings))
+            row_keys.append(np.repeat(vocabulary.keys, posting.lengths()))
+            tfs.append(posting.tfs)
+
+        if len(strings) == 0:
+            return cls.from_dict(dict())
+
+        row_keys = np.concatenate(row_keys)
+        tfs = np.concatenate(tfs)
+
+        order = np.argsort(row_keys, kind="stable")
+        keys, counts = np.unique(row_keys[order], return_counts=True)
+
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        vocabulary = Vocabulary([strings[k] for k in keys.tolist()], keys)
+        return cls(vocabulary, offsets, tfs[order])
+
+    def save(self, path):
+        """
+        save the postings in a (numpy) npz file
+        """
+        with open(path, "wb") as ofile:
+            np.savez(
+                ofile,
+                strings=encode_strings(self.vocabulary.strings),
+                keys=self.vocabulary.keys,
+                offsets=self.offsets,
+                tfs=self.tfs
+            )
+
+    @classmethod
+    def load(cls, path):
+        """
+        load postings saved with save
+        """
+        with np.load(path) as data:
+            vocabulary = Vocabulary(
+                decode_strings(data["strings"]), data["keys"]
+            )
+            return cls(vocabulary, data["offsets"], data["tfs"])
+
+    def lengths(self):
+        """
+        number of documents containing each candidate
+        """
+        return np.diff(self.offsets)
+
+    def totals(self):
+        """
+        absolute frequency of each candidate
+        """
+        return segment_sums(self.tfs, self.offsets)
+
+    def select(self, mask):
+        """
+        return new postings with the candidates selected by mask
+        (a boolean array)
+        """
+        lengths = self.lengths()
+        tfs = self.tfs[np.repeat(mask, lengths)]
+        offsets = np.zeros(np.count_nonzero(mask) + 1, dtype=np.int64)
+        np.cumsum(lengths[mask], out=offsets[1:])
+
+        return Postings(self.vocabulary.select(mask), offsets, tfs)
+
+    def __getitem__(self, candidate):
+        i = self.vocabulary.index[candidate]
+        return self.tfs[self.offsets[i]:self.offsets[i+1]]
+
+    def __iter__(self):
+        return iter(self.vocabulary)
+
+    def __len__(self):
+        return len(self.vocabulary)
+
+    def __contains__(self, candidate):
+        return candidate in self.vocabulary
@@ -0,0 +1,149 @@
+"""
+The writers save the scored candidates. Every record contains
+a candidate with its f-value, domain relevance and domain consensus
+and is written through a buffer in one of the supported formats
+"""
+
+import abc
+import heapq
+import json
+import struct
+
+
+BUFFER_SIZE = 2**20
+
+
+def rank(candidates, top_k=None):
+    """
+    sort a collection of tuples (candidate, f-value) by f-value.
+    If top_k is given, only the best top_k candidates are
+    selected (with a heap instead of sorting every candidate)
+    """
+    if top_k is not None:
+        return heapq.nlargest(top_k, candidates, key=lambda x: x[-1])
+
+    return sorted(candidates, key=lambda x: x[-1], reverse=True)
+
+
+class Writer(abc.ABC):
+    """
+    base class of the writers, records are tuples
+    (candidate, f-value, domain relevance, domain consensus)
+    """
+    extension = None
+    mode = "w"
+
+    def __init__(self, path, alpha, theta):
+        self.path = path
+        self.alpha = alpha
+        self.theta = theta
+        self.file = None
+
+    def __enter__(self):
+        if self.mode == "wb":
+            self.file = open(self.path, "wb", buffering=BUFFER_SIZE)
+        else:
+            self.file = open(
+                self.path, "w", encoding="utf-8", buffering=BUFFER_SIZE
+            )
+        self.write_header()
+        return self
+
+    def __exit__(self, *args):
+        self.file.close()
+
+    def write_header(self):
+        pass
+
+    @abc.abstractmethod
+    def write(self, records):
+        """
+        write an iterable of records
+        """
+
+
+class TsvWriter(Writer):
+    extension = "txt"
+
+    def write_header(self):
+        self.file.write(f"# alpha\t{self.alpha}\n")
+        self.file.write(f"# theta\t{self.theta}\n")
+        self.file.write("# candidate\tf\tDR\tDC\n")
+
+    def write(self, records):
+        self.file.writelines(
+            f"{word}\t{round(f, 6)}\t{round(dr, 6)}\t{round(dc, 6)}\n"
+            for word, f, dr, dc in records
+        )
+
+
+class JsonlWriter(Writer):
+    extension = "jsonl"
+
+    def write_header(self):
+        header = {"alpha": self.alpha, "theta": self.theta}
+        self.file.write(json.dumps(header) + "\n")
+
+    def write(self, records):
+        self.file.writelines(
+            json.dumps({"candidate": word, "f": f, "dr": dr, "dc": dc}) + "\n"
+            for word, f, dr, dc in records
+        )
+
+
+class BinaryWriter(Writer):
+    """
+    compact binary format: a header (magic bytes, alpha, theta)
+    followed by one record per candidate: the length of the
+    utf-8 encoded candidate (uint16), the candidate and f, DR, DC
+    as doubles (little endian)
+    """
+    extension = "bin"
+    mode = "wb"
+    magic = b"KXT1"
+    header = struct.Struct("<4sdd")
+    record = struct.Struct("<H")
+    values = struct.Struct("<ddd")
+
+    def write_header(self):
+        self.file.write(self.header.pack(self.magic, self.alpha, self.theta))
+
+    def write(self, records):
+        for word, f, dr, dc in records:
+            encoded = word.encode("utf-8")
+            self.file.write(self.record.pack(len(encoded)))
+            self.file.write(encoded)
+            self.file.write(self.values.pack(f, dr, dc))
+
+    @classmethod
+    def read(cls, path):
+        """
+        read a binary file and return alpha, theta and
+        the list of records
+        """
+        with open(path, "rb") as infile:
+            data = infile.read()
+
+        magic, alpha, theta = cls.header.unpack_from(data)
+        if magic != cls.magic:
+            raise ValueError(f"{path} is not a candidate file")
+
+        records = list()
+        position = cls.header.size
+        while position < len(data):
+            length, = cls.record.unpack_from(data, position)
+            position += cls.record.size
+            word = data[position:position+length].decode("utf-8")
+            position += length
+            f, dr, dc = cls.values.unpack_from(data, position)
+            position += cls.values.size
+            records.append((word, f, dr, dc))
+
+        return alpha, theta, records
+
+
+WRITERS = {
+    "tsv": TsvWriter,
+    "jsonl": JsonlWriter,
+    "binary": BinaryWriter,
+}
@@ -1,7 +1,47 @@
+import contextlib
+import gzip
+import io
+import json
+import multiprocessing
+import os
+import sys
+import tarfile
+import tempfile
 import unittest
+from multiprocessing.pool import ThreadPool
+from pathlib import Path
 
+import numpy as np
+
+from src.cli import parse_arguments
+from src.corpus import (
+    WorkUnit, load_documents, member_batches, read_documents, unit_bytes,
+    work_units
+)
 from src.extractor import Extractor
-from src.discriminator import Discriminator
+from src.mapreduce import load_counts, save_counts, select_shard
+from src.planner import plan_extraction
+from src.prefetch import Prefetcher, ReadTimes
+from src.ahoc_automaton import FlatAutomaton, State
+from src.reference_index import (
+    BigramTable, IndexTooLarge, SuffixArray, read_source, save_source
+)
+from src.spill import RunWriter, merge_runs
+from src.stream import StreamingDiscriminator
+from src.tagged_store import StoreWriter, TaggedStore
+from src.tokenizers import RegexTokenizer
+import src.discriminator
+import src.planner
+import src.spill
+from src.discriminator import (
+    Discriminator, consensus, count_reference_union
+)
+from src.executors import BoundedTasks, WorkerPool, count_matches
+from src.utils import (
+    file_states, fingerprint, read_manifest, retrieve_files, write_manifest
+)
+from src.vocabulary import ArrayMapping, Postings, Vocabulary
+from src.writers import BinaryWriter, rank
 
 
 class Test(unittest.TestCase):
@@ -177,6 +217,1064 @@ class Test(unittest.TestCase):
 
         self.assertListEqual(expected, results)
 
+    def test_select_survivors(self):
+        worker_1 = {"w1": [1, 3], "w2": [1], "w3": [4]}
+        worker_2 = {"w1": [2], "w2": [1], "w4": [1]}
+
+        keys = list()
+        totals = list()
+        for result in (worker_1, worker_2):
+            keys.append(np.array(
+                [fingerprint(c) for c in result], dtype=np.uint64
+            ))
+            totals.append(np.array(
+                [sum(f) for f in result.values()], dtype=np.int64
+            ))
+
+        survivors = Extractor.select_survivors(keys, totals, min_freq=4)
+        expected = sorted([fingerprint("w1"), fingerprint("w3")])
+
+        self.assertListEqual(expected, survivors.tolist())
+
+    def test_merge_postings(self):
+        worker_1 = {"w1": [1, 3], "w2": [1]}
+        worker_2 = {"w3": [4], "w1": [2]}
+
+        merged = Postings.merge([
+            Postings.from_dict(worker_1),
+            Postings.from_dict(worker_2)
+        ])
+        results = {
+            candidate: merged[candidate].tolist() for candidate in merged
+        }
+
+        expected = {"w1": [1, 3, 2], "w2": [1], "w3": [4]}
+        self.assertDictEqual(expected, results)
+
+        # empty postings (also the last one) have no frequency
+        postings = Postings.from_dict(
+            {"w1": [1, 3], "w2": [], "w3": [2], "w4": []}
+        )
+        totals = dict(zip(postings, postings.totals().tolist()))
+        self.assertDictEqual({"w1": 4, "w2": 0, "w3": 2, "w4": 0}, totals)
+        dc = consensus((
+            np.array([1.0, 3.0, 2.0]), np.array([2, 0, 1, 0]),
+            np.array([4.0, 0.0, 2.0, 0.0])
+        ))
+        self.assertEqual([0, 0, 0], dc[1:].tolist())
+        self.assertAlmostEqual(0.811278, dc[0], places=6)
+
+    def test_read_compressed_documents(self):
+        documents = {"d1.txt": "first line\nsecond line", "d2.txt": "third"}
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            archive_path = os.path.join(tmpdir, "corpus.tar.gz")
+            with tarfile.open(archive_path, "w:gz") as archive:
+                for name, text in documents.items():
+                    data = text.encode("utf-8")
+                    member = tarfile.TarInfo(name)
+                    member.size = len(data)
+                    archive.addfile(member, io.BytesIO(data))
+
+            gz_path = os.path.join(tmpdir, "d3.txt.gz")
+            with gzip.open(gz_path, "wt", encoding="utf-8") as gzfile:
+                gzfile.write("fourth line")
+
+            # members of an uncompressed archive are split in units
+            tar_path = os.path.join(tmpdir, "corpus.tar")
+            with tarfile.open(tar_path, "w") as archive:
+                for i in range(4, 8):
+                    data = f"document {i}".encode("utf-8")
+                    member = tarfile.TarInfo(f"d{i}.txt")
+                    member.size = len(data)
+                    archive.addfile(member, io.BytesIO(data))
+
+            paths = [archive_path, gz_path, tar_path]
+            units = list(work_units(paths, n_splits=2))
+            results = dict()
+            for unit in units:
+                for name, lines in read_documents(unit):
+                    results[os.path.basename(name)] = list(lines)
+
+        expected = {
+            "d1.txt": ["first line", "second line"],
+            "d2.txt": ["third"],
+            "d3.txt.gz": ["fourth line"],
+            **{f"d{i}.txt": [f"document {i}"] for i in range(4, 8)}
+        }
+        self.assertDictEqual(expected, results)
+        self.assertEqual(4, len(units))
+
+    def test_jsonl_byte_ranges(self):
+        records = [
+            {"id": i, "text": f"document {i}\nsecond paragraph"}
+            for i in range(50)
+        ]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "corpus.jsonl")
+            with open(path, "w", encoding="utf-8") as ofile:
+                for record in records:
+                    ofile.write(json.dumps(record) + "\n")
+
+            # n_splits ranges, or ranges of at most chunk_size bytes
+            splits = list()
+            for n_splits, chunk_size in ((7, None), (1, 256)):
+                units = list(work_units(
+                    [path], n_splits, ("text", "id"), chunk_size=chunk_size
+                ))
+                results = list()
+                for unit in units:
+                    for name, lines in read_documents(unit):
+                        results.append((os.path.basename(name), list(lines)))
+                splits.append((units, results))
+
+        expected = [
+            (f"corpus.jsonl:{i}", [f"document {i}", "second paragraph"])
+            for i in range(50)
+        ]
+        for units, results in splits:
+            self.assertListEqual(expected, results)
+        self.assertEqual(7, len(splits[0][0]))
+        self.assertGreater(len(splits[1][0]), 7)
+        self.assertTrue(all(
+            unit.end - unit.start <= 256 for unit in splits[1][0]
+        ))
+
+    def test_text_ranges(self):
+        documents = [
+            [f"document {i}\n", f"paragraph {i}\n"] for i in range(40)
+        ]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "corpus.txt")
+            with open(path, "w", encoding="utf-8") as ofile:
+                for i, document in enumerate(documents):
+                    ofile.write("\n" * (i % 3 + 1) + "".join(document))
+
+            results = dict()
+            for boundary in ("blank", "regex:^$", "regex:^never$"):
+                units = list(work_units([path], 7, None, boundary))
+                results[boundary] = [
+                    list(lines)
+                    for unit in units
+                    for _, lines in read_documents(unit)
+                ]
+
+            with open(path, "w", encoding="utf-8") as ofile:
+                ofile.writelines(line for d in documents for line in d)
+            units = list(work_units([path], 7, None, "lines:2"))
+            results["lines"] = [
+                list(lines)
+                for unit in units
+                for _, lines in read_documents(unit)
+            ]
+
+        self.assertEqual(7, len(units))
+        self.assertListEqual(documents, results["blank"])
+        self.assertListEqual(documents, results["regex:^$"])
+        # without boundaries the file is a single document
+        self.assertEqual(1, len(results["regex:^never$"]))
+        self.assertListEqual(documents, results["lines"])
+
+    def test_retrieve_files_manifest(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            for name in ("a.txt", "b.log", "sub/c.txt", "sub/deep/d.txt"):
+                path = os.path.join(tmpdir, name)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w", encoding="utf-8") as ofile:
+                    ofile.write(name)
+
+            flat = retrieve_files(tmpdir)
+            nested = retrieve_files(
+                tmpdir, recursive=True, include=["*.txt"],
+                exclude=["sub/deep/*"], with_sizes=True
+            )
+
+            # a symbolic link to a parent directory is visited once
+            os.symlink(tmpdir, os.path.join(tmpdir, "sub", "loop"))
+            linked = retrieve_files(tmpdir, recursive=True)
+
+            # an unreadable subdirectory is skipped and reported
+            # (tests may run as root, which can read any directory)
+            locked = os.path.join(tmpdir, "sub", "deep")
+            scandir = os.scandir
+
+            def denied(path):
+                if os.path.abspath(path) == locked:
+                    raise PermissionError(13, "Permission denied", path)
+                return scandir(path)
+
+            errors = list()
+            os.scandir = denied
+            try:
+                readable = retrieve_files(tmpdir, recursive=True,
+                                          errors=errors)
+            finally:
+                os.scandir = scandir
+
+            settings = {"root": tmpdir, "include": ["*.txt"]}
+            manifest = os.path.join(tmpdir, "manifest.tsv")
+            write_manifest(manifest, nested, settings)
+            from_manifest = read_manifest(manifest, settings)
+            stale = read_manifest(manifest, {"root": tmpdir})
+
+            flat = [str(p.relative_to(tmpdir)) for p in flat]
+            nested = [(str(p.relative_to(tmpdir)), s) for p, s in nested]
+            from_manifest = [
+                (str(p.relative_to(tmpdir)), s) for p, s in from_manifest
+            ]
+
+        self.assertListEqual(["a.txt", "b.log"], flat)
+        self.assertListEqual([("a.txt", 5), ("sub/c.txt", 9)], nested)
+        self.assertListEqual(nested, from_manifest)
+        self.assertIsNone(stale)
+        self.assertEqual(4, len(linked))
+        self.assertEqual(3, len(readable))
+        self.assertListEqual([locked], errors)
+
+    def test_split_balanced(self):
+        sizes = {
+            Path("a"): 10, Path("b"): 7, Path("c"): 5,
+            Path("d"): 4, Path("e"): 2
+        }
+        sublists = Extractor.split_balanced(list(sizes), 2, sizes)
+        loads = sorted(sum(sizes[f] for f in sub) for sub in sublists)
+
+        self.assertListEqual([14, 14], loads)
+
+    def test_sample_and_bootstrap(self):
+        units = [f"a/d{i}.txt" for i in range(10)] + ["b/d0.txt", "b/d1.txt"]
+        sample = Extractor.sample_units(units, 0.3, seed=1)
+        self.assertEqual(3, sum(unit.startswith("a/") for unit in sample))
+        self.assertEqual(1, sum(unit.startswith("b/") for unit in sample))
+        self.assertListEqual(sorted(sample, key=units.index), sample)
+        self.assertListEqual(sample, Extractor.sample_units(units, 0.3, 1))
+
+        # every document contains the same candidates: the f-value
+        # of every resample is the f-value of the sample
+        candidates = {"oil price": [2] * 6, "crude oil": [1] * 6}
+        documents = Postings.from_dict(
+            {candidate: list(range(6)) for candidate in candidates}
+        )
+        discriminator = Discriminator(
+            candidates, 1, reference_frequency={"oil price": 3}
+        )
+        discriminator.calculate_dr_dc()
+        discriminator.generate_list(0.9, 0.0, verbose=False)
+        intervals = discriminator.bootstrap(
+            documents, 6, 0.9, list(candidates), n_resamples=20
+        )
+        for candidate, f in discriminator.final_candidates:
+            low, high = intervals[candidate]
+            self.assertAlmostEqual(f, low)
+            self.assertAlmostEqual(f, high)
+
+        # otherwise the interval contains the f-value
+        candidates = {"oil price": [5, 1, 1, 2, 1, 9], "crude oil": [1, 2]}
+        documents = Postings.from_dict(
+            {"oil price": list(range(6)), "crude oil": [0, 3]}
+        )
+        discriminator = Discriminator(
+            candidates, 1, reference_frequency={"oil price": 3}
+        )
+        discriminator.calculate_dr_dc()
+        discriminator.generate_list(0.5, 0.0, verbose=False)
+        intervals = discriminator.bootstrap(
+            documents, 6, 0.5, ["oil price"], n_resamples=200
+        )
+        low, high = intervals["oil price"]
+        f = dict(discriminator.final_candidates)["oil price"]
+        self.assertLess(low, f)
+        self.assertGreater(high, f)
+
+    def test_plan_extraction(self):
+        # the last unit is sampled, workers take 0.5 s to start
+        measure_cost = src.planner.measure_cost
+        src.planner.measure_cost = lambda extractor, units, sizes: (
+            units[-1:], ({"oil price": [1]}, list()), 1e-6, 0.5
+        )
+        workers = WorkerPool("process", processes=4)
+        try:
+            plans = dict()
+            for name, mb_sizes in (
+                    ("tiny", [0.001] * 8),
+                    ("uniform", [1] * 8),
+                    ("skewed", [4, 1, 1, 1, 1])):
+                sizes = {
+                    Path(f"d{i}.txt"): int(size * 2**20)
+                    for i, size in enumerate(mb_sizes)
+                }
+                units = [str(path) for path in sizes]
+                plans[name] = plan_extraction(Extractor, units, sizes, workers)
+
+            # the members of a compressed archive are shared by the workers
+            sizes = {Path("c.tar.gz"): 8 * 2**20, Path("d.txt"): 100}
+            units = [WorkUnit(Path("c.tar.gz")), "d.txt"]
+            plans["archive"] = plan_extraction(
+                Extractor, units, sizes, workers
+            )
+        finally:
+            src.planner.measure_cost = measure_cost
+
+        self.assertEqual(1, plans["tiny"].n_workers)
+        self.assertEqual(7, len(plans["tiny"].tasks[0]))
+        self.assertEqual(4, plans["uniform"].n_workers)
+        self.assertListEqual([2, 2, 2, 1], [
+            len(task) for task in plans["uniform"].tasks
+        ])
+        self.assertNotIn("d7.txt", sum(plans["uniform"].tasks, []))
+        self.assertDictEqual({"oil price": [1]}, plans["uniform"].sample[0])
+        # more workers do not help with the biggest file
+        self.assertEqual(2, plans["skewed"].n_workers)
+        self.assertListEqual(["d0.txt"], plans["skewed"].tasks[0])
+        self.assertAlmostEqual(
+            0.5 + 4 * 2**20 * 1e-6, plans["skewed"].predicted
+        )
+        self.assertEqual(4, plans["archive"].n_workers)
+        self.assertIn(WorkUnit(Path("c.tar.gz")), plans["archive"].tasks[0])
+        self.assertAlmostEqual(
+            0.5 + 2 * 2**20 * 1e-6, plans["archive"].predicted
+        )
+        self.assertFalse(workers.started)
+
+        # a single process plan also counts the reference (and scores)
+        # in the calling process: no worker process is started
+        plans["uniform"].apply(workers)
+        self.assertEqual(("process", 4), (workers.executor, workers.processes))
+        with WorkerPool("process") as workers:
+            plans["tiny"].apply(workers)
+            automaton = State.create_automaton(["oil price"])
+            count_matches(automaton, ["Oil price rose"] * 3, workers)
+            self.assertListEqual([], multiprocessing.active_children())
+        self.assertEqual("serial", workers.executor)
+        self.assertDictEqual({"oil price": 3}, automaton.counts)
+
+    def test_rank_and_binary_writer(self):
+        candidates = {("w1", 0.5), ("w2", 1.5), ("w3", 0.9), ("w4", 0.7)}
+
+        top = rank(candidates, top_k=2)
+        records = [(word, f, 0.25, 1.0) for word, f in rank(candidates)]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "keywords.bin")
+            with BinaryWriter(path, 0.99, 0.6) as ofile:
+                ofile.write(records)
+            alpha, theta, results = BinaryWriter.read(path)
+
+        self.assertListEqual([("w2", 1.5), ("w3", 0.9)], top)
+        self.assertEqual((0.99, 0.6), (alpha, theta))
+        self.assertListEqual(records, results)
+
+    def test_partial_results(self):
+        files = [Path(f"doc{i}.txt") for i in range(10)]
+        by_index = [select_shard(files, (i, 3)) for i in range(3)]
+        by_hash = [select_shard(files, (i, 3), "hash") for i in range(3)]
+
+        postings = Postings.from_dict({"w1": [1, 3], "w2": [2]})
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            postings_path = os.path.join(tmpdir, "partial.npz")
+            postings.save(postings_path)
+            loaded = Postings.load(postings_path)
+
+            counts_paths = list()
+            for i, counts in enumerate(({"w1": 2, "w2": 0}, {"w1": 1})):
+                counts_paths.append(os.path.join(tmpdir, f"counts{i}.npz"))
+                save_counts(counts_paths[-1], counts, min_freq=2)
+            counts = load_counts(counts_paths)
+            self.assertDictEqual(counts, load_counts(counts_paths, 2))
+            # candidates reaching min_freq 1 were not all counted
+            with self.assertRaises(ValueError):
+                load_counts(counts_paths, 1)
+
+        self.assertListEqual(files[1::3], by_index[1])
+        self.assertListEqual(files, sorted(sum(by_hash, [])))
+        self.assertListEqual([1, 3], loaded["w1"].tolist())
+        self.assertListEqual([2], loaded["w2"].tolist())
+        self.assertDictEqual({"w1": 3, "w2": 0}, counts)
+
+    def test_bigram_table(self):
+        lines = [
+            "The oil price rose, the Oil Price fell.",
+            "oil\nprice and state-of-the-art engine",
+            "price oil"
+        ]
+        vocabulary = Vocabulary(
+            ["oil price", "state-of-the-art engine", "price oil", "gas price"]
+        )
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            BigramTable.build(lines, batch_size=3).save(tmpdir)
+            table = BigramTable.load(tmpdir)
+            frequencies = table.frequencies(vocabulary)
+            results = [int(frequencies[c]) for c in vocabulary]
+
+            # the reference corpus the index was built from
+            self.assertIsNone(read_source(tmpdir))
+            source = {"reference": tmpdir, "files": [["a.txt", 3, 7]]}
+            save_source(tmpdir, source)
+            self.assertEqual(source, read_source(tmpdir))
+
+        self.assertListEqual([2, 1, 1, 0], results)
+
+    def test_suffix_array(self):
+        lines = [
+            "The oil price rose, the Oil Price fell.",
+            "oil prices and state-of-the-art engines",
+            "price oil"
+        ]
+        patterns = [
+            "oil price", "state-of-the-art engine", "price", "e", "gas"
+        ]
+
+        automaton = State.create_automaton(patterns)
+        for line in lines:
+            automaton.find_match(line, True)
+        expected = [automaton.counts.get(p, 0) for p in patterns]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            SuffixArray.build(lines).save(tmpdir)
+            index = SuffixArray.load(tmpdir)
+            frequencies = index.frequencies(Vocabulary(patterns))
+            results = [int(frequencies[p]) for p in patterns]
+
+        self.assertListEqual(expected, results)
+        with self.assertRaises(IndexTooLarge):
+            SuffixArray.build(lines, max_size=50)
+
+    def test_count_matches(self):
+        patterns = ["oil price", "price", "crude oil", "oil"]
+        lines = [
+            "Crude oil prices rose", "the OIL PRICE fell",
+            "no match here", "oil oil"
+        ] * 7
+
+        expected = State.create_automaton(patterns)
+        for line in lines:
+            expected.find_match(line, True)
+
+        automaton = State.create_automaton(patterns)
+        self.assertDictEqual(
+            expected.counts, automaton.count_matches(lines, True)
+        )
+        self.assertDictEqual(dict(), automaton.counts)
+        self.assertDictEqual(
+            expected.counts, automaton.compile().count_matches(lines, True)
+        )
+
+        # worker processes load the automaton saved by the caller
+        for executor in ("serial", "thread", "process"):
+            automaton = State.create_automaton(patterns)
+            count_matches(automaton, lines, executor, chunk_size=3)
+            self.assertDictEqual(expected.counts, automaton.counts)
+
+    def test_executor_arguments(self):
+        self.assertEqual("process", parse_arguments(["corpus"]).executor)
+        self.assertEqual(
+            "serial", parse_arguments(["corpus", "--single"]).executor
+        )
+        self.assertEqual(
+            "thread",
+            parse_arguments(["batch", "a", "b", "--executor", "thread"])
+            .executor
+        )
+        with contextlib.redirect_stderr(io.StringIO()), \
+                self.assertRaises(SystemExit):
+            parse_arguments(["corpus", "--single", "--executor", "process"])
+
+        # the preview runs in a single process, in memory
+        self.assertEqual(0.1, parse_arguments(["corpus", "--sample", "0.1"])
+                         .sample)
+        for option in (["--auto"], ["--single"], ["--tagged-store", "t"],
+                       ["--memory-limit", "100"]):
+            with contextlib.redirect_stderr(io.StringIO()), \
+                    self.assertRaises(SystemExit):
+                parse_arguments(["corpus", "--sample", "0.1"] + option)
+
+    def test_top_k_argument(self):
+        self.assertEqual(3, parse_arguments(["corpus", "--top-k", "3"]).top_k)
+        for value in ("0", "-1"):
+            with contextlib.redirect_stderr(io.StringIO()), \
+                    self.assertRaises(SystemExit):
+                parse_arguments(["corpus", "--top-k", value])
+
+    def test_pruning_arguments(self):
+        self.assertTrue(parse_arguments(["corpus", "--prune"]).prune)
+        self.assertEqual(1.5, parse_arguments(["corpus", "--alpha", "1.5"])
+                         .alpha)
+        for alpha in ("1.5", "-0.1"):
+            with contextlib.redirect_stderr(io.StringIO()), \
+                    self.assertRaises(SystemExit):
+                parse_arguments(["corpus", "--prune", "--alpha", alpha])
+
+    def test_batch_union_counts(self):
+        domains = [
+            {
+                "boat hull": [3, 2, 4], "sail": [5, 1], "wind": [2, 2, 2],
+                "race": [1, 1]
+            },
+            {
+                "wind": [4, 1], "engine": [3, 3, 1], "sail": [1, 1, 1],
+                "yacht market": [2, 5]
+            },
+        ]
+        lines = [
+            "the wind filled the sail of the boat",
+            "a boat hull and an engine",
+            "Race and RACE and race, the yacht market",
+            "wind wind engine",
+        ]
+
+        separate = list()
+        for candidates in domains:
+            discriminator = Discriminator(candidates, 2)
+            for line in lines:
+                discriminator.find_reference_frequence(line)
+            separate.append(discriminator)
+
+        batch = [
+            Discriminator(candidates, 2, count_reference=False)
+            for candidates in domains
+        ]
+        count_reference_union(batch, lines)
+
+        for expected, result in zip(separate, batch):
+            self.assertIsNone(result.matcher)
+            for discriminator in (expected, result):
+                discriminator.calculate_dr_dc()
+                discriminator.generate_list(0.5, 0.8, verbose=True)
+            self.assertSetEqual(
+                expected.final_candidates, result.final_candidates
+            )
+            self.assertSetEqual(
+                expected.rejected_candidates, result.rejected_candidates
+            )
+            self.assertDictEqual(
+                dict(expected.domain_relevance.items()),
+                dict(result.domain_relevance.items())
+            )
+
+    def test_worker_pool(self):
+        patterns = ["oil price", "price", "crude oil", "oil"]
+        lines = ["Crude oil prices rose", "the OIL PRICE fell"] * 50
+        expected = State.create_automaton(patterns)
+        for line in lines:
+            expected.find_match(line, True)
+
+        rng = np.random.default_rng(0)
+        candidates = {
+            f"w{i}": rng.integers(1, 6, size=rng.integers(1, 20)).tolist()
+            for i in range(300)
+        }
+        reference = {f"w{i}": int(rng.integers(0, 30)) for i in range(300)}
+        exact = Discriminator(candidates, 2, reference_frequency=reference)
+        exact.calculate_dr_dc()
+
+        chunk = src.discriminator.SCORING_CHUNK
+        src.discriminator.SCORING_CHUNK = 7
+        try:
+            with WorkerPool("process", processes=2) as workers:
+                # the same workers are used by every stage
+                pools = list()
+                for _ in range(2):
+                    automaton = State.create_automaton(patterns)
+                    count_matches(automaton, lines, workers, chunk_size=9)
+                    self.assertDictEqual(expected.counts, automaton.counts)
+                    pools.append(workers.pool)
+
+                scored = Discriminator(
+                    candidates, 2, reference_frequency=reference
+                )
+                scored.calculate_dr_dc(executor=workers)
+                pools.append(workers.pool)
+
+            # the module constant is read when the tasks are made
+            tasks = list(src.discriminator.consensus_tasks(
+                scored.candidates.tfs, scored.candidates.lengths(),
+                scored.candidates.totals()
+            ))
+        finally:
+            src.discriminator.SCORING_CHUNK = chunk
+
+        self.assertEqual(-(-len(scored.candidates) // 7), len(tasks))
+        self.assertGreater(len(tasks), 1)
+        self.assertIsNotNone(pools[0])
+        self.assertTrue(all(pool is pools[0] for pool in pools))
+        self.assertGreater(workers.warm_up_time, 0)
+        np.testing.assert_allclose(
+            exact.domain_consensus.values(), scored.domain_consensus.values()
+        )
+
+    def test_flat_automaton(self):
+        text = (
+            "The PRADA Christmas Race is a one day knock out series, "
+            "based on the seeding from the PRADA ACWS Auckland, NZ and "
+            "the last chance for teams to take on the Defender."
+        )
+        patterns = ["PRADA", "on", "PRACHT", "oboe", "one", "ne"]
+
+        automaton = State.create_automaton(patterns)
+        automaton.find_match(text)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "automaton.npz")
+            automaton.compile().save(path)
+            flat = FlatAutomaton.load(path)
+        flat.find_match(text)
+
+        self.assertDictEqual(
+            {"PRADA": [4, 86], "on": [30, 62, 148], "one": [30], "ne": [31]},
+            automaton.results
+        )
+        self.assertDictEqual(automaton.results, flat.results)
+        self.assertDictEqual(automaton.counts, flat.counts)
+        self.assertDictEqual(flat.counts, flat.count_matches([text]))
+        # only the edges of the visited states are loaded ("oboe" is not)
+        loaded = [edges for edges in flat.goto if edges is not None]
+        self.assertLess(len(loaded), len(flat))
+
+        # threads share an automaton whose edges are not loaded yet
+        # (switching threads as often as possible)
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            results = list()
+            for _ in range(10):
+                shared = automaton.compile()
+                with ThreadPool(8) as pool:
+                    results += pool.map(shared.count_matches, [[text]] * 16)
+        finally:
+            sys.setswitchinterval(interval)
+        for counts in results:
+            self.assertDictEqual(automaton.counts, counts)
+
+    def test_spill_runs(self):
+        documents = [
+            {"w1": 2, "w2": 1},
+            {"w3": 4},
+            {"w1": 1, "w3": 1},
+            {"w2": 5, "w4": 1},
+        ]
+
+        # in memory postings (as Extractor.single)
+        final = dict()
+        for filedict in documents:
+            for candidate, frequency in filedict.items():
+                final.setdefault(candidate, list()).append(frequency)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            # a tiny budget spills after every document
+            writer = RunWriter(tmpdir, memory_limit=1)
+            for filedict in documents:
+                writer.add(filedict)
+            runs = writer.close()
+            self.assertEqual(len(documents), len(runs))
+
+            # merge two runs at a time
+            max_open_runs = src.spill.MAX_OPEN_RUNS
+            src.spill.MAX_OPEN_RUNS = 2
+            try:
+                merged = merge_runs(runs, min_freq=3)
+            finally:
+                src.spill.MAX_OPEN_RUNS = max_open_runs
+            self.assertListEqual([], os.listdir(tmpdir))
+
+        results = {
+            candidate: merged[candidate].tolist() for candidate in merged
+        }
+        expected = {
+            candidate: frequency for candidate, frequency in final.items()
+            if sum(frequency) >= 3
+        }
+        self.assertDictEqual(expected, results)
+
+    def test_external_extraction(self):
+        sentences = [
+            "The schooner America won the race around the Isle of Wight.",
+            "The international competition was renamed the America's Cup.",
+            "The yacht club received the cup under the Deed of Gift.",
+            "The racing yacht had a new mast and a new hull for the race.",
+        ]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = list()
+            for i in range(8):
+                path = os.path.join(tmpdir, f"d{i}.txt")
+                with open(path, "w", encoding="utf-8") as ofile:
+                    ofile.write(" ".join(sentences[i % 4:] + sentences))
+                paths.append(path)
+
+            extractor = Extractor(2, 70, 5, 20, False, False)
+            expected, _ = extractor.single(paths)
+            # the order of the documents depends on the tasks
+            expected = {
+                candidate: sorted(frequency)
+                for candidate, frequency in expected.items()
+                if sum(frequency) >= 2
+            }
+
+            # a tiny budget spills the postings after every document
+            results = dict()
+            for executor in ("serial", "process"):
+                extractor = Extractor(
+                    2, 70, 5, 20, False, False, memory_limit=1,
+                    executor=executor
+                )
+                candidates, _ = extractor.external(paths, min_freq=2)
+                results["external"] = candidates
+                sublists = list(extractor.split_lists(paths, 3))
+                candidates, _ = extractor.multi_external(sublists, 2)
+                results[executor] = candidates
+
+            # candidates of a sample are merged with the tasks
+            for memory_limit in (None, 1):
+                extractor = Extractor(
+                    2, 70, 5, 20, False, False, memory_limit=memory_limit,
+                    executor="serial"
+                )
+                partial, _ = extractor.single(paths[:3])
+                candidates, _ = extractor.multi(
+                    None, 2, tasks=[paths[3:5], paths[5:]], partial=partial
+                )
+                results[("partial", memory_limit)] = candidates
+
+        self.assertGreater(len(expected), 0)
+        for candidates in results.values():
+            self.assertDictEqual(expected, {
+                candidate: sorted(candidates[candidate].tolist())
+                for candidate in candidates
+            })
+
+    def test_compressed_archive_tasks(self):
+        sentences = [
+            "The schooner America won the race around the Isle of Wight.",
+            "The yacht club received the cup under the Deed of Gift.",
+            "The racing yacht had a new mast and a new hull for the race.",
+        ]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            archive_path = os.path.join(tmpdir, "corpus.tar.gz")
+            with tarfile.open(archive_path, "w:gz") as archive:
+                for i in range(6):
+                    data = " ".join(sentences[i % 3:]).encode("utf-8")
+                    member = tarfile.TarInfo(f"d{i}.txt")
+                    member.size = len(data)
+                    archive.addfile(member, io.BytesIO(data))
+            path = os.path.join(tmpdir, "d6.txt")
+            with open(path, "w", encoding="utf-8") as ofile:
+                ofile.write(" ".join(sentences))
+
+            # the archive is decompressed once, in batches of members
+            batches = list(member_batches(archive_path, batch_size=100))
+            self.assertGreater(len(batches), 1)
+            self.assertListEqual(
+                [f"{archive_path}/d{i}.txt" for i in range(6)],
+                [name for batch in batches
+                 for name, _ in read_documents(batch)]
+            )
+
+            extractor = Extractor(2, 70, 5, 20, False, False)
+            expected, _ = extractor.single([archive_path, path])
+            expected = {
+                candidate: sorted(frequency)
+                for candidate, frequency in expected.items()
+            }
+            tasks = [[WorkUnit(Path(archive_path))], [path]]
+            for executor in ("serial", "thread"):
+                for memory_limit in (None, 1):
+                    extractor = Extractor(
+                        2, 70, 5, 20, False, False,
+                        memory_limit=memory_limit, executor=executor
+                    )
+                    candidates, errors = extractor.multi(None, tasks=tasks)
+                    self.assertListEqual([], errors)
+                    self.assertDictEqual(expected, {
+                        candidate: sorted(candidates[candidate].tolist())
+                        for candidate in candidates
+                    })
+
+        # lazy tasks are only given while few results are pending
+        given = list()
+        received = list()
+
+        def tasks():
+            for i in range(20):
+                given.append(i)
+                yield i
+
+        bounded = BoundedTasks(tasks(), 3)
+        with ThreadPool(2) as pool:
+            for _ in pool.imap_unordered(abs, bounded):
+                self.assertLessEqual(len(given) - len(received), 4)
+                received.append(bounded.done())
+        self.assertEqual(20, len(received))
+
+    def test_regex_tokenizer(self):
+        tokenizer = RegexTokenizer()
+        text = (
+            "The state-of-the-art boat won. It's 3 knots faster! "
+            "Is it? yes."
+        )
+
+        self.assertListEqual(
+            [
+                "The state-of-the-art boat won.",
+                "It's 3 knots faster!",
+                "Is it? yes.",
+            ],
+            tokenizer.sent_tokenize(text)
+        )
+        self.assertListEqual(
+            ["It's", "3", "knots", "faster", "!"],
+            tokenizer.word_tokenize("It's 3 knots faster!")
+        )
+
+    def test_tagged_store(self):
+        first = [("Fast", "JJ"), ("boats", "NNS"), (".", ".")]
+        second = [("Boats", "NNS"), ("sail", "VBP"), (".", ".")]
+
+        writer_1 = StoreWriter("nltk")
+        writer_1.add_paragraph((3, 1, True), [first])
+        writer_1.add_paragraph((6, 2, True), [first, second])
+        writer_1.end_document()
+
+        writer_2 = StoreWriter("nltk")
+        writer_2.add_paragraph((3, 1, True), [second])
+        writer_2.end_document()
+
+        store = TaggedStore.merge([writer_1.close(), writer_2.close()])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "tagged.npz")
+            store.save(path)
+            store = TaggedStore.load(path)
+
+        self.assertEqual("nltk", store.tokenizer)
+        self.assertEqual(2, len(store))
+
+        paragraphs = list(store.paragraphs(0))
+        self.assertListEqual(
+            [(1, (3, 1, True), 0), (2, (6, 2, True), 1)], paragraphs
+        )
+        self.assertListEqual([first, second], store.sentences(1))
+        self.assertListEqual(
+            [(1, (3, 1, True), 2)], list(store.paragraphs(1))
+        )
+        self.assertListEqual([second], store.sentences(2))
+
+    def test_stored_extraction(self):
+        sentences = [
+            "The schooner America won the race around the Isle of Wight.",
+            "The racing yacht had a new mast and a new hull for the race.",
+            "The yacht club received the cup under the Deed of Gift.",
+        ]
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = list()
+            for i in range(4):
+                path = os.path.join(tmpdir, f"d{i}.txt")
+                with open(path, "w", encoding="utf-8") as ofile:
+                    ofile.write(" ".join(sentences[i % 3:]) + "\n")
+                    ofile.write("Short line.\n" + sentences[0])
+                paths.append(path)
+
+            store, errors = Extractor(
+                2, 70, 5, 20, False, False
+            ).tag_documents(paths)
+            self.assertListEqual([], errors)
+
+            # the store gives the candidates of single, also for
+            # other extraction parameters
+            for parameters in ((2, 70, 5, 20), (1, 50, 3, 10)):
+                extractor = Extractor(*parameters, False, False)
+                expected, _ = extractor.single(paths)
+                candidates = extractor.extract_stored(store)
+                self.assertDictEqual(expected, candidates)
+
+                expected = Postings.from_dict(expected)
+                postings = Postings.from_dict(candidates)
+                self.assertListEqual(list(expected), list(postings))
+                self.assertListEqual(
+                    expected.tfs.tolist(), postings.tfs.tolist()
+                )
+
+            # a store is stale if the files or the settings changed
+            settings = {"root": tmpdir, "files": file_states(paths)}
+            store.settings = settings
+            store_path = os.path.join(tmpdir, "tagged.npz")
+            store.save(store_path)
+            loaded = TaggedStore.load(store_path, settings)
+            self.assertEqual(settings, loaded.settings)
+            self.assertEqual(len(store), len(loaded))
+
+            other = dict(settings, root=os.path.join(tmpdir, "other"))
+            self.assertIsNone(TaggedStore.load(store_path, other))
+            with open(paths[0], "a", encoding="utf-8") as ofile:
+                ofile.write(" Another sentence.")
+            settings = dict(settings, files=file_states(paths))
+            self.assertIsNone(TaggedStore.load(store_path, settings))
+
+    def test_streaming_window(self):
+        reference = {"w1": 3, "w2": 40, "w3": 1, "w4": 8, "w5": 2}
+
+        class Index:
+            def frequencies(self, vocabulary):
+                counts = [reference[candidate] for candidate in vocabulary]
+                return ArrayMapping(vocabulary, np.array(counts))
+
+        documents = [
+            {"w1": 2, "w2": 1},
+            {"w1": 1, "w3": 4},
+            {"w2": 5, "w4": 1, "w5": 1},
+            {"w3": 2, "w5": 3},
+            {"w1": 4, "w4": 2},
+        ]
+
+        stream = StreamingDiscriminator(Index(), 2, window_size=3)
+        for filedict in documents:
+            stream.add_document(filedict)
+        stream.calculate_dr_dc()
+        stream.generate_list(0.9, 0.5)
+
+        # the same window with the discriminator
+        final = dict()
+        for filedict in documents[-3:]:
+            for candidate, frequency in filedict.items():
+                final.setdefault(candidate, list()).append(frequency)
+        discriminator = Discriminator(
+            final, 2, reference_frequency=reference
+        )
+        discriminator.calculate_dr_dc()
+        discriminator.generate_list(0.9, 0.5, verbose=False)
+
+        self.assertEqual(3, len(stream))
+        for expected, results in (
+                (discriminator.final_candidates, stream.final_candidates),
+                (discriminator.rejected_candidates,
+                 stream.rejected_candidates)):
+            expected = dict(expected)
+            results = dict(results)
+            self.assertSetEqual(set(expected), set(results))
+            for candidate, f in expected.items():
+                self.assertAlmostEqual(f, results[candidate])
+
+        # a window saved after two documents and continued by another run
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "window.npz")
+            first = StreamingDiscriminator(Index(), 2, window_size=3)
+            for filedict in documents[:2]:
+                first.add_document(filedict)
+            first.save(path, {"window": 3}, [2, "b"])
+
+            other = StreamingDiscriminator(Index(), 2, window_size=3)
+            self.assertEqual((False, None), other.restore(path, {}))
+            self.assertEqual(0, len(other))
+
+            continued = StreamingDiscriminator(Index(), 2, window_size=3)
+            self.assertEqual(
+                (True, [2, "b"]), continued.restore(path, {"window": 3})
+            )
+            for filedict in documents[2:]:
+                continued.add_document(filedict)
+            continued.calculate_dr_dc()
+            continued.generate_list(0.9, 0.5)
+
+        self.assertEqual(3, len(continued))
+        self.assertEqual(stream.n_alive, continued.n_alive)
+        self.assertEqual(
+            dict(stream.final_candidates), dict(continued.final_candidates)
+        )
+
+    def test_pruned_scoring(self):
+        rng = np.random.default_rng(0)
+        candidates = {
+            f"w{i}": rng.integers(1, 6, size=rng.integers(1, 20)).tolist()
+            for i in range(300)
+        }
+        reference = {f"w{i}": int(rng.integers(0, 30)) for i in range(300)}
+
+        results = list()
+        for alpha, theta in ((0.99, 0.6), (0.9, 0.8), (0.5, 1.5)):
+            for prune in (False, True):
+                discriminator = Discriminator(
+                    candidates, 2, reference_frequency=reference
+                )
+                if prune:
+                    discriminator.calculate_dr_dc(alpha, theta)
+                else:
+                    discriminator.calculate_dr_dc()
+                discriminator.generate_list(alpha, theta, verbose=False)
+                results.append(discriminator)
+
+            exact, pruned = results[-2:]
+            self.assertSetEqual(
+                exact.final_candidates, pruned.final_candidates
+            )
+            n_candidates, n_pruned = pruned.pruning_rate()
+            self.assertEqual(len(exact.candidates), n_candidates)
+            self.assertEqual(
+                n_pruned,
+                len(exact.rejected_candidates)
+                - len(pruned.rejected_candidates)
+            )
+            self.assertGreater(n_pruned, 0)
+
+    def test_prefetcher(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = list()
+            for i in range(10):
+                path = os.path.join(tmpdir, f"d{i}.txt")
+                with open(path, "w", encoding="utf-8") as ofile:
+                    ofile.write(f"document {i}\nline")
+                paths.append(path)
+            paths.insert(5, os.path.join(tmpdir, "missing.txt"))
+
+            times = ReadTimes()
+            results = [
+                (unit, documents) for unit, documents
+                in Prefetcher(paths, load_documents, depth=3, times=times)
+            ]
+
+        self.assertListEqual(paths, [unit for unit, _ in results])
+        for unit, documents in results:
+            if unit.endswith("missing.txt"):
+                self.assertListEqual([(unit, None)], documents)
+            else:
+                i = os.path.basename(unit)[1]
+                self.assertListEqual(
+                    [(unit, [f"document {i}\n", "line"])], documents
+                )
+        self.assertGreater(times.read, 0)
+
+        # one unit of 10 bytes is loaded ahead, the rest is cancelled
+        loaded = list()
+        prefetcher = Prefetcher(
+            range(20), loaded.append, depth=3, max_bytes=15,
+            weight=lambda unit: 10
+        )
+        for i, (unit, _) in enumerate(prefetcher):
+            self.assertLessEqual(len(loaded), i + 2)
+            if i == 4:
+                break
+        self.assertLessEqual(len(loaded), 7)
+
+        # units without size are never loaded ahead, but streamed
+        loaded = list()
+        prefetcher = Prefetcher(
+            range(6), lambda unit: loaded.append(unit) or "loaded",
+            depth=3, weight=lambda unit: None if unit % 3 == 2 else 10,
+            stream=lambda unit: "streamed"
+        )
+        results = list(prefetcher)
+        self.assertListEqual(list(range(6)), [unit for unit, _ in results])
+        self.assertListEqual([0, 1, 3, 4], sorted(loaded))
+        self.assertListEqual(
+            ["streamed" if unit % 3 == 2 else "loaded" for unit in range(6)],
+            [result for _, result in results]
+        )
+        self.assertIsNone(unit_bytes(Path("corpus.tar.gz")))
+        self.assertIsNone(unit_bytes(Path("d.txt.xz")))
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=2, buffer=True)